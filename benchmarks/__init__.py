@@ -0,0 +1,2 @@
+# Throughput benchmarks of CodeGrimoire against synthetic repositories served by a local
+# stand-in for the GitHub REST API. Run with `python -m benchmarks --help`.
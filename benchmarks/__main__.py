@@ -0,0 +1,92 @@
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import platform
+import sys
+import tempfile
+from importlib import metadata
+
+from benchmarks.corpus import generate_corpus, parse_language_mix
+from benchmarks.mock_github import MockGitHubProcess
+from benchmarks.parsers import benchmark_parsers, expected_totals
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks",
+        description="Benchmark the line counters and the /analyze path against a synthetic corpus served by a "
+                    "local stand-in for the GitHub API, and the local backend against the same corpus as git "
+                    "repositories on disk. Prints a JSON report.",
+    )
+    parser.add_argument("--repos", type=int, default=8)
+    parser.add_argument("--files", type=int, default=200, help="files per repository")
+    parser.add_argument("--file-size", type=int, default=4096, help="average file size in bytes")
+    parser.add_argument("--languages", default="Python=4,JavaScript=3,TypeScript=2,Go=1,C++=1,HTML=1,CSS=1",
+                        help="language mix as comma-separated Language=weight pairs")
+    parser.add_argument("--comment-density", type=float, default=0.2, help="share of lines that are comments")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--forks", type=float, default=0.0, help="share of repositories that fork an earlier one")
+    parser.add_argument("--shared-code", choices=("once", "per_repo"), default="once",
+                        help="whether blobs in several repositories count once or in each")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every mock API response")
+    parser.add_argument("--fetch-modes", default="trees,contents,archive,graphql")
+    parser.add_argument("--local-modes", default="checkout,bare",
+                        help="kinds of repositories on disk to analyze with LocalCodeGrimoire, empty for none")
+    parser.add_argument("--max-repos", type=int, default=8)
+    parser.add_argument("--max-requests", type=int, default=32)
+    parser.add_argument("--parse-workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--parser-rounds", type=int, default=5)
+    parser.add_argument("--skip-end-to-end", action="store_true", help="only benchmark the parsers")
+    parser.add_argument("--output", help="write the report to this file instead of stdout")
+    return parser.parse_args(argv)
+
+
+def package_version():
+    try:
+        return metadata.version("code-grimoire")
+    except metadata.PackageNotFoundError:
+        return None
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    config = {key: value for key, value in vars(args).items() if key != "output"}
+    corpus = generate_corpus(args.repos, args.files, args.file_size, parse_language_mix(args.languages),
+                             args.comment_density, args.seed, args.forks)
+    expected = expected_totals(corpus, args.shared_code)
+    report = {
+        "version": package_version(),
+        "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "config": config,
+        "parsers": benchmark_parsers(corpus, args.parser_rounds),
+    }
+    if not args.skip_end_to_end:
+        with MockGitHubProcess(corpus, args.latency) as server, tempfile.TemporaryDirectory() as cache_dir:
+            os.environ.update(CODE_GRIMOIRE_GITHUB_API_URL=server.url, CODE_GRIMOIRE_CACHE_DIR=cache_dir,
+                              CODE_GRIMOIRE_PARSE_WORKERS=str(args.parse_workers), TOKEN="benchmark", EXTRA_TOKENS="")
+            from benchmarks.end_to_end import benchmark_end_to_end
+            from benchmarks.local import benchmark_local
+            report["end_to_end"] = asyncio.run(benchmark_end_to_end(
+                corpus, server, args.fetch_modes.split(","), expected, cache_dir,
+                args.max_repos, args.max_requests, args.parse_workers, args.shared_code,
+            ))
+            local_modes = [mode for mode in args.local_modes.split(",") if mode]
+            if local_modes:
+                # The same corpus as git repositories on disk, read without the API
+                report["local"] = benchmark_local(corpus, os.path.join(cache_dir, "repos"), cache_dir, local_modes,
+                                                  args.parse_workers, args.shared_code)
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as report_file:
+            report_file.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
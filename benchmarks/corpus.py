@@ -0,0 +1,150 @@
+import hashlib
+import io
+import random
+import tarfile
+from collections import namedtuple
+
+from src.scanner import SYNTAX
+
+CorpusFile = namedtuple("CorpusFile", ["path", "language", "content", "sha"])
+# parent is the full name of the repository a fork was made from, or None
+SyntheticRepo = namedtuple("SyntheticRepo", ["name", "full_name", "head_sha", "files", "parent"], defaults=(None,))
+
+OWNER = "benchmark"
+EXTENSIONS = {
+    "Python": "py", "JavaScript": "js", "TypeScript": "ts", "HTML": "html", "CSS": "css", "C": "c", "C++": "cpp",
+    "C#": "cs", "Java": "java", "Ruby": "rb", "Rust": "rs", "Go": "go", "Perl": "pl", "Shell": "sh", "PHP": "php",
+    "Swift": "swift", "R": "r", "SQL": "sql", "Lua": "lua",
+}
+# Files of no supported language, which every engine has to list and skip
+OTHER_FILES = ("README.md", "LICENSE", "docs/notes.txt")
+FORK_CHANGES = 0.1  # share of a fork's source files that differ from its parent
+# Opener, prefix of each line of text, and closer of the multi-line comments of each
+# language, written as the old parse_*_file methods needed them: Lua's closed by a line
+# ending in "--]]", and Python's docstrings opening and closing a line of their own.
+# Languages with /* */ comments not listed get doc comments.
+MULTILINE_COMMENTS = {
+    "Python": ('"""', "", '"""'),
+    "Lua": ("--[[", "  ", "--]]"),
+    "Ruby": ("=begin", "", "=end"),
+    "HTML": ("<!--", "  ", "-->"),
+}
+DOC_COMMENT = ("/**", " * ", " */")
+MULTILINE_COMMENT_LINES = (1, 4)  # lines of text of a multi-line comment, besides its opener and closer
+MARKER_STRINGS = 0.05  # share of code lines with a comment marker inside a string literal
+
+
+def blob_sha(content):
+    # The SHA git gives the blob, so blob cache hits behave as they do against GitHub
+    return hashlib.sha1(b"blob %d\0" % len(content) + content).hexdigest()
+
+
+def parse_language_mix(mix):
+    # "Python=3,JavaScript=1" -> {"Python": 3.0, "JavaScript": 1.0}
+    weights = {}
+    for item in mix.split(","):
+        language, _, weight = item.partition("=")
+        if language not in EXTENSIONS:
+            raise ValueError(f"Unknown language: {language}")
+        weights[language] = float(weight or 1)
+    return weights
+
+
+def source_file(rng, language, size, comment_density):
+    # About size bytes of code, comment and blank lines in the comment syntax of language,
+    # comment_density of the lines being comments. Half the comments take one line, the
+    # other half, where the language has them, several: doc comments, docstrings and the
+    # like. Some code lines hold a comment marker inside a string literal. Every form is
+    # one the old parsers counted right, so tests/test_scanner.py can hold the scanner to them.
+    syntax = SYNTAX[language]
+    multiline = MULTILINE_COMMENTS.get(language, DOC_COMMENT if "block" in syntax else None)
+    # Comments are started often enough for comment_density of the lines to be comments,
+    # given the lines a comment takes on average
+    comment_lines = (1 + 2 + sum(MULTILINE_COMMENT_LINES) / 2) / 2 if multiline else 1
+    comment_share = comment_density / (comment_lines - comment_density * (comment_lines - 1))
+    lines = []
+    length = 0
+    number = 0
+    while length < size:
+        number += 1
+        roll = rng.random()
+        if roll < 0.08:
+            entry = [""]
+        elif roll < 0.08 + comment_share:
+            if multiline and rng.random() < 0.5:
+                opener, prefix, closer = multiline
+                text = [f"{prefix}detail {number}.{index} of the value below"
+                        for index in range(rng.randint(*MULTILINE_COMMENT_LINES))]
+                entry = [opener, *text, closer]
+            elif "line" in syntax:
+                entry = [f"{syntax['line'][0]} note {number}: explains the value below"]
+            else:
+                opener, closer = syntax["block"][0]
+                entry = [f"{opener} note {number}: explains the value below {closer}"]
+            # Indented as in a function body, except where the comment has to start the line
+            if language != "Ruby" and rng.random() < 0.5:
+                entry = [f"    {line}" for line in entry]
+        elif language == "HTML":
+            entry = [f'<div class="item-{number}">value {number}</div>']
+        elif rng.random() < MARKER_STRINGS:
+            marker = syntax["block"][0][0] if "block" in syntax and language != "Ruby" else syntax["line"][0]
+            quote = syntax.get("strings", '"')[0]
+            entry = [f'pattern_{number} = match({number}, {quote}{marker} not a comment {number}{quote})']
+        else:
+            entry = [f'value_{number} = compute({number}, "text {number}")']
+        lines.extend(entry)
+        length += sum(len(line) + 1 for line in entry)
+    return ("\n".join(lines) + "\n").encode()
+
+
+def generate_corpus(repos, files_per_repo, file_size, language_mix, comment_density, seed=0, forks=0.0):
+    # Deterministic for a given seed. File sizes vary from half to one and a half times
+    # file_size; files are spread over a few levels of directories. A forks share of the
+    # repositories after the first are forks of an earlier one, with FORK_CHANGES of its
+    # source files rewritten.
+    rng = random.Random(seed)
+    languages = list(language_mix)
+    weights = [language_mix[language] for language in languages]
+    corpus = []
+    for repo_index in range(repos):
+        name = f"repo-{repo_index:03d}"
+        upstreams = [repo for repo in corpus if repo.parent is None]
+        # No draw without forks, so a seed gives the same corpus as before forks existed
+        if forks and upstreams and rng.random() < forks:
+            parent = rng.choice(upstreams)
+            files = []
+            for corpus_file in parent.files:
+                if corpus_file.language and rng.random() < FORK_CHANGES:
+                    content = source_file(rng, corpus_file.language, len(corpus_file.content), comment_density)
+                    corpus_file = corpus_file._replace(content=content, sha=blob_sha(content))
+                files.append(corpus_file)
+            corpus.append(SyntheticRepo(name, f"{OWNER}/{name}", repo_head(files), files, parent.full_name))
+            continue
+        files = []
+        for file_index in range(files_per_repo):
+            language = rng.choices(languages, weights)[0]
+            directory = "/".join(f"dir{rng.randrange(4)}" for _ in range(rng.randrange(3)))
+            path = f"{directory}/file{file_index}.{EXTENSIONS[language]}".lstrip("/")
+            content = source_file(rng, language, int(file_size * rng.uniform(0.5, 1.5)), comment_density)
+            files.append(CorpusFile(path, language, content, blob_sha(content)))
+        for path in OTHER_FILES:
+            content = f"{name}: {path}\n".encode()
+            files.append(CorpusFile(path, None, content, blob_sha(content)))
+        corpus.append(SyntheticRepo(name, f"{OWNER}/{name}", repo_head(files), files))
+    return corpus
+
+
+def repo_head(files):
+    return hashlib.sha1("".join(corpus_file.sha for corpus_file in files).encode()).hexdigest()
+
+
+def tarball(repo):
+    # The repository as GitHub's tarball endpoint serves it, under an owner-repo-sha/ prefix
+    buffer = io.BytesIO()
+    prefix = f"{OWNER}-{repo.name}-{repo.head_sha[:7]}"
+    with tarfile.open(fileobj=buffer, mode="w:gz") as archive:
+        for corpus_file in repo.files:
+            member = tarfile.TarInfo(f"{prefix}/{corpus_file.path}")
+            member.size = len(corpus_file.content)
+            archive.addfile(member, io.BytesIO(corpus_file.content))
+    return buffer.getvalue()
@@ -0,0 +1,73 @@
+import math
+import os
+import time
+
+from fastapi import Response
+
+# src.api reads its configuration when imported: import this module only once the
+# environment points at the mock server and a scratch cache directory
+import src.api as api
+from src.blob_cache import BlobCache
+from src.response_cache import SQLiteResponseCache
+from src.snapshots import SnapshotStore
+
+from benchmarks.parsers import throughput
+
+
+def percentile(values, p):
+    # Nearest-rank percentile
+    if not values:
+        return None
+    ordered = sorted(values)
+    return round(ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)], 6)
+
+
+async def run_job(fetch_mode, max_repos, max_requests, parse_workers, shared_code):
+    # Submits through the /analyze handler and follows the job's event stream, timing
+    # each repository from its Started to its Completed event. The stream is joined
+    # before the job task first runs, so no event is missed.
+    # no-cache: the warm run is to measure a rescan, not the result cache
+    job = await api.analyze_repos(Response(), fetch_mode=fetch_mode, max_repos=max_repos, max_requests=max_requests,
+                                  parse_workers=parse_workers, time_budget=api.ANALYSIS_TIME_BUDGET,
+                                  shared_code=shared_code, cache_control="no-cache")
+    started = {}
+    latencies = []
+    start = time.perf_counter()
+    async for event in api.get_job(job["job_id"]).events():
+        now = time.perf_counter()
+        if event["event"] == "repo" and event["status"] == "Started":
+            started[event["repo"]] = now
+        elif event["event"] == "repo" and event["repo"] in started:
+            latencies.append(now - started.pop(event["repo"]))
+    return api.get_job(job["job_id"]).state(), time.perf_counter() - start, latencies
+
+
+async def benchmark_end_to_end(corpus, server, fetch_modes, expected, cache_dir, max_repos, max_requests,
+                               parse_workers, shared_code):
+    # Each fetch mode starts from empty caches and runs twice: cold, then warm, when the
+    # snapshots, blob cache and conditional requests can all be used
+    files = sum(1 for repo in corpus for corpus_file in repo.files if corpus_file.language)
+    size = sum(len(corpus_file.content) for repo in corpus for corpus_file in repo.files if corpus_file.language)
+    results = {}
+    for fetch_mode in fetch_modes:
+        api.blob_cache = BlobCache(os.path.join(cache_dir, f"{fetch_mode}-blobs.sqlite3"))
+        api.snapshot_store = SnapshotStore(os.path.join(cache_dir, f"{fetch_mode}-snapshots.sqlite3"))
+        api.response_cache = SQLiteResponseCache(os.path.join(cache_dir, f"{fetch_mode}-responses.sqlite3"))
+        for run in ("cold", "warm"):
+            server.reset()
+            state, seconds, latencies = await run_job(fetch_mode, max_repos, max_requests, parse_workers, shared_code)
+            calls = server.stats()
+            total_lines = (state["result"] or {}).get("total_lines", {})
+            results[f"{fetch_mode}/{run}"] = {
+                "status": state["status"],
+                "repos": len(corpus),
+                **throughput(files, size, seconds),
+                "api_calls_per_repo": round(sum(calls["repo_calls"].values()) / len(corpus), 2),
+                "listing_calls": calls["listing_calls"],
+                "not_modified": calls["not_modified"],
+                "repo_latency_p50": percentile(latencies, 50),
+                "repo_latency_p99": percentile(latencies, 99),
+                "correct": {language: counts for language, counts in total_lines.items() if any(counts.values())}
+                == expected,
+            }
+    return results
@@ -0,0 +1,66 @@
+import os
+import subprocess
+import time
+
+from src.blob_cache import BlobCache
+from src.local_grimoire import LocalCodeGrimoire
+from src.parse_pool import create_parse_executor
+from src.snapshots import SnapshotStore
+
+from benchmarks.parsers import expected_totals, throughput
+
+
+def git(*args):
+    subprocess.run(["git", *args], check=True, capture_output=True)
+
+
+def write_repos(corpus, directory):
+    # Each repository of the corpus as a git checkout with its files committed, under
+    # directory/checkout, and as a bare clone of that, under directory/bare
+    for repo in corpus:
+        path = os.path.join(directory, "checkout", repo.name)
+        for corpus_file in repo.files:
+            file_path = os.path.join(path, corpus_file.path)
+            os.makedirs(os.path.dirname(file_path), exist_ok=True)
+            with open(file_path, "wb") as source:
+                source.write(corpus_file.content)
+        git("-C", path, "init", "-q")
+        git("-C", path, "add", "-A")
+        git("-C", path, "-c", "user.name=benchmark", "-c", "user.email=benchmark@localhost", "commit", "-q",
+            "-m", repo.name)
+        git("clone", "-q", "--bare", path, os.path.join(directory, "bare", f"{repo.name}.git"))
+
+
+def benchmark_local(corpus, directory, cache_dir, modes, parse_workers, shared_code):
+    # LocalCodeGrimoire over the corpus on disk, cold then warm for each kind of repository,
+    # sharing one parse pool as the API does. Checkout files are counted without a blob SHA,
+    # so under "once" they count in every repository that has them.
+    files = sum(1 for repo in corpus for corpus_file in repo.files if corpus_file.language)
+    size = sum(len(corpus_file.content) for repo in corpus for corpus_file in repo.files if corpus_file.language)
+    write_repos(corpus, directory)
+    executor = create_parse_executor(parse_workers)
+    results = {}
+    try:
+        for mode in modes:
+            expected = expected_totals(corpus, shared_code if mode == "bare" else "per_repo")
+            blob_cache = BlobCache(os.path.join(cache_dir, f"local-{mode}-blobs.sqlite3"))
+            snapshot_store = SnapshotStore(os.path.join(cache_dir, f"local-{mode}-snapshots.sqlite3"))
+            for run in ("cold", "warm"):
+                grimoire = LocalCodeGrimoire([os.path.join(directory, mode)], blob_cache=blob_cache,
+                                             snapshot_store=snapshot_store, parse_workers=parse_workers,
+                                             parse_executor=executor, shared_code=shared_code)
+                start = time.perf_counter()
+                result = grimoire.analyze_repos()
+                seconds = time.perf_counter() - start
+                total_lines = result["total_lines"]
+                results[f"{mode}/{run}"] = {
+                    "status": "completed" if set(grimoire.progress.values()) == {"Completed"} else "failed",
+                    "repos": grimoire.total_repos,
+                    **throughput(files, size, seconds),
+                    "correct": {language: counts for language, counts in total_lines.items() if any(counts.values())}
+                    == expected,
+                }
+            blob_cache.close()
+    finally:
+        executor.shutdown()
+    return results
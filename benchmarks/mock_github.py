@@ -0,0 +1,288 @@
+import base64
+import hashlib
+import json
+import multiprocessing
+import re
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Lock
+from urllib.parse import parse_qs, unquote, urlsplit
+
+import httpx
+
+from benchmarks.corpus import OWNER, tarball
+
+PUSHED_AT = "2024-01-01T00:00:00Z"
+BLOB_LOOKUP = re.compile(r'(\w+): object\(oid: "([0-9a-f]+)"\)')
+
+
+class MockGitHub(ThreadingHTTPServer):
+    # The endpoints of the GitHub REST API the engines call, answered from a synthetic
+    # corpus: the repository listing and details, branches, recursive trees, blobs,
+    # directory contents and tarballs, plus the GraphQL blob lookups of
+    # src/graphql_blobs.py. Responses carry
+    # ETags and a generous rate limit, and a matching If-None-Match is answered with 304.
+    # Every request is counted per repository, and latency adds a fixed delay to each
+    # one, standing in for the network. push() replaces a repository with a new version,
+    # which the compare endpoint diffs against any version served before.
+    daemon_threads = True
+
+    def __init__(self, corpus, latency=0.0, address=("127.0.0.1", 0)):
+        super().__init__(address, MockGitHubHandler)
+        self.repos = {repo.full_name: repo for repo in corpus}
+        self.blobs = {repo.full_name: {corpus_file.sha: corpus_file for corpus_file in repo.files} for repo in corpus}
+        self.versions = {(repo.full_name, repo.head_sha): repo for repo in corpus}
+        self.pushes = Counter()
+        self.latency = latency
+        self.tarballs = {}
+        self.lock = Lock()
+        self.calls = Counter()
+        self.not_modified = 0
+
+    def record(self, repo_name, not_modified):
+        with self.lock:
+            self.calls[repo_name] += 1
+            self.not_modified += not_modified
+
+    def stats(self):
+        with self.lock:
+            listing = self.calls.get("", 0)
+            per_repo = {name: count for name, count in self.calls.items() if name}
+            return {"listing_calls": listing, "repo_calls": per_repo, "not_modified": self.not_modified}
+
+    def reset(self):
+        with self.lock:
+            self.calls.clear()
+            self.not_modified = 0
+
+    def push(self, repo):
+        # repo, with the full name of one served, becomes its new head; blobs of earlier
+        # versions stay served, as GitHub keeps them
+        with self.lock:
+            self.repos[repo.full_name] = repo
+            self.blobs[repo.full_name].update((corpus_file.sha, corpus_file) for corpus_file in repo.files)
+            self.versions[(repo.full_name, repo.head_sha)] = repo
+            self.pushes[repo.full_name] += 1
+            self.tarballs.pop(repo.full_name, None)
+
+    def pushed_at(self, repo):
+        pushed_at = datetime.strptime(PUSHED_AT, "%Y-%m-%dT%H:%M:%SZ") + timedelta(hours=self.pushes[repo.full_name])
+        return pushed_at.strftime("%Y-%m-%dT%H:%M:%SZ")
+
+    def tarball(self, repo):
+        with self.lock:
+            if repo.full_name not in self.tarballs:
+                self.tarballs[repo.full_name] = tarball(repo)
+            return self.tarballs[repo.full_name]
+
+
+class MockGitHubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, as against api.github.com
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        query = {key: values[0] for key, values in parse_qs(url.query).items()}
+        parts = [unquote(part) for part in url.path.strip("/").split("/")]
+        if parts == ["_stats"]:
+            return self.send_json(self.server.stats(), conditional=False)
+        if parts == ["user", "repos"] or (len(parts) == 3 and parts[0] in ("orgs", "users") and parts[2] == "repos"):
+            return self.repo_listing(query)
+        if len(parts) < 3 or parts[0] != "repos" or f"{parts[1]}/{parts[2]}" not in self.server.repos:
+            return self.send_error(404)
+        repo = self.server.repos[f"{parts[1]}/{parts[2]}"]
+        if len(parts) == 3:
+            return self.send_json(self.details(repo, list(self.server.repos).index(repo.full_name) + 1), repo)
+        endpoint, rest = parts[3], parts[4:]
+        if endpoint == "branches":
+            return self.send_json({"name": rest[0], "commit": {"sha": repo.head_sha}}, repo)
+        if endpoint == "git" and rest[:1] == ["trees"]:
+            return self.send_json(self.tree(repo), repo)
+        if endpoint == "git" and rest[:1] == ["blobs"]:
+            return self.blob(repo, rest[1])
+        if endpoint == "contents":
+            return self.contents(repo, "/".join(rest))
+        if endpoint == "compare":
+            return self.compare(repo, *rest[0].split("...", 1))
+        if endpoint == "tarball":
+            return self.send_body(self.server.tarball(repo), "application/x-gzip", repo, conditional=False)
+        return self.send_error(404)
+
+    def do_POST(self):
+        if self.path == "/_reset":
+            self.server.reset()
+            return self.send_json({}, conditional=False)
+        if self.path == "/graphql":
+            return self.graphql(json.loads(self.rfile.read(int(self.headers["Content-Length"]))))
+        return self.send_error(404)
+
+    def graphql(self, request):
+        # Only answers aliased object(oid:) lookups of blobs in one repository
+        variables = request.get("variables", {})
+        repo = self.server.repos.get(f"{variables.get('owner')}/{variables.get('name')}")
+        if repo is None:
+            return self.send_json({"data": {"repository": None}, "errors": [{"type": "NOT_FOUND"}]}, conditional=False)
+        found = {}
+        for alias, sha in BLOB_LOOKUP.findall(request["query"]):
+            corpus_file = self.server.blobs[repo.full_name].get(sha)
+            if corpus_file is not None:
+                binary = b"\0" in corpus_file.content
+                found[alias] = {"text": None if binary else corpus_file.content.decode(errors="replace"),
+                                "byteSize": len(corpus_file.content), "isBinary": binary, "isTruncated": False}
+            else:
+                found[alias] = None
+        self.send_json({"data": {"repository": found}}, repo, conditional=False)
+
+    def listed(self, repo, index):
+        return {"id": index, "name": repo.name, "full_name": repo.full_name, "default_branch": "main",
+                "pushed_at": self.server.pushed_at(repo), "private": False, "fork": repo.parent is not None,
+                "owner": {"login": OWNER}, "size": sum(len(corpus_file.content) for corpus_file in repo.files) // 1024}
+
+    def details(self, repo, index):
+        # GET /repos/{owner}/{repo}: the listing's fields, and the parent of a fork
+        details = self.listed(repo, index)
+        if repo.parent is not None:
+            details["parent"] = {"name": repo.parent.split("/")[1], "full_name": repo.parent, "default_branch": "main",
+                                 "private": False, "owner": {"login": OWNER}}
+        return details
+
+    def repo_listing(self, query):
+        per_page = int(query.get("per_page", 30))
+        page = int(query.get("page", 1))
+        repos = list(self.server.repos.values())
+        listed = [
+            self.listed(repo, index)
+            for index, repo in enumerate(repos[(page - 1) * per_page:page * per_page], (page - 1) * per_page + 1)
+        ]
+        headers = {}
+        if page * per_page < len(repos):
+            base = f"http://{self.headers['Host']}/user/repos"
+            headers["Link"] = f'<{base}?per_page={per_page}&page={page + 1}>; rel="next"'
+        self.send_json(listed, headers=headers)
+
+    @staticmethod
+    def tree(repo):
+        entries = []
+        directories = set()
+        for corpus_file in repo.files:
+            parents = corpus_file.path.split("/")[:-1]
+            directories.update("/".join(parents[:depth]) for depth in range(1, len(parents) + 1))
+            entries.append({"path": corpus_file.path, "mode": "100644", "type": "blob", "sha": corpus_file.sha,
+                            "size": len(corpus_file.content)})
+        entries.extend({"path": path, "mode": "040000", "type": "tree", "sha": hashlib.sha1(path.encode()).hexdigest()}
+                       for path in sorted(directories))
+        return {"sha": repo.head_sha, "tree": entries, "truncated": False}
+
+    def compare(self, repo, base_sha, head_sha):
+        # The files changed from an earlier version to the head, as GitHub lists them: a
+        # file removed and another added with the same blob make a rename
+        base = self.server.versions.get((repo.full_name, base_sha))
+        if base is None or head_sha != repo.head_sha:
+            return self.send_error(404)
+        old = {corpus_file.path: corpus_file.sha for corpus_file in base.files}
+        new = {corpus_file.path: corpus_file.sha for corpus_file in repo.files}
+        removed = {path: sha for path, sha in old.items() if path not in new}
+        renamed_from = {sha: path for path, sha in removed.items()}
+        files = []
+        for path, sha in new.items():
+            if path not in old:
+                previous = renamed_from.pop(sha, None)
+                if previous is None:
+                    files.append({"filename": path, "status": "added", "sha": sha})
+                else:
+                    del removed[previous]
+                    files.append({"filename": path, "status": "renamed", "sha": sha, "previous_filename": previous})
+            elif old[path] != sha:
+                files.append({"filename": path, "status": "modified", "sha": sha})
+        files.extend({"filename": path, "status": "removed", "sha": sha} for path, sha in removed.items())
+        self.send_json({"status": "ahead", "ahead_by": 1, "files": files}, repo)
+
+    def blob(self, repo, sha):
+        corpus_file = self.server.blobs[repo.full_name].get(sha)
+        if corpus_file is None:
+            return self.send_error(404)
+        if "raw" in self.headers.get("Accept", ""):
+            return self.send_body(corpus_file.content, "application/vnd.github.raw", repo)
+        self.send_json({"sha": sha, "size": len(corpus_file.content), "encoding": "base64",
+                        "content": base64.b64encode(corpus_file.content).decode()}, repo)
+
+    def contents(self, repo, path):
+        prefix = f"{path}/" if path else ""
+        entries = {}
+        for corpus_file in repo.files:
+            if not corpus_file.path.startswith(prefix):
+                continue
+            child, _, below = corpus_file.path[len(prefix):].partition("/")
+            if below:
+                entries[child] = {"name": child, "path": prefix + child, "type": "dir",
+                                  "sha": hashlib.sha1((prefix + child).encode()).hexdigest()}
+            else:
+                entries[child] = {"name": child, "path": corpus_file.path, "type": "file", "sha": corpus_file.sha,
+                                  "size": len(corpus_file.content)}
+        if not entries:
+            return self.send_error(404)
+        self.send_json(list(entries.values()), repo)
+
+    def send_json(self, payload, repo=None, headers=None, conditional=True):
+        self.send_body(json.dumps(payload).encode(), "application/json", repo, headers, conditional)
+
+    def send_body(self, body, content_type, repo=None, headers=None, conditional=True):
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        etag = f'"{hashlib.sha1(body).hexdigest()}"'
+        not_modified = conditional and self.headers.get("If-None-Match") == etag
+        if not self.path.startswith("/_"):
+            self.server.record(repo.full_name if repo else "", not_modified)
+        self.send_response(304 if not_modified else 200)
+        self.send_header("ETag", etag)
+        self.send_header("X-RateLimit-Limit", "5000")
+        self.send_header("X-RateLimit-Remaining", "5000")
+        self.send_header("X-RateLimit-Reset", str(int(time.time()) + 3600))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        if not_modified:
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def serve(corpus, latency, connection):
+    server = MockGitHub(corpus, latency)
+    connection.send(server.server_address[1])
+    server.serve_forever()
+
+
+class MockGitHubProcess:
+    # Runs MockGitHub in a process of its own, so serving the corpus doesn't compete for
+    # the interpreter of the process being measured
+    def __init__(self, corpus, latency=0.0):
+        self.corpus = corpus
+        self.latency = latency
+        self.process = None
+        self.url = None
+
+    def __enter__(self):
+        context = multiprocessing.get_context("spawn")
+        receiver, sender = context.Pipe(duplex=False)
+        self.process = context.Process(target=serve, args=(self.corpus, self.latency, sender), daemon=True)
+        self.process.start()
+        self.url = f"http://127.0.0.1:{receiver.recv()}"
+        return self
+
+    def __exit__(self, *exc_info):
+        self.process.terminate()
+        self.process.join()
+
+    def stats(self):
+        return httpx.get(f"{self.url}/_stats").json()
+
+    def reset(self):
+        httpx.post(f"{self.url}/_reset").raise_for_status()
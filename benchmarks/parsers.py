@@ -0,0 +1,53 @@
+import time
+from collections import defaultdict
+
+from src.scanner import count_lines
+
+
+def throughput(files, size, seconds):
+    return {
+        "files": files,
+        "bytes": size,
+        "seconds": round(seconds, 6),
+        "files_per_sec": round(files / seconds, 1) if seconds else None,
+        "bytes_per_sec": round(size / seconds, 1) if seconds else None,
+    }
+
+
+def expected_totals(corpus, shared_code="once"):
+    # total_lines as a correct analysis of the whole corpus reports it. With "once", a
+    # blob in several repositories, such as a fork and its parent, is counted once.
+    totals = {}
+    counted = set()
+    for repo in corpus:
+        for corpus_file in repo.files:
+            if shared_code == "once":
+                if corpus_file.sha in counted:
+                    continue
+                counted.add(corpus_file.sha)
+            if corpus_file.language:
+                code_lines, comment_lines = count_lines(corpus_file.content, corpus_file.language)
+                counts = totals.setdefault(corpus_file.language, {"code": 0, "comments": 0})
+                counts["code"] += code_lines
+                counts["comments"] += comment_lines
+    return totals
+
+
+def benchmark_parsers(corpus, rounds):
+    # count_lines over every file of each language in the corpus, in this process. The
+    # best of the rounds is reported, being the least disturbed by the rest of the machine.
+    contents = defaultdict(list)
+    for repo in corpus:
+        for corpus_file in repo.files:
+            if corpus_file.language:
+                contents[corpus_file.language].append(corpus_file.content)
+    results = {}
+    for language, sources in sorted(contents.items()):
+        timings = []
+        for _ in range(rounds):
+            start = time.perf_counter()
+            for source in sources:
+                count_lines(source, language)
+            timings.append(time.perf_counter() - start)
+        results[language] = throughput(len(sources), sum(map(len, sources)), min(timings))
+    return results
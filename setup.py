@@ -3,16 +3,17 @@ from setuptools import setup, find_packages
 setup(
     name='code-grimoire',
     version='0.1',
-    packages=find_packages(),
+    packages=find_packages(exclude=["benchmarks", "benchmarks.*"]),
     include_package_data=True,
     install_requires=[
         'fastapi',
         'uvicorn',
-        'PyGithub'  # Add all your dependencies here
+        'httpx',
+        'requests'  # Add all your dependencies here
     ],
     entry_points={
         'console_scripts': [
-            'code-grimoire = src.api:run',  # Adjust with your module and function
+            'code-grimoire = src.cli:main',  # `code-grimoire analyze` for one headless analysis
         ],
     },
 )
@@ -1,10 +1,25 @@
+import hashlib
+import json
+import time
 import requests
-from fastapi import FastAPI, Depends, HTTPException
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, Depends, Header, HTTPException, Query, Request, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from starlette.responses import RedirectResponse
 import uvicorn
 from fastapi.middleware.cors import CORSMiddleware
-from src.code_grimoire import CodeGrimoire  # Import your class
+from src import metrics
+from src.async_grimoire import AsyncCodeGrimoire
+from src.blob_cache import BlobCache
+from src.file_stats import DIMENSIONS, FileStats, load_run, save_run
+from src.jobs import JobManager
+from src.parse_pool import create_parse_executor
+from src.response_cache import create_response_cache
+from src.results_store import ResultsStore
+from src.snapshots import SnapshotStore
+from src.constants import (ANALYSIS_TIME_BUDGET, DEFAULT_MAX_REPOS, DEFAULT_MAX_REQUESTS, DEFAULT_PARSE_WORKERS,
+                           FETCH_MODES, MAX_REPOS_LIMIT, MAX_REQUESTS_LIMIT, PARSE_POOL_SIZE, RESULTS_PAGE_SIZE,
+                           SHARED_CODE, SHARED_CODE_POLICIES)
 from dotenv import load_dotenv
 import os
 
@@ -12,7 +27,15 @@ load_dotenv()
 CLIENT_ID = os.getenv("GITHUB_CLIENT_ID")
 CLIENT_SECRET = os.getenv("GITHUB_CLIENT_SECRET")
 TOKEN = os.getenv("TOKEN")
+# Comma-separated tokens whose quota is added for reading public repositories
+EXTRA_TOKENS = [token for token in os.getenv("EXTRA_TOKENS", "").split(",") if token]
 app = FastAPI(title="CodeGrimoire")
+blob_cache = BlobCache()
+snapshot_store = SnapshotStore()
+jobs = JobManager()
+parse_executor = create_parse_executor()
+response_cache = create_response_cache()
+results_store = ResultsStore()
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -44,12 +67,161 @@ async def callback(code: str):
 
     # Returning access token to the frontend (or client)
     return {"access_token": access_token}
-@app.post("/analyze")
-async def analyze_repos():
+@app.post("/analyze", status_code=202)
+async def analyze_repos(
+    response: Response,
+    fetch_mode: str = "trees",
+    max_repos: int = Query(DEFAULT_MAX_REPOS, ge=1, le=MAX_REPOS_LIMIT),
+    max_requests: int = Query(DEFAULT_MAX_REQUESTS, ge=1, le=MAX_REQUESTS_LIMIT),
+    parse_workers: int = Query(DEFAULT_PARSE_WORKERS, ge=1, le=PARSE_POOL_SIZE),
+    time_budget: float = Query(ANALYSIS_TIME_BUDGET, ge=0),
+    profile: bool = False,
+    shared_code: str = SHARED_CODE,
+    cache_control: str = Header(None),
+):
+    if fetch_mode not in FETCH_MODES:
+        raise HTTPException(status_code=400, detail=f"fetch_mode must be one of {', '.join(FETCH_MODES)}")
+    if shared_code not in SHARED_CODE_POLICIES:
+        raise HTTPException(status_code=400, detail=f"shared_code must be one of {', '.join(SHARED_CODE_POLICIES)}")
     token: str = TOKEN
-    grimoire = CodeGrimoire(token)
-    grimoire.analyze_repos()
-    return grimoire.total_lines, grimoire.repos_languages
+    time_budget = time_budget or None  # 0 is no deadline, as None is
+    # Calls that only differ in concurrency limits share one analysis and its result.
+    # Cache-Control: no-cache asks for a fresh analysis instead of a cached result.
+    key = (hashlib.sha256(token.encode()).hexdigest()[:16], fetch_mode, time_budget, profile, shared_code)
+    reuse = "no-cache" not in (cache_control or "")
+
+    async def analyze(on_event):
+        started_at = time.time()
+        grimoire = AsyncCodeGrimoire(token, blob_cache=blob_cache, snapshot_store=snapshot_store, on_event=on_event,
+                                     max_repos=max_repos, max_requests=max_requests,
+                                     parse_workers=parse_workers, parse_executor=parse_executor,
+                                     extra_tokens=EXTRA_TOKENS, response_cache=response_cache,
+                                     time_budget=time_budget, shared_code=shared_code, file_stats=FileStats())
+        result = await grimoire.analyze_repos(fetch_mode=fetch_mode)
+        complete = not result.get("truncated_repos") and "Rate Limit Hit" not in grimoire.progress.values()
+        run_id = results_store.save_run(fetch_mode, started_at, complete, grimoire.repo_counts,
+                                        grimoire.repo_dependencies, grimoire.repo_share_counts)
+        save_run(grimoire.file_stats, run_id)
+        if profile:
+            # Where the time of this run went, by stage and by language
+            result = {**result, "profile": grimoire.profile.report()}
+        return {**result, "run_id": run_id}
+
+    job, shared = jobs.submit(analyze, key=key, reuse=reuse)
+    set_cache_headers(response, job)
+    if job.finished:
+        response.status_code = 200
+    return {"job_id": job.id, "status": job.status, "shared": shared}
+
+def set_cache_headers(response, job):
+    # A completed job's result may be reused until it leaves the result cache. Results
+    # depend on the token, so only the client may keep them, never a shared cache.
+    expires_in = int(jobs.expires_in(job)) if job.status == "completed" else 0
+    if expires_in > 0:
+        response.headers["Cache-Control"] = f"private, max-age={expires_in}"
+        response.headers["ETag"] = f'"{job.id}"'
+    else:
+        response.headers["Cache-Control"] = "no-store"
+
+def get_job(job_id: str):
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown job")
+    return job
+
+@app.get("/jobs/{job_id}")
+async def job_status(job_id: str, request: Request, response: Response):
+    job = get_job(job_id)
+    set_cache_headers(response, job)
+    # A finished job never changes, so its id is its ETag
+    if job.finished and request.headers.get("If-None-Match") == f'"{job.id}"':
+        return Response(status_code=304, headers=dict(response.headers))
+    return jsonable_encoder(job.state())
+
+@app.get("/jobs/{job_id}/events")
+async def job_events(job_id: str):
+    # Server-Sent Events: repo events carry the running total_lines, file events the counts of each file
+    job = get_job(job_id)
+
+    async def stream():
+        async for event in job.events():
+            yield f"event: {event['event']}\ndata: {json.dumps(jsonable_encoder(event))}\n\n"
+
+    return StreamingResponse(stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+@app.get("/cache/stats")
+async def cache_stats():
+    # Conditional requests answered with 304 (hits) and with a full response (misses) since startup
+    return response_cache.stats() if response_cache is not None else {}
+
+@app.get("/results/runs")
+async def list_runs(limit: int = Query(RESULTS_PAGE_SIZE, ge=1, le=100), before: int = None):
+    # Newest first; the next page starts before the last run_id of this one
+    return results_store.runs(limit=limit, before=before)
+
+@app.get("/results/runs/latest")
+async def latest_run():
+    # The last run that covered every repository
+    run_id = results_store.latest_run_id()
+    if run_id is None:
+        raise HTTPException(status_code=404, detail="No complete run yet")
+    return results_store.run(run_id)
+
+@app.get("/results/runs/{run_id}")
+async def get_run(run_id: int):
+    run = results_store.run(run_id)
+    if run is None:
+        raise HTTPException(status_code=404, detail="Unknown run")
+    return run
+
+@app.get("/results/runs/{run_id}/rollup")
+async def run_rollup(run_id: int, by: list[str] = Query(["language"]), depth: int = Query(1, ge=1),
+                     counted_only: bool = False):
+    # The files of a run summed by any of repo, owner, language, directory (its first depth
+    # levels) and size, e.g. ?by=repo&by=directory&depth=2
+    unknown = [dimension for dimension in by if dimension not in DIMENSIONS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"by must be among {', '.join(DIMENSIONS)}")
+    file_stats = load_run(run_id)
+    if file_stats is None:
+        raise HTTPException(status_code=404, detail="No file statistics kept for this run")
+    return {"run_id": run_id, "by": by, "groups": file_stats.rollup(by, depth, counted_only)}
+
+@app.get("/results/languages/{language}/repos")
+async def repos_using(language: str, run_id: int = None):
+    # Repositories with code in a language, in the given run or else the latest complete one
+    run_id = run_id if run_id is not None else results_store.latest_run_id()
+    return {"run_id": run_id, "repos": results_store.repos_using(language, run_id) if run_id is not None else []}
+
+@app.get("/results/dependencies/{dependency:path}/repos")
+async def repos_depending_on(dependency: str, run_id: int = None, language: str = None):
+    # Repositories importing a dependency, such as requests or @scope/name, with the files that do
+    run_id = run_id if run_id is not None else results_store.latest_run_id()
+    repos = results_store.repos_depending_on(dependency, run_id, language) if run_id is not None else []
+    return {"run_id": run_id, "repos": repos}
+
+@app.get("/results/repos/{owner}/{repo}/dependencies")
+async def repo_dependencies(owner: str, repo: str, run_id: int = None):
+    run_id = run_id if run_id is not None else results_store.latest_run_id()
+    dependencies = results_store.repo_dependencies(f"{owner}/{repo}", run_id) if run_id is not None else []
+    return {"run_id": run_id, "dependencies": dependencies}
+
+@app.get("/results/owners/{owner}/dependencies")
+async def owner_dependencies(owner: str, run_id: int = None):
+    # What the owner's repositories import, most widely used first
+    run_id = run_id if run_id is not None else results_store.latest_run_id()
+    dependencies = results_store.owner_dependencies(owner, run_id) if run_id is not None else []
+    return {"run_id": run_id, "dependencies": dependencies}
+
+@app.get("/results/owners/{owner}/history")
+async def owner_history(owner: str, limit: int = Query(RESULTS_PAGE_SIZE, ge=1, le=100)):
+    # Language totals of the owner's repositories in each of the last runs that included them
+    return results_store.owner_history(owner, limit=limit)
+
+@app.get("/metrics")
+async def metrics_endpoint():
+    # Stage latencies, parse throughput and API request counts of this process, for Prometheus
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
 
 def run():
     uvicorn.run("src.api:app", host="localhost", port=8000, reload=True)
\ No newline at end of file
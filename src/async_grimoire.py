@@ -0,0 +1,549 @@
+import asyncio
+import base64
+import contextlib
+import datetime
+import logging
+import tarfile
+import tempfile
+from collections import deque, namedtuple
+from functools import partial
+
+import httpx
+
+from src import metrics
+from src.code_grimoire import CodeGrimoire, RepoQueue
+from src.constants import (ANALYSIS_TIME_BUDGET, ARCHIVE_SPOOL_SIZE, COMPARE_FILES_LIMIT, DEFAULT_MAX_REPOS,
+                           DEFAULT_MAX_REQUESTS, DEFAULT_PARSE_WORKERS, FETCH_INHERITED_BLOBS, FETCH_MODES,
+                           SHARED_CODE, STREAM_FILE_SIZE)
+from src.github_client import AsyncGitHubClient, GraphQLError
+from src.graphql_blobs import blob_query, query_variables, read_blobs, take_batch
+from src.parse_pool import ParseStage, count_paths, create_parse_executor
+from src.rate_budget import RateLimitException
+
+# The fields of a repository listing the analysis needs, in place of PyGithub's Repository
+RepoInfo = namedtuple("RepoInfo", ["name", "full_name", "default_branch", "pushed_at", "private", "size", "fork"],
+                      defaults=(False,))
+
+
+async def gather_all(*awaitables):
+    # asyncio.gather, except that the first exception cancels the other awaitables and is
+    # raised once they have all stopped, so that none carries on after its caller gave up
+    tasks = [asyncio.ensure_future(awaitable) for awaitable in awaitables]
+    try:
+        return await asyncio.gather(*tasks)
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+class AsyncCodeGrimoire(CodeGrimoire):
+    # CodeGrimoire over the GitHub API, driven by the event loop, so /analyze can await a
+    # scan without blocking other requests. Every repository is a task, and at most
+    # max_repos of them run at once. The tasks share one AsyncGitHubClient, which caps
+    # requests in flight at max_requests. Fetched files are counted by a ParseStage on a process pool, with at
+    # most parse_workers batches in flight; pass parse_executor to share one pool between
+    # analyses. Public repositories are also read with extra_tokens, which adds their
+    # quota to the analysis, and a response_cache turns repeat API calls into conditional
+    # requests. Blob caching and snapshots come with CodeGrimoire.
+    # Repositories start as soon as their listing page arrives, the largest of those
+    # waiting first. The files of a repository are shared by up to max_requests workers,
+    # so a large one is downloaded as fast as the request limit allows instead of by a
+    # single worker.
+    # The repositories analyzed are the user's own and collaborator ones, or with orgs,
+    # users or repo_names ("owner/name") given, all repositories of those organizations and
+    # users and the named ones.
+    def __init__(self, auth, blob_cache=None, snapshot_store=None, on_event=None,
+                 max_repos=DEFAULT_MAX_REPOS, max_requests=DEFAULT_MAX_REQUESTS,
+                 parse_workers=DEFAULT_PARSE_WORKERS, parse_executor=None, extra_tokens=(), response_cache=None,
+                 time_budget=ANALYSIS_TIME_BUDGET, orgs=(), users=(), repo_names=(), shared_code=SHARED_CODE,
+                 file_stats=None, fetch_inherited=FETCH_INHERITED_BLOBS):
+        super().__init__(blob_cache=blob_cache, snapshot_store=snapshot_store, on_event=on_event,
+                         time_budget=time_budget, shared_code=shared_code, file_stats=file_stats)
+        self.tokens = [auth, *extra_tokens]
+        self.orgs = orgs
+        self.users = users
+        self.repo_names = repo_names
+        self.response_cache = response_cache
+        self.max_repos = max_repos
+        self.max_requests = max_requests
+        self.parse_workers = parse_workers
+        self.parse_executor = parse_executor
+        self.client = None
+        self.parse_stage = None
+        self.repo_slots = None
+        self.blob_flights = {}  # task of the download of each blob not yet counted, by (sha, language)
+        self.fetch_inherited = fetch_inherited  # see FETCH_INHERITED_BLOBS
+
+    async def analyze_repos(self, fetch_mode="trees", repos=None):
+        # repos, a list of RepoInfo, replaces the listing when given
+        if fetch_mode not in FETCH_MODES:
+            raise ValueError(f"Unknown fetch mode: {fetch_mode}")
+        self.start_deadline()
+        executor = self.parse_executor or create_parse_executor(self.parse_workers)
+        try:
+            return await self.run_analysis(fetch_mode, executor, repos)
+        finally:
+            if executor is not self.parse_executor:
+                executor.shutdown(wait=False, cancel_futures=True)
+
+    async def list_repos(self):
+        # The repositories an analysis would cover, without analyzing them
+        async with self.open_client() as self.client:
+            return await self.fetch_relevant_repos()
+
+    def open_client(self):
+        return AsyncGitHubClient(self.tokens, max_requests=self.max_requests, response_cache=self.response_cache,
+                                 profile=self.profile)
+
+    async def run_analysis(self, fetch_mode, executor, repos=None):
+        async with self.open_client() as self.client, \
+                ParseStage(executor, self.parse_workers, profile=self.profile) as self.parse_stage:
+            self.emit("started", repos=len(repos) if repos is not None else None)
+            self.repo_slots = asyncio.Semaphore(self.max_repos)
+            pending = RepoQueue()
+            tasks = []
+            stopped = asyncio.Event()  # set by the first repository to hit the rate limit
+
+            def finished(task):
+                if not task.cancelled() and task.exception() is None:
+                    self.log_progress(self.total_repos)
+                    if task.result() == "Rate Limit Hit":
+                        stopped.set()
+
+            try:
+                # A task is created for each repository as its listing page arrives, so the
+                # first ones start while the rest are still being listed
+                try:
+                    async with contextlib.aclosing(self.iter_relevant_repos(repos)) as listing:
+                        async for repo in listing:
+                            pending.push(repo)
+                            tasks.append(asyncio.create_task(self.process_next(pending, fetch_mode)))
+                            tasks[-1].add_done_callback(finished)
+                            if stopped.is_set():
+                                break
+                except RateLimitException as e:
+                    logging.warning(f"Rate limit hit while listing repositories: {e}")
+                    stopped.set()
+                self.total_repos = len(tasks)
+                self.emit("listed", repos=self.total_repos)
+                if tasks and not stopped.is_set():
+                    stopping = asyncio.create_task(stopped.wait())
+                    await asyncio.wait([asyncio.gather(*tasks, return_exceptions=True), stopping],
+                                       return_when=asyncio.FIRST_COMPLETED)
+                    stopping.cancel()
+            finally:
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+
+        if stopped.is_set():
+            logging.info("Analysis ended early due to rate limit.")
+            return self.prepare_partial_results()
+        else:
+            logging.info("Analysis completed for all repositories.")
+            return self.prepare_complete_results()
+
+    async def fetch_relevant_repos(self):
+        # The whole listing, largest first
+        repos = [repo async for repo in self.iter_relevant_repos()]
+        return sorted(repos, key=lambda repo: repo.size, reverse=True)
+
+    async def iter_relevant_repos(self, repos=None):
+        # The given repositories, or else the listing as its pages arrive. Several listings
+        # are read at once; a repository in more than one comes out once, by id.
+        if repos is not None:
+            for repo in repos:
+                yield repo
+            return
+        if self.orgs or self.users or self.repo_names:
+            listings = [(f"/orgs/{org}/repos", {"type": "all"}) for org in self.orgs]
+            listings += [(f"/users/{user}/repos", {"type": "owner"}) for user in self.users]
+            listings += [(f"/repos/{name}", None) for name in self.repo_names]
+        else:
+            listings = [("/user/repos", {"affiliation": "owner,collaborator"})]
+        pages = asyncio.Queue()
+
+        async def read_listing(url, params):
+            # Puts each page, then None at the end or the exception that stopped it. A single
+            # repository, with no params, is a page of one, and left out if it doesn't exist.
+            try:
+                if params is None:
+                    try:
+                        await pages.put([await self.client.get_json(url, shared=False, stage="repo_listing")])
+                    except httpx.HTTPStatusError as e:
+                        logging.warning(f"Skipping {url.removeprefix('/repos/')}: {e.response.status_code}")
+                else:
+                    async for page in self.client.iter_pages(url, shared=False, stage="repo_listing", **params):
+                        await pages.put(page)
+            except Exception as e:
+                await pages.put(e)
+            else:
+                await pages.put(None)
+
+        readers = [asyncio.create_task(read_listing(url, params)) for url, params in listings]
+        seen = set()
+        try:
+            remaining = len(readers)
+            while remaining:
+                page = await pages.get()
+                if page is None:
+                    remaining -= 1
+                    continue
+                if isinstance(page, Exception):
+                    raise page
+                for repo in page:
+                    if repo["id"] in seen:
+                        continue
+                    seen.add(repo["id"])
+                    pushed_at = repo.get("pushed_at")
+                    yield RepoInfo(
+                        repo["name"], repo["full_name"], repo["default_branch"],
+                        # Parsed as PyGithub does, so snapshots match whichever engine wrote them
+                        datetime.datetime.fromisoformat(pushed_at.replace("Z", "+00:00")) if pushed_at else None,
+                        repo["private"],
+                        repo.get("size", 0),  # in KB
+                        repo.get("fork", False),
+                    )
+        finally:
+            for reader in readers:
+                reader.cancel()
+            await asyncio.gather(*readers, return_exceptions=True)
+
+    async def process_next(self, pending, fetch_mode):
+        # Takes the largest repository waiting once one of the max_repos slots is free
+        async with self.repo_slots:
+            return await self.process_repository(pending.pop(), fetch_mode)
+
+    async def process_repository(self, repo, fetch_mode="trees"):
+        if self.timed_out():
+            self.skip_repository(repo)
+            return self.progress[repo.full_name]
+        try:
+            self.update_progress(repo.full_name, "Started")
+            self.begin_repository(repo)
+            status = "Completed"
+            try:
+                if self.shared_code == "once" and repo.fork:
+                    await self.process_fork(repo, fetch_mode)
+                elif self.snapshot_store is not None:
+                    await self.process_incremental(repo, fetch_mode)
+                else:
+                    await self.scan_repository(repo, fetch_mode)
+            except RateLimitException:
+                raise
+            except Exception as e:
+                self.mark_failed(repo, e)
+                status = "Failed"
+            finally:
+                self.finish_repository(repo)
+            self.update_progress(repo.full_name, status)
+        except RateLimitException as e:
+            logging.warning(f"Rate limit hit while processing {repo.name}: {e}")
+            self.update_progress(repo.full_name, "Rate Limit Hit")
+        return self.progress[repo.full_name]
+
+    async def scan_repository(self, repo, fetch_mode, ref=None):
+        if fetch_mode == "archive":
+            await self.process_archive(repo, ref)
+        elif fetch_mode == "trees":
+            await self.process_tree(repo, ref)
+        elif fetch_mode == "graphql":
+            await self.process_tree(repo, ref, batched=True)
+        else:
+            await self.process_contents(repo, ref)
+
+    async def process_fork(self, repo, fetch_mode):
+        # Under "once", the files a fork shares with its parent's default branch are left
+        # out of the totals, at the cost of two calls for the fork's details, which name
+        # the parent, and the parent's tree. They still count for the fork itself, and
+        # their blobs are fetched once for both when the parent is analyzed too; without
+        # fetch_inherited they are not fetched for the fork at all, except in "archive"
+        # mode, whose tarball holds them anyway. A fork is not snapshotted, since what it
+        # leaves out follows the parent.
+        try:
+            details = await self.client.get_json(f"/repos/{repo.full_name}", shared=not repo.private)
+            parent = details["parent"]
+            tree = await self.client.get_json(f"/repos/{parent['full_name']}/git/trees/{parent['default_branch']}",
+                                              shared=not parent["private"], stage="directory_listing", recursive=1)
+            self.parent_blobs[repo.full_name] = {element["sha"] for element in tree["tree"] if element["type"] == "blob"}
+        except (httpx.HTTPStatusError, KeyError) as e:
+            logging.debug(f"Parent of {repo.name} unavailable, scanning it in full: {e}")
+        await self.scan_repository(repo, fetch_mode)
+
+    async def process_incremental(self, repo, fetch_mode):
+        snapshot = self.snapshot_store.get(repo.full_name)
+        pushed_at = repo.pushed_at.isoformat() if repo.pushed_at else None
+        if snapshot and snapshot.pushed_at == pushed_at:
+            self.record_snapshot(repo)
+            return
+        branch = await self.client.get_json(f"/repos/{repo.full_name}/branches/{repo.default_branch}", shared=not repo.private)
+        head_sha = branch["commit"]["sha"]
+        if snapshot and snapshot.head_sha == head_sha:
+            self.snapshot_store.touch(repo.full_name, pushed_at)
+            self.record_snapshot(repo)
+            return
+        if snapshot and await self.apply_compare(repo, snapshot.head_sha, head_sha, pushed_at):
+            self.record_snapshot(repo)
+            return
+
+        self.repo_files[repo.full_name] = {}
+        await self.scan_repository(repo, fetch_mode, ref=head_sha)
+        self.save_snapshot(repo, head_sha, pushed_at)
+
+    async def apply_compare(self, repo, base_sha, head_sha, pushed_at):
+        comparison = await self.client.get_json(f"/repos/{repo.full_name}/compare/{base_sha}...{head_sha}", shared=not repo.private)
+        files = comparison.get("files", [])
+        if comparison["status"] != "ahead" or len(files) >= COMPARE_FILES_LIMIT:
+            return False
+        removed_paths = []
+        present = []
+        for changed_file in files:
+            if changed_file["status"] == "renamed" and changed_file.get("previous_filename"):
+                removed_paths.append(changed_file["previous_filename"])
+            if changed_file["status"] == "removed":
+                removed_paths.append(changed_file["filename"])
+            else:
+                present.append(changed_file)
+        # Compare results carry no sizes; the head's tree gives them to the prefilter, when
+        # it has a size limit to apply
+        sizes = await self.blob_sizes(repo, head_sha) if present and self.prefilter.max_size is not None else {}
+        changed = []
+        for changed_file in present:
+            path = changed_file["filename"]
+            if self.wanted(path, sizes.get(path)):
+                changed.append((path, path.rsplit('/', 1)[-1], self.language_of(path), changed_file["sha"]))
+        counts = await gather_all(*(
+            self.count_blob(sha, name, lambda sha=sha: self.fetch_blob(repo, sha)) for _, name, _, sha in changed
+        ))
+        changed_files = {
+            path: (language, *file_counts, sha) for (path, _, language, sha), file_counts in zip(changed, counts)
+        }
+        self.snapshot_store.apply_delta(repo.full_name, head_sha, pushed_at, removed_paths, changed_files)
+        logging.debug(f"Applied {len(files)} changed files to the snapshot of {repo.name}")
+        return True
+
+    async def blob_sizes(self, repo, ref):
+        # Size of every blob of a tree, by path; a truncated listing leaves some out
+        tree = await self.client.get_json(f"/repos/{repo.full_name}/git/trees/{ref}", shared=not repo.private,
+                                          stage="directory_listing", recursive=1)
+        return {element["path"]: element.get("size") for element in tree["tree"] if element["type"] == "blob"}
+
+    async def process_tree(self, repo, ref=None, batched=False):
+        tree = await self.client.get_json(f"/repos/{repo.full_name}/git/trees/{ref or repo.default_branch}",
+                                          shared=not repo.private, stage="directory_listing", recursive=1)
+        if tree.get("truncated"):
+            # GitHub caps recursive listings; only the directory walk sees everything
+            logging.debug(f"Tree listing truncated for {repo.name}, falling back to contents walk")
+            await self.process_contents(repo, ref, batched)
+            return
+        files = [
+            (element["path"], element["sha"], element.get("size")) for element in tree["tree"]
+            if element["type"] == "blob" and self.wanted(element["path"], element.get("size"))
+        ]
+        await (self.process_batched(repo, files) if batched else self.process_files(repo, files))
+
+    async def process_contents(self, repo, ref=None, batched=False):
+        # Lists the tree one level at a time, with every directory of a level listed concurrently
+        files = []
+        directories = [""]
+        while directories and not self.timed_out():
+            listings = await asyncio.gather(*(self.list_directory(repo, path, ref) for path in directories))
+            directories = []
+            for entry in (entry for listing in listings for entry in listing):
+                if entry["type"] == "dir":
+                    directories.append(entry["path"])
+                elif entry["type"] == "file" and self.wanted(entry["path"], entry.get("size")):
+                    files.append((entry["path"], entry["sha"], entry.get("size")))
+        if directories:
+            # The deadline passed mid-listing; what was listed couldn't be downloaded either
+            self.mark_truncated(repo)
+            return
+        await (self.process_batched(repo, files) if batched else self.process_files(repo, files))
+
+    async def process_files(self, repo, files):
+        # files holds (path, blob sha, size) triples. A fixed set of workers shares one iterator, so
+        # the deadline is checked just before each download rather than when it was queued.
+        # Workers move on to the next download as soon as a file is queued for counting;
+        # recording waits on the parse stage in a task of its own. A blob already being
+        # downloaded for another file, in this repository or one scanned alongside such as
+        # a fork, is waited for rather than downloaded again.
+        pending = iter(files)
+        recording = []
+        taken = 0
+
+        async def worker():
+            nonlocal taken
+            for path, sha, size in pending:
+                if self.timed_out():
+                    return
+                taken += 1
+                language = self.language_of(path)
+                cached = self.cached_counts(sha, language) if language else (0, 0, (), size)
+                if cached is None:
+                    cached = self.unfetched_counts(repo, sha, size)
+                if cached is not None:
+                    self.record_file(repo, path, *cached, sha)
+                    continue
+                flight = self.blob_flights.get((sha, language))
+                if flight is None:
+                    flight = self.blob_flights[(sha, language)] = asyncio.ensure_future(
+                        self.queue_blob(repo, sha, language, size)
+                    )
+                    flight.add_done_callback(partial(self.land_flight, (sha, language)))
+                # Shielded: a worker cancelled mid-wait leaves the download to the other
+                # files of the blob
+                counted = await asyncio.shield(flight)
+                recording.append(asyncio.create_task(self.record_counted(repo, path, sha, language, counted)))
+
+        try:
+            await gather_all(*(worker() for _ in range(min(self.max_requests, len(files)))))
+        finally:
+            await gather_all(*recording)
+        if taken < len(files):
+            self.mark_truncated(repo, len(files) - taken)
+
+    async def queue_blob(self, repo, sha, language, size):
+        # Downloads a blob and hands it to the parse stage; gives the future of its counts
+        if size is not None and size > STREAM_FILE_SIZE:
+            return asyncio.ensure_future(self.stream_blob(repo, sha, language))
+        return await self.parse_stage.count(await self.fetch_blob(repo, sha), language)
+
+    def unfetched_counts(self, repo, sha, size):
+        # Counts of a fork's file whose blob is left undownloaded as its parent's, or None
+        if self.fetch_inherited or sha not in self.parent_blobs.get(repo.full_name, ()):
+            return None
+        return 0, 0, (), size or 0
+
+    def land_flight(self, key, flight):
+        # A download that failed is forgotten, so that a later file of the blob tries again
+        if flight.cancelled() or flight.exception() is not None:
+            self.blob_flights.pop(key, None)
+
+    async def process_batched(self, repo, files):
+        # "graphql" mode. Blobs that are not cached come a batch per query. Up to
+        # max_requests workers take batches off one queue, and each batch is formed when
+        # it is taken, so it follows the byte target as it adapts. Files streamed to disk
+        # take the process_files path alongside.
+        large = [(path, sha, size) for path, sha, size in files if size is not None and size > STREAM_FILE_SIZE]
+        pending = deque()
+        for path, sha, size in files:
+            if size is not None and size > STREAM_FILE_SIZE:
+                continue
+            language = self.language_of(path)
+            cached = self.cached_counts(sha, language)
+            if cached is None:
+                cached = self.unfetched_counts(repo, sha, size)
+            if cached is not None:
+                self.record_file(repo, path, *cached, sha)
+            else:
+                pending.append((path, sha, size, language))
+        recording = []
+
+        async def worker():
+            while pending and not self.timed_out():
+                batch = take_batch(pending, self.graphql_batch_bytes)
+                for (path, sha, _, language), (content, counts) in zip(batch, await self.fetch_blob_batch(repo, batch)):
+                    if content is not None:
+                        counted = await self.parse_stage.count(content, language)
+                        recording.append(asyncio.create_task(self.record_counted(repo, path, sha, language, counted)))
+                    elif counts is not None:
+                        self.record_file(repo, path, *self.store_counts(sha, language, counts), sha)
+
+        try:
+            await gather_all(self.process_files(repo, large),
+                             *(worker() for _ in range(min(self.max_requests, len(pending)))))
+        finally:
+            await gather_all(*recording)
+        if pending:
+            self.mark_truncated(repo, len(pending))
+
+    async def fetch_blob_batch(self, repo, batch):
+        # (content, None) to count, (None, counts) of a binary blob, or (None, None) for a
+        # blob over the size limit, for each file of the batch. A query GitHub gives up on
+        # is split in two; a blob it leaves out is fetched over REST.
+        try:
+            data = await self.client.graphql(blob_query([sha for _, sha, _, _ in batch]), query_variables(repo),
+                                             shared=not repo.private, stage="blob_fetch")
+        except (httpx.HTTPStatusError, httpx.TimeoutException, GraphQLError) as e:
+            if len(batch) == 1:
+                logging.debug(f"GraphQL failed for a blob of {repo.name}, fetching it over REST: {e}")
+                return [(await self.fetch_blob(repo, batch[0][1]), None)]
+            self.shrink_graphql_batches()
+            half = len(batch) // 2
+            return [*await self.fetch_blob_batch(repo, batch[:half]), *await self.fetch_blob_batch(repo, batch[half:])]
+        self.grow_graphql_batches()
+        results = []
+        for (path, sha, _, _), (kind, content, size) in zip(batch, read_blobs(data, len(batch))):
+            if kind == "missing":
+                results.append((await self.fetch_blob(repo, sha), None))
+            else:
+                results.append(self.blob_result(path, kind, content, size))
+        return results
+
+    async def record_counted(self, repo, path, sha, language, counted):
+        self.record_file(repo, path, *self.store_counts(sha, language, await counted), sha)
+
+    async def count_blob(self, sha, file_name, fetch_content):
+        language = self.language_of(file_name)
+        if not language:
+            return 0, 0, (), 0
+        cached = self.cached_counts(sha, language)
+        if cached is not None:
+            return cached
+        counted = await self.parse_stage.count(await fetch_content(), language)
+        return self.store_counts(sha, language, await counted)
+
+    async def list_directory(self, repo, path, ref=None):
+        return await self.client.get_json(f"/repos/{repo.full_name}/contents/{path}", shared=not repo.private,
+                                          stage="directory_listing", ref=ref)
+
+    async def fetch_blob(self, repo, sha):
+        blob = await self.client.get_json(f"/repos/{repo.full_name}/git/blobs/{sha}", shared=not repo.private,
+                                          cache=False, stage="blob_fetch")
+        with self.timed("decode"):
+            return base64.b64decode(blob["content"])
+
+    async def stream_blob(self, repo, sha, language):
+        # Blobs over STREAM_FILE_SIZE are downloaded raw to disk instead of as base64 JSON
+        # into memory, and a worker process counts the file as a stream
+        with tempfile.NamedTemporaryFile() as blob_file:
+            await self.client.download(f"/repos/{repo.full_name}/git/blobs/{sha}", blob_file,
+                                       shared=not repo.private, raw=True, stage="blob_fetch")
+            blob_file.flush()
+            counts, timings = await asyncio.get_running_loop().run_in_executor(
+                self.parse_stage.executor, count_paths, [(blob_file.name, language)]
+            )
+        metrics.observe_parse(timings, self.profile)
+        return counts[0]
+
+    async def process_archive(self, repo, ref=None):
+        # The tarball is spooled while it downloads and decompressed in a worker thread, so
+        # neither holds up the event loop; its files are counted by the parse stage
+        try:
+            with tempfile.SpooledTemporaryFile(max_size=ARCHIVE_SPOOL_SIZE) as archive_file:
+                await self.client.download(f"/repos/{repo.full_name}/tarball/{ref or repo.default_branch}",
+                                           archive_file, shared=not repo.private, stage="archive_fetch")
+                archive_file.seek(0)
+                queued = await asyncio.to_thread(
+                    self.queue_archive, archive_file, repo, asyncio.get_running_loop()
+                )
+        except (httpx.HTTPError, tarfile.TarError) as e:
+            # Empty repositories have no archive; walk the tree instead
+            logging.debug(f"Archive unavailable for {repo.name}, falling back to tree walk: {e}")
+            await self.process_tree(repo, ref)
+            return
+        for path, language, sha, counted in queued:
+            if asyncio.isfuture(counted):
+                counted = self.store_counts(sha, language, await counted)
+            self.record_file(repo, path, *counted, sha)
+
+    def queue_archive(self, fileobj, repo, loop):
+        # Runs in a worker thread, waiting on the parse queue like any other fetcher. Gives
+        # (path, language, blob sha, future of the counts), or the counts themselves for
+        # members counted before or as they were read.
+        return [
+            (path, language, sha,
+             counts or asyncio.run_coroutine_threadsafe(self.parse_stage.count(content, language), loop).result())
+            for path, language, sha, content, counts in self.archive_files(fileobj, repo)
+        ]
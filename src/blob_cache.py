@@ -0,0 +1,74 @@
+import logging
+import os
+import sqlite3
+import time
+from threading import Lock
+
+from src.constants import BLOB_CACHE_MAX_ENTRIES, BLOB_CACHE_PATH
+
+
+class BlobCache:
+    # Per-file parse results keyed by git blob SHA. A blob SHA is a hash of the file
+    # content, so a hit means the file is byte-for-byte unchanged and needs neither a
+    # download nor a parse. The language is part of the key because the same content
+    # is counted as a different language depending on the file extension. The dependencies
+    # a blob imports are kept newline-separated, next to its size.
+    def __init__(self, path=BLOB_CACHE_PATH, max_entries=BLOB_CACHE_MAX_ENTRIES):
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.max_entries = max_entries
+        self.lock = Lock()
+        self.writes_since_eviction = 0
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        with self.lock, self.connection:
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute("PRAGMA synchronous=NORMAL")
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS blobs ("
+                "sha TEXT NOT NULL, language TEXT NOT NULL, code INTEGER NOT NULL, "
+                "comments INTEGER NOT NULL, dependencies TEXT NOT NULL, bytes INTEGER NOT NULL, last_used REAL NOT NULL, "
+                "PRIMARY KEY (sha, language))"
+            )
+            self.connection.execute("CREATE INDEX IF NOT EXISTS blobs_last_used ON blobs (last_used)")
+
+    def get(self, sha, language):
+        with self.lock, self.connection:
+            row = self.connection.execute(
+                "SELECT code, comments, dependencies, bytes FROM blobs WHERE sha = ? AND language = ?", (sha, language)
+            ).fetchone()
+            if row is None:
+                return None
+            self.connection.execute(
+                "UPDATE blobs SET last_used = ? WHERE sha = ? AND language = ?", (time.time(), sha, language)
+            )
+        code_lines, comment_lines, dependencies, size = row
+        return code_lines, comment_lines, tuple(dependencies.split("\n")) if dependencies else (), size
+
+    def put(self, sha, language, code_lines, comment_lines, dependencies=(), size=0):
+        with self.lock, self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO blobs (sha, language, code, comments, dependencies, bytes, last_used) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (sha, language, code_lines, comment_lines, "\n".join(dependencies), size, time.time()),
+            )
+            self.writes_since_eviction += 1
+            # Evicting on every write would turn each insert into a table scan
+            if self.writes_since_eviction >= max(1, self.max_entries // 100):
+                self._evict()
+
+    def evict(self):
+        with self.lock, self.connection:
+            self._evict()
+
+    def _evict(self):
+        self.writes_since_eviction = 0
+        deleted = self.connection.execute(
+            "DELETE FROM blobs WHERE rowid IN (SELECT rowid FROM blobs ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,),
+        ).rowcount
+        if deleted:
+            logging.debug(f"Evicted {deleted} entries from the blob cache")
+
+    def close(self):
+        self.evict()
+        self.connection.close()
@@ -0,0 +1,167 @@
+import argparse
+import json
+import logging
+import os
+import sys
+
+from src.constants import (ANALYSIS_TIME_BUDGET, DEFAULT_MAX_REPOS, DEFAULT_MAX_REQUESTS, DEFAULT_PARSE_WORKERS,
+                           FETCH_INHERITED_BLOBS, FETCH_MODES, SHARED_CODE, SHARED_CODE_POLICIES)
+
+# The code-grimoire command. `serve` runs the API, as the command always did. `analyze`
+# runs a single analysis headless, for cron jobs and scripts, and writes NDJSON to stdout:
+# one record per repository as it finishes, then one with the totals. Each command imports
+# what it runs only once it runs, so `analyze` starts without FastAPI, uvicorn, requests
+# or dotenv.
+
+
+def time_budget(value):
+    # --time-budget in seconds, with 0 for no deadline
+    return float(value) or None
+
+
+def read_targets(targets, stdin):
+    # The targets given, or those on stdin, whitespace-separated, for "-" or when nothing is
+    # given and stdin is not a terminal; # starts a comment
+    if targets and targets != ["-"]:
+        return targets
+    if targets or not stdin.isatty():
+        return [target for line in stdin for target in line.split("#", 1)[0].split()]
+    return []
+
+
+def write_record(out, record):
+    # One line each, flushed, so a reader sees every repository as soon as it is done
+    out.write(json.dumps(record, separators=(",", ":")) + "\n")
+    out.flush()
+
+
+def repo_record(event):
+    return {
+        "record": "repo",
+        "repo": event["repo"],
+        "truncated": event["truncated"],
+        "languages": {
+            language: {"code": code_lines, "comments": comment_lines}
+            for language, (code_lines, comment_lines) in event["languages"].items()
+        },
+        "dependencies": event["dependencies"],
+    }
+
+
+def analyze(args, out=sys.stdout, stdin=sys.stdin):
+    import asyncio
+    from src.file_stats import FileStats
+
+    logging.getLogger().setLevel(logging.INFO if args.verbose else logging.WARNING)
+    targets = read_targets(args.targets, stdin)
+    if args.no_cache:
+        blob_cache = snapshot_store = None
+    else:
+        from src.blob_cache import BlobCache
+        from src.snapshots import SnapshotStore
+        blob_cache, snapshot_store = BlobCache(), SnapshotStore()
+
+    def on_event(event):
+        if event["event"] == "counted":
+            write_record(out, repo_record(event))
+
+    file_stats = FileStats() if args.file_stats else None
+    if args.local:
+        # Every target is a path: a repository on disk or a directory of them
+        from src.local_grimoire import LocalCodeGrimoire
+        grimoire = LocalCodeGrimoire(targets, blob_cache=blob_cache, snapshot_store=snapshot_store, on_event=on_event,
+                                     parse_workers=args.parse_workers, shared_code=args.shared_code,
+                                     file_stats=file_stats)
+    else:
+        from src.async_grimoire import AsyncCodeGrimoire
+        from src.response_cache import create_response_cache
+        # "owner/name" is a repository and anything else a user; with no targets at all, the
+        # token's own and collaborator repositories are analyzed
+        repo_names = [target for target in targets if "/" in target]
+        users = [target for target in targets if "/" not in target]
+        grimoire = AsyncCodeGrimoire(args.token, blob_cache=blob_cache, snapshot_store=snapshot_store,
+                                     on_event=on_event, max_repos=args.max_repos, max_requests=args.max_requests,
+                                     parse_workers=args.parse_workers, extra_tokens=args.extra_tokens,
+                                     response_cache=None if args.no_cache else create_response_cache(),
+                                     time_budget=args.time_budget, orgs=args.org, users=users,
+                                     repo_names=repo_names, shared_code=args.shared_code, file_stats=file_stats,
+                                     fetch_inherited=not args.skip_inherited_blobs)
+    try:
+        if args.local:
+            result = grimoire.analyze_repos()
+        else:
+            result = asyncio.run(grimoire.analyze_repos(fetch_mode=args.fetch_mode))
+    finally:
+        if blob_cache is not None:
+            blob_cache.close()
+    if args.file_stats:
+        grimoire.file_stats.save(args.file_stats)
+    complete = not result["truncated_repos"] and "Rate Limit Hit" not in grimoire.progress.values()
+    write_record(out, {
+        "record": "summary",
+        "complete": complete,
+        "repos": grimoire.total_repos,
+        "total_lines": {language: counts for language, counts in result["total_lines"].items() if any(counts.values())},
+        "truncated_repos": result["truncated_repos"],
+        "skipped_files": result["skipped_files"],
+        "shared_files": result["shared_files"],
+    })
+    return 0 if complete else 1
+
+
+def serve(args):
+    from src.api import run
+    run()
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="code-grimoire", description="Count code and comment lines by language "
+                                     "across GitHub repositories. Without a command, serves the API.")
+    commands = parser.add_subparsers(dest="command")
+    commands.add_parser("serve", help="run the API server")
+    analyze_command = commands.add_parser(
+        "analyze", help="run one analysis and write NDJSON records to stdout",
+        description="Analyze repositories and write one JSON record per repository as it finishes, then a summary. "
+                    "Exits with 1 when the analysis was cut short by the rate limit or the time budget.",
+    )
+    analyze_command.add_argument("targets", nargs="*", metavar="target",
+                                 help='"owner/name" for a repository or a user name, or a path with --local; '
+                                      '"-", or none with stdin redirected, reads them from stdin; none at all '
+                                      "analyzes the token's own repositories")
+    analyze_command.add_argument("--local", action="store_true",
+                                 help="analyze repositories on disk instead: each target is the path of a checkout, "
+                                      "a bare repository or a directory of them, read with git and no token")
+    analyze_command.add_argument("--org", action="append", default=[], help="analyze every repository of an org")
+    analyze_command.add_argument("--token", default=os.getenv("TOKEN"), help="GitHub token (default: $TOKEN)")
+    analyze_command.add_argument("--fetch-mode", choices=FETCH_MODES, default="trees")
+    analyze_command.add_argument("--shared-code", choices=SHARED_CODE_POLICIES, default=SHARED_CODE)
+    analyze_command.add_argument("--skip-inherited-blobs", action="store_true", default=not FETCH_INHERITED_BLOBS,
+                                 help='with --shared-code once, download no blob a fork shares with its parent; its '
+                                      "files count for the fork with lines only if already known")
+    analyze_command.add_argument("--max-repos", type=int, default=DEFAULT_MAX_REPOS)
+    analyze_command.add_argument("--max-requests", type=int, default=DEFAULT_MAX_REQUESTS)
+    analyze_command.add_argument("--parse-workers", type=int, default=DEFAULT_PARSE_WORKERS)
+    analyze_command.add_argument("--time-budget", type=time_budget, default=ANALYSIS_TIME_BUDGET,
+                                 help="seconds before the analysis stops and reports what it has; 0 for no deadline, "
+                                      "the default unless $CODE_GRIMOIRE_TIME_BUDGET sets one")
+    analyze_command.add_argument("--file-stats", metavar="PATH",
+                                 help="also save the per-file rows, for src.file_stats.FileStats.load and rollups")
+    analyze_command.add_argument("--no-cache", action="store_true",
+                                 help="use neither the blob cache, the snapshots nor the response cache")
+    analyze_command.add_argument("-v", "--verbose", action="store_true", help="log progress to stderr")
+    args = parser.parse_args(argv)
+
+    if args.command == "analyze":
+        if args.local and args.org:
+            parser.error("--org lists repositories on GitHub, not on disk")
+        if not args.token and not args.local:
+            parser.error("analyze needs a token, from --token or $TOKEN")
+        # EXTRA_TOKENS add quota for public repositories, as for the API
+        args.extra_tokens = [token for token in os.getenv("EXTRA_TOKENS", "").split(",") if token]
+        return analyze(args)
+    return serve(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,29 +1,104 @@
-import datetime
+import hashlib
+import heapq
 import logging
-import re
+import tarfile
 import time
-from concurrent.futures import ThreadPoolExecutor
-from github import Github
 from threading import Lock
+from src.constants import ANALYSIS_TIME_BUDGET, GRAPHQL_BATCH_BYTES, SHARED_CODE, SHARED_CODE_POLICIES, STREAM_FILE_SIZE
+from src import metrics
+from src.counters import LanguageCounters
+from src.prefilter import FilePrefilter, count_stream
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(levelname)s] %(threadName)s: %(message)s')
 
 
-class RateLimitException:
-    pass
+def git_blob_sha(content):
+    # The SHA git, and so GitHub, gives a blob of this content
+    return hashlib.sha1(b"blob %d\0" % len(content) + content).hexdigest()
+
+
+class BlobHashingReader:
+    # Reads a file object of size bytes, hashing what is read into git's blob SHA, so a
+    # file counted as a stream is known by its SHA once it has been read through
+    def __init__(self, fileobj, size):
+        self.fileobj = fileobj
+        self.hash = hashlib.sha1(b"blob %d\0" % size)
+
+    def read(self, size=-1):
+        data = self.fileobj.read(size)
+        self.hash.update(data)
+        return data
+
+    def tell(self):
+        return self.fileobj.tell()
+
+    def sha(self):
+        return self.hash.hexdigest()
+
+
+class RepoQueue:
+    # Repositories listed but not started yet. The listing pushes them as its pages arrive
+    # and every worker pops the largest one waiting, so the biggest scans known so far go
+    # first without the whole listing having to come in before any of them starts.
+    def __init__(self):
+        self.heap = []
+        self.pushed = 0
+        self.lock = Lock()
+
+    def push(self, repo):
+        with self.lock:
+            heapq.heappush(self.heap, (-(repo.size or 0), self.pushed, repo))
+            self.pushed += 1
+
+    def pop(self):
+        with self.lock:
+            return heapq.heappop(self.heap)[2]
 
 
 class CodeGrimoire:
-    def __init__(self, auth):
+    # What the engines share: the counts, totals and progress of an analysis, the blob cache
+    # and snapshots, the prefilter and the deadline. AsyncCodeGrimoire reads repositories
+    # from the GitHub API and LocalCodeGrimoire from disk; each brings its own analyze_repos.
+    def __init__(self, blob_cache=None, snapshot_store=None, on_event=None, time_budget=ANALYSIS_TIME_BUDGET,
+                 prefilter=None, shared_code=SHARED_CODE, file_stats=None):
+        if shared_code not in SHARED_CODE_POLICIES:
+            raise ValueError(f"Unknown shared code policy: {shared_code}")
         self.total_lines = None
-        self.github = Github(auth)
-        self.user = self.github.get_user()
+        self.on_event = on_event  # called with a dict for every progress event
+        self.blob_cache = blob_cache
+        self.snapshot_store = snapshot_store
+        self.repo_files = {}  # per-file counts of repositories being snapshotted, by full name
+        self.prefilter = prefilter or FilePrefilter()
+        self.shared_code = shared_code  # "once" or "per_repo", see SHARED_CODE_POLICIES
+        self.run_counts = {}  # counts of every blob counted in this analysis, by (sha, language)
+        self.counted_blobs = set()  # SHAs of the blobs already in the totals, under "once"
+        self.parent_blobs = {}  # blob SHAs of the parent of each fork, by the fork's full name
+        self.shared_files = {"duplicate": 0, "inherited": 0}  # files left out of the totals under "once"
+        # Repositories cut short by the deadline or an error, by full name, with the number of
+        # files left uncounted (None when the rest of the repository was never listed)
+        self.truncated_repos = {}
+        self.time_budget = time_budget  # seconds for a whole analysis, or None for no limit
+        self.graphql_batch_bytes = GRAPHQL_BATCH_BYTES  # adapted as GraphQL queries fail and succeed
+        self.deadline = None
+        # Every map of repositories is keyed by full name, since short names repeat across
+        # owners, and a fork shares its parent's
         self.repos_languages = {}
+        self.repos_dependencies = {}  # names of the dependencies of each repository, like repos_languages
+        self.repo_counters = {}  # LanguageCounters of repositories being analyzed, by full name
+        self.repo_shares = {}  # under "once", their lines that reach the totals, likewise
+        self.repo_counts = {}  # {language: (code, comments)} of each finished repository, by full name
+        self.repo_share_counts = {}  # the part of repo_counts in the totals, which is all of it but under "once"
+        self.repo_dependencies = {}  # {(language, dependency): files} of each finished repository, by full name
+        # A FileStats given a row for every file recorded, for rollups by any dimension; None
+        # keeps no rows, as an analysis only after the totals needs none
+        self.file_stats = file_stats
+        self.totals_lock = Lock()
         self.init_language_counters()
         self.extension_to_language = self.create_extension_to_language_map()
-        self.rate_limit_lock = Lock()
         self.progress_lock = Lock()
         self.progress = {}
+        self.total_repos = None  # unknown until the listing is complete
+        self.profile = metrics.Profile()  # stage timings of this analysis, besides the process-wide metrics
 
     @staticmethod
     def create_extension_to_language_map():
@@ -53,6 +128,8 @@ class CodeGrimoire:
             "r": "R",
             "sql": "SQL",
             "lua": "Lua",
+            "cs": "C#",
+            "csx": "C#",
             "java": "Java", # Add other mappings as necessary
         }
     def init_language_counters(self):
@@ -78,555 +155,239 @@ class CodeGrimoire:
             "Lua": {"code": 0, "comments": 0},
         }
 
-    def analyze_repos(self):
-        repos = self.fetch_relevant_repos()
-        total_repos = len(repos)
-        rate_limit_hit = False
-        with ThreadPoolExecutor(max_workers=8) as executor:
-            future_to_repo = {executor.submit(self.process_repository, repo): repo for repo in repos}
-            while not all(future.done() for future in future_to_repo):
-                if any("Rate Limit Hit" == self.progress.get(repo.name) for repo in repos):
-                    rate_limit_hit = True
-                    break
-                self.log_progress(total_repos)
-                time.sleep(5)
-            self.log_progress(total_repos)
-
-        if rate_limit_hit:
-            logging.info("Analysis ended early due to rate limit.")
-            return self.prepare_partial_results()
-        else:
-            logging.info("Analysis completed for all repositories.")
-            return self.prepare_complete_results()
-
     def prepare_partial_results(self):
         logging.info("Preparing partial results...")
         partial_data = {
             "total_lines": self.total_lines,
             "repos_languages": self.repos_languages,
+            "truncated_repos": self.truncated_repos,
+            "skipped_files": self.prefilter.stats(),
+            "shared_code": self.shared_code,
+            "shared_files": dict(self.shared_files),
+            "repos_dependencies": self.repos_dependencies,
             "progress": self.progress
         }
-        # Here, you can add logic to save this data to a file or database if needed
+        # The API keeps every run, partial ones included, in the ResultsStore
         return partial_data
 
     def prepare_complete_results(self):
         logging.info("Preparing complete results...")
         complete_data = {
             "total_lines": self.total_lines,
-            "repos_languages": self.repos_languages
+            "repos_languages": self.repos_languages,
+            "truncated_repos": self.truncated_repos,
+            "skipped_files": self.prefilter.stats(),
+            "shared_code": self.shared_code,
+            "shared_files": dict(self.shared_files),
+            "repos_dependencies": self.repos_dependencies,
         }
-        # Similar to partial results, add logic for further processing if needed
         return complete_data
 
-    def update_progress(self, repo_name, status):
+    def update_progress(self, full_name, status):
         with self.progress_lock:
-            self.progress[repo_name] = status
-
-    def log_progress(self, total_repos):
+            self.progress[full_name] = status
+        # Totals go out with every repository event because snapshots add whole repositories
+        # at once, without a file event per file
+        with self.totals_lock:
+            total_lines = {language: dict(counts) for language, counts in self.total_lines.items()}
+        self.emit("repo", repo=full_name, status=status, total_lines=total_lines)
+
+    def emit(self, event, **fields):
+        if self.on_event is not None:
+            self.on_event({"event": event, **fields})
+
+    def log_progress(self, total_repos=None):
         with self.progress_lock:
             completed = sum(1 for status in self.progress.values() if status == "Completed")
+        if total_repos is None:
+            logging.info(f"Progress: {completed} repositories completed, more still being listed")
+        else:
             logging.info(f"Progress: {completed}/{total_repos} repositories completed")
 
-    def fetch_relevant_repos(self):
-        owned_repos = self.user.get_repos(type='owner')
-        collaborated_repos = self.user.get_repos(type='collaborator')
-        return set(owned_repos).union(set(collaborated_repos))
-
-    def process_repository(self, repo):
-        try:
-            self.update_progress(repo.name, "Started")
-            self.check_rate_limit()
-            self.repos_languages[repo.name] = set()  # Initialize the set of languages for this repo
-            start_time = datetime.datetime.now()
-            try:
-                contents = repo.get_contents("")
-                self.process_contents(contents, repo, start_time)
-            except Exception as e:
-                logging.debug(f"Error processing repository {repo.name}: {e}")
-            self.check_rate_limit()
-            self.update_progress(repo.name, "Completed")
-        except RateLimitException as e:
-            logging.warning(f"Rate limit hit while processing {repo.name}: {e}")
-            self.update_progress(repo.name, "Rate Limit Hit")
-
-    def check_rate_limit(self):
-        with self.rate_limit_lock:
-            rate_limit = self.github.get_rate_limit()
-            remaining = rate_limit.core.remaining
-            if remaining < 10:  # Arbitrary threshold for rate limit
-                raise RateLimitException("Approaching GitHub API rate limit.")
-
-    def process_contents(self, contents, repo, start_time):
-        for file_content in contents:
-            current_time = datetime.datetime.now()
-            elapsed_time = (current_time - start_time).total_seconds()
-            if elapsed_time > 60:
-                logging.debug(f"Skipping repository {repo.name} due to timeout after 60 seconds")
-                break
-
-            if file_content.type == "dir":
-                self.process_contents(repo.get_contents(file_content.path), repo, start_time)
-            elif file_content.type == "file":
-                code_lines, comment_lines = self.parse_file(file_content)
-                file_extension = file_content.name.split('.')[-1].lower()
-
-                language = self.extension_to_language.get(file_extension)
-                if language:
-                    if language not in self.total_lines:
-                        self.total_lines[language] = {"code": 0, "comments": 0}
-                    self.total_lines[language]["code"] += code_lines
-                    self.total_lines[language]["comments"] += comment_lines
-                    self.repos_languages[repo.name].add(language)
-                else:
-                    logging.debug(f"Unknown file type or language mapping missing for: {file_extension}")
-
-    def parse_file(self, file_content):
-        file_type = file_content.name.split('.')[-1]
-        parsers = {
-            "py": self.parse_python_file, # python files
-            "js": self.parse_javascript_file, # javascript files
-            "jsx": self.parse_javascript_file, # javascript react files
-            "ts": self.parse_typescript_file, # typescript files
-            "tsx": self.parse_typescript_file, # typescript react files
-            "rb": self.parse_ruby_file, # ruby files
-            "c": self.parse_c_file, # c source files
-            "h": self.parse_c_file,  # C header files
-            "cpp": self.parse_cpp_file, # c++ files
-            "cxx": self.parse_cpp_file, # c++ files
-            "cc": self.parse_cpp_file, # c++ files
-            "hpp": self.parse_cpp_file,  # C++ header files
-            "hxx": self.parse_cpp_file, # c++ files
-            "hh": self.parse_cpp_file, # c++ files
-            "cs": self.parse_csharp_file,  # c# files
-            "csx": self.parse_csharp_file,  # c# files
-            "html": self.parse_html_file, # html files
-            "css": self.parse_css_file, # css files
-            "rs": self.parse_rust_file,  # Rust parser
-            "go": self.parse_go_file,  # Go parser
-            "pl": self.parse_perl_file,  # Perl parser
-            "sh": self.parse_shell_file,  # script parser
-            "php": self.parse_php_file,  # PHP parser
-            "swift": self.parse_swift_file,  # Swift parser
-            "r": self.parse_r_file,  # R parser
-            "sql": self.parse_sql_file,  # SQL parser
-            "lua": self.parse_lua_file,  # Lua parser
-            "java": self.parse_java_file, # java parser
-        }
-        if file_type in parsers:
-            result = parsers[file_type](file_content.decoded_content.decode("utf-8"))
-            if file_type == 'py':
-                return result[1], result[2]  # Return only code lines and comment lines for Python
-            elif isinstance(result, tuple) and len(result) == 2:
-                return result
-            else:
-                raise ValueError(f"Parser for {file_type} did not return a valid tuple")
-        return 0, 0
-
-    def parse_python_file(file_content):
-        imports = set()
-        code_lines = 0
-        comment_lines = 0
-        inside_multiline_comment = False
-
-        for line in file_content.splitlines():
-            stripped_line = line.strip()
-
-            # Skip blank lines
-            if not stripped_line:
-                continue
-
-            # Detect and handle multi-line comment blocks
-            if stripped_line.startswith("'''") or stripped_line.startswith('"""'):
-                inside_multiline_comment = not inside_multiline_comment
-                comment_lines += 1
-                continue
-
-            if inside_multiline_comment or stripped_line.startswith("#"):
-                comment_lines += 1
-                continue
-
-            # Count as a code line if it's not a comment or blank
-            code_lines += 1
-
-            # Parsing for import statements
-            if re.match(r'^import (\w+)|^from (\w+) import', stripped_line):
-                imports.add(re.match(r'^import (\w+)|^from (\w+) import', stripped_line).group(1) or re.match(
-                    r'^import (\w+)|^from (\w+) import', stripped_line).group(2))
-
-        return imports, code_lines, comment_lines
-
-    @staticmethod
-    def parse_c_file(file_content):
-        code_lines = 0
-        comment_lines = 0
-        inside_block_comment = False
-
-        for line in file_content.splitlines():
-            stripped_line = line.strip()
-
-            # Skip blank lines
-            if not stripped_line:
-                continue
-
-            # Handle block comments
-            if stripped_line.startswith("/*") or inside_block_comment:
-                inside_block_comment = True
-                comment_lines += 1
-                if "*/" in stripped_line:
-                    inside_block_comment = False
-                continue
-
-            # Handle single-line comments
-            if stripped_line.startswith("//"):
-                comment_lines += 1
-                continue
-
-            # Count as a code line if it's not a comment
-            code_lines += 1
-
-        return code_lines, comment_lines
-
-    @staticmethod
-    def parse_rust_file(file_content):
-        code_lines = 0
-        comment_lines = 0
-        inside_block_comment = False
-
-        for line in file_content.splitlines():
-            stripped_line = line.strip()
-
-            # Handle block comments
-            if stripped_line.startswith("/*") or inside_block_comment:
-                inside_block_comment = True
-                comment_lines += 1
-                if "*/" in stripped_line:
-                    inside_block_comment = False
-                continue
-
-            # Handle single-line comments
-            if stripped_line.startswith("//"):
-                comment_lines += 1
-                continue
-
-            # Non-empty and non-comment line is considered as a code line
-            if stripped_line and not inside_block_comment:
-                code_lines += 1
-
-        return code_lines, comment_lines
-
-    @staticmethod
-    def parse_go_file(file_content):
-        code_lines = 0
-        comment_lines = 0
-        inside_block_comment = False
-
-        for line in file_content.splitlines():
-            stripped_line = line.strip()
-
-            # Handle block comments
-            if stripped_line.startswith("/*") or inside_block_comment:
-                inside_block_comment = True
-                comment_lines += 1
-                if "*/" in stripped_line:
-                    inside_block_comment = False
-                continue
-
-            # Handle single-line comments
-            if stripped_line.startswith("//"):
-                comment_lines += 1
-                continue
-
-            # Non-empty and non-comment line is considered as a code line
-            if stripped_line and not inside_block_comment:
-                code_lines += 1
-
-        return code_lines, comment_lines
-
-    @staticmethod
-    def parse_shell_file(file_content):
-        code_lines = 0
-        comment_lines = 0
-
-        for line in file_content.splitlines():
-            stripped_line = line.strip()
-
-            # Handle single-line comments
-            if stripped_line.startswith("#"):
-                comment_lines += 1
-                continue
-
-            # Non-empty line is considered as a code line
-            if stripped_line:
-                code_lines += 1
-
-        return code_lines, comment_lines
-
-    @staticmethod
-    def parse_swift_file(file_content):
-        code_lines = 0
-        comment_lines = 0
-        inside_block_comment = False
-
-        for line in file_content.splitlines():
-            stripped_line = line.strip()
-
-            # Handle block comments
-            if stripped_line.startswith("/*") or inside_block_comment:
-                inside_block_comment = True
-                comment_lines += 1
-                if "*/" in stripped_line:
-                    inside_block_comment = False
-                continue
-
-            # Handle single-line and documentation comments
-            if stripped_line.startswith("//"):
-                comment_lines += 1
-                continue
-
-            # Non-empty and non-comment line is considered as a code line
-            if stripped_line and not inside_block_comment:
-                code_lines += 1
-
-        return code_lines, comment_lines
-
-    @staticmethod
-    def parse_lua_file(file_content):
-        code_lines = 0
-        comment_lines = 0
-        inside_block_comment = False
-
-        for line in file_content.splitlines():
-            stripped_line = line.strip()
-
-            # Handle block comments
-            if stripped_line.startswith("--[[") or inside_block_comment:
-                inside_block_comment = True
-                comment_lines += 1
-                if stripped_line.endswith("--]]"):
-                    inside_block_comment = False
-                continue
-
-            # Handle single-line comments
-            if stripped_line.startswith("--") and not stripped_line.startswith("--[["):
-                comment_lines += 1
-                continue
-
-            # Non-empty and non-comment line is considered as a code line
-            if stripped_line and not inside_block_comment:
-                code_lines += 1
-
-        return code_lines, comment_lines
-
-    @staticmethod
-    def parse_r_file(file_content):
-        code_lines = 0
-        comment_lines = 0
-
-        for line in file_content.splitlines():
-            stripped_line = line.strip()
-
-            # Handle single-line comments
-            if stripped_line.startswith("#"):
-                comment_lines += 1
-                continue
-
-            # Non-empty line is considered as a code line
-            if stripped_line:
-                code_lines += 1
-
-        return code_lines, comment_lines
-
-    @staticmethod
-    def parse_sql_file(file_content):
-        code_lines = 0
-        comment_lines = 0
-        inside_block_comment = False
-
-        for line in file_content.splitlines():
-            stripped_line = line.strip()
-
-            # Handle block comments
-            if stripped_line.startswith("/*") or inside_block_comment:
-                inside_block_comment = True
-                comment_lines += 1
-                if "*/" in stripped_line:
-                    inside_block_comment = False
-                continue
-
-            # Handle single-line comments
-            if stripped_line.startswith("--"):
-                comment_lines += 1
-                continue
-
-            # Non-empty and non-comment line is considered as a code line
-            if stripped_line and not inside_block_comment:
-                code_lines += 1
-
-        return code_lines, comment_lines
-
-    @staticmethod
-    def parse_php_file(file_content):
-        code_lines = 0
-        comment_lines = 0
-        inside_block_comment = False
-
-        for line in file_content.splitlines():
-            stripped_line = line.strip()
-
-            # Handle block comments
-            if stripped_line.startswith("/*") or inside_block_comment:
-                inside_block_comment = True
-                comment_lines += 1
-                if "*/" in stripped_line:
-                    inside_block_comment = False
-                continue
-
-            # Handle single-line comments
-            if stripped_line.startswith("//") or stripped_line.startswith("#"):
-                comment_lines += 1
-                continue
-
-            # Non-empty and non-comment line is considered as a code line
-            if stripped_line and not inside_block_comment:
-                code_lines += 1
-
-        return code_lines, comment_lines
-
-    @staticmethod
-    def parse_perl_file(file_content):
-        code_lines = 0
-        comment_lines = 0
-
-        for line in file_content.splitlines():
-            stripped_line = line.strip()
-
-            # Handle single-line comments
-            if stripped_line.startswith("#"):
-                comment_lines += 1
-                continue
-
-            # Non-empty line is considered as a code line
-            if stripped_line:
-                code_lines += 1
-
-        return code_lines, comment_lines
-
-    @staticmethod
-    def parse_javascript_file(file_content):
-        code_lines = 0
-        comment_lines = 0
-        inside_block_comment = False
-
-        for line in file_content.splitlines():
-            stripped_line = line.strip()
-
-            # Skip blank lines
-            if not stripped_line:
-                continue
-
-            # Handle block comments
-            if stripped_line.startswith("/*") or inside_block_comment:
-                inside_block_comment = True
-                comment_lines += 1
-                if "*/" in stripped_line:
-                    inside_block_comment = False
-                continue
-
-            # Handle single-line comments
-            if stripped_line.startswith("//"):
-                comment_lines += 1
-                continue
-
-            # Count as a code line if it's not a comment
-            code_lines += 1
-
-        return code_lines, comment_lines
-
-    def parse_typescript_file(self, file_content):
-        return self.parse_javascript_file(file_content)
-
-    def parse_cpp_file(self, file_content):
-        return self.parse_c_file(file_content)
-
-    def parse_java_file(self, file_content):
-        return self.parse_c_file(file_content)  # or parse_cpp_file, if they share the same logic
-
-    def parse_csharp_file(self, file_content):
-        return self.parse_c_file(file_content)  # reusing the C parser logic
-
-    @staticmethod
-    def parse_html_file(file_content):
-        code_lines = 0
-        comment_lines = 0
-        inside_comment = False
-
-        for line in file_content.splitlines():
-            stripped_line = line.strip()
-
-            if stripped_line.startswith("<!--"):
-                inside_comment = True
-
-            if inside_comment:
-                comment_lines += 1
-                if stripped_line.endswith("-->"):
-                    inside_comment = False
-                continue
-
-            if stripped_line and not inside_comment:
-                code_lines += 1
-
-        return code_lines, comment_lines
-
-    @staticmethod
-    def parse_css_file(file_content):
-        code_lines = 0
-        comment_lines = 0
-        inside_comment = False
-
-        for line in file_content.splitlines():
-            stripped_line = line.strip()
-
-            if stripped_line.startswith("/*"):
-                inside_comment = True
-
-            if inside_comment:
-                comment_lines += 1
-                if stripped_line.endswith("*/"):
-                    inside_comment = False
-                continue
-
-            if stripped_line and not inside_comment:
-                code_lines += 1
-
-        return code_lines, comment_lines
-
-    @staticmethod
-    def parse_ruby_file(file_content):
-        code_lines = 0
-        comment_lines = 0
-        inside_multiline_comment = False
-
-        for line in file_content.splitlines():
-            stripped_line = line.strip()
-
-            if stripped_line.startswith("=begin"):
-                inside_multiline_comment = True
-                comment_lines += 1
-                continue
-
-            if stripped_line.startswith("=end"):
-                inside_multiline_comment = False
-                comment_lines += 1
-                continue
-
-            if inside_multiline_comment or stripped_line.startswith("#"):
-                comment_lines += 1
-                continue
-
-            if stripped_line:  # Non-empty line
-                code_lines += 1
-
-        return code_lines, comment_lines
+    def begin_repository(self, repo):
+        self.repos_languages[repo.full_name] = set()  # Initialize the set of languages for this repo
+        self.repo_counters[repo.full_name] = LanguageCounters()
+        if self.shared_code == "once":
+            self.repo_shares[repo.full_name] = LanguageCounters()
+
+    def finish_repository(self, repo):
+        # The one point where a repository's counts reach the shared totals. Counts of a
+        # repository cut short by the rate limit or an error are kept, as before. Under
+        # "once" the totals take the repository's share of them, while its own languages,
+        # counts and dependencies cover every file.
+        counters = self.repo_counters.pop(repo.full_name)
+        shares = self.repo_shares.pop(repo.full_name, counters)
+        with self.timed("aggregation"), self.totals_lock:
+            shares.merge_into(self.total_lines)
+            self.repos_languages[repo.full_name].update(counters.languages())
+            self.repo_counts[repo.full_name] = counters.counts()
+            self.repo_share_counts[repo.full_name] = shares.counts()
+            self.repo_dependencies[repo.full_name] = dict(counters.dependencies)
+            self.repos_dependencies[repo.full_name] = sorted({dependency for _, dependency in counters.dependencies})
+        self.emit("counted", repo=repo.full_name, name=repo.name, truncated=repo.full_name in self.truncated_repos,
+                  languages=self.repo_counts[repo.full_name], dependencies=self.repos_dependencies[repo.full_name])
+
+    def inherited(self, repo, sha):
+        # Whether a file of a fork is unchanged from its parent, and so not in the totals
+        if sha not in self.parent_blobs.get(repo.full_name, ()):
+            return False
+        with self.totals_lock:
+            self.shared_files["inherited"] += 1
+        return True
+
+    def save_snapshot(self, repo, head_sha, pushed_at):
+        files = self.repo_files.pop(repo.full_name)
+        if repo.full_name in self.truncated_repos:
+            logging.debug(f"Not saving a snapshot of {repo.name} because its scan was truncated")
+        else:
+            self.snapshot_store.save(repo.full_name, head_sha, pushed_at, files)
+
+    def record_snapshot(self, repo):
+        # File by file, so each gets its row in the file stats and, under "once", blobs
+        # already counted in this analysis are left out. Their counts also spare any later
+        # repository with the same blob a download.
+        for path, language, *counts, sha in self.snapshot_store.files(repo.full_name):
+            if sha is not None:
+                self.run_counts.setdefault((sha, language), tuple(counts))
+            self.record_counts(repo, path, language, *counts, sha)
+
+    def timed(self, stage):
+        # Times a stage into both the /metrics histograms and this analysis' profile
+        return metrics.timed(stage, self.profile)
+
+    def start_deadline(self):
+        self.deadline = time.monotonic() + self.time_budget if self.time_budget is not None else None
+
+    def timed_out(self):
+        return self.deadline is not None and time.monotonic() >= self.deadline
+
+    def mark_truncated(self, repo, skipped_files=None):
+        logging.debug(f"Deadline reached while scanning {repo.name}, "
+                      f"{'the rest of it' if skipped_files is None else f'{skipped_files} files'} left uncounted")
+        # Parts of a scan cut short separately add up; an unknown count stays unknown
+        known = self.truncated_repos.get(repo.full_name, 0)
+        self.truncated_repos[repo.full_name] = None if known is None or skipped_files is None else known + skipped_files
+
+    def mark_failed(self, repo, error):
+        # A scan that failed partway keeps what it counted, and is reported as truncated
+        # with the rest of it unknown, so the analysis doesn't pass for complete
+        logging.warning(f"Error processing repository {repo.name}, the rest of it left uncounted: {error}")
+        self.truncated_repos[repo.full_name] = None
+
+    def skip_repository(self, repo):
+        # A repository whose turn came after the deadline is reported, not scanned
+        self.truncated_repos[repo.full_name] = None
+        self.update_progress(repo.full_name, "Deadline Exceeded")
+
+    def blob_result(self, path, kind, content, size):
+        # A blob is judged on the metadata GraphQL returns before anything is counted:
+        # binary ones count no lines, and ones over the size limit are skipped
+        if not self.prefilter.wanted(path, size):
+            return None, None
+        return (None, (0, 0, (), size)) if kind == "binary" else (content, None)
+
+    def shrink_graphql_batches(self):
+        self.graphql_batch_bytes = max(1, self.graphql_batch_bytes // 2)
+
+    def grow_graphql_batches(self):
+        self.graphql_batch_bytes = min(GRAPHQL_BATCH_BYTES, self.graphql_batch_bytes * 2)
+
+    def language_of(self, path):
+        # The language of a file by its extension, whatever its case, or None; every engine
+        # and fetch mode goes through it, so a file is counted the same way by all of them
+        return self.extension_to_language.get(path.rsplit('/', 1)[-1].rsplit('.', 1)[-1].lower())
+
+    def wanted(self, path, size=None):
+        # Whether a listed file is worth fetching: of a supported language, and not skipped
+        # by the prefilter
+        return self.language_of(path) is not None and self.prefilter.wanted(path, size)
+
+    def cached_counts(self, sha, language):
+        # Blobs counted earlier in this analysis, then ones in the blob cache
+        counts = self.run_counts.get((sha, language))
+        if counts is None and self.blob_cache is not None:
+            counts = self.blob_cache.get(sha, language)
+        return counts
+
+    def parse_stream(self, fileobj, language, size):
+        started = time.perf_counter()
+        counts = count_stream(fileobj, language)
+        metrics.observe_parse([(language, size, time.perf_counter() - started)], self.profile)
+        return counts
+
+    def store_counts(self, sha, language, counts):
+        self.run_counts[(sha, language)] = counts
+        if self.blob_cache is not None:
+            self.blob_cache.put(sha, language, *counts)
+        return counts
+
+    def archive_files(self, fileobj, repo):
+        # (path, language, blob sha, content, None) of every file of a supported language in
+        # the tarball, or (path, language, blob sha, None, counts) when the blob was counted
+        # before. Members over STREAM_FILE_SIZE are counted here, as they are read, and
+        # their SHA hashed alongside.
+        with tarfile.open(fileobj=fileobj, mode="r|gz") as archive:
+            for member in archive:
+                if self.timed_out():
+                    self.mark_truncated(repo)
+                    break
+                if not member.isfile():
+                    continue
+                path = member.name.split('/', 1)[-1]  # drop the owner-repo-sha/ prefix
+                language = self.language_of(path)
+                if not language or not self.prefilter.wanted(path, member.size):
+                    continue
+                if member.size > STREAM_FILE_SIZE:
+                    reader = BlobHashingReader(archive.extractfile(member), member.size)
+                    counts = self.parse_stream(reader, language, member.size)
+                    yield path, language, reader.sha(), None, self.store_counts(reader.sha(), language, counts)
+                    continue
+                content = archive.extractfile(member).read()
+                sha = git_blob_sha(content)
+                cached = self.cached_counts(sha, language)
+                yield path, language, sha, None if cached else content, cached
+
+    def record_file(self, repo, path, code_lines, comment_lines, dependencies=(), size=0, sha=None):
+        language = self.language_of(path)
+        if language:
+            self.record_counts(repo, path, language, code_lines, comment_lines, dependencies, size, sha)
+            # Snapshots keep the full counts whatever the policy
+            if repo.full_name in self.repo_files:
+                self.repo_files[repo.full_name][path] = (language, code_lines, comment_lines, dependencies, size, sha)
+            self.emit("file", repo=repo.full_name, path=path, language=language, code=code_lines, comments=comment_lines,
+                      dependencies=list(dependencies), bytes=size)
+        else:
+            logging.debug(f"Unknown file type or language mapping missing for: {path}")
+
+    def record_counts(self, repo, path, language, code_lines, comment_lines, dependencies, size, sha):
+        # Every file counts for its own repository, whatever the policy
+        counters = self.repo_counters[repo.full_name]
+        counters.add(language, code_lines, comment_lines)
+        counters.add_dependencies(language, dependencies)
+        counted = self.share_counts(repo, language, code_lines, comment_lines, sha)
+        if self.file_stats is not None:
+            self.file_stats.add(repo.full_name, path, language, code_lines, comment_lines, size, counted)
+
+    def share_counts(self, repo, language, code_lines, comment_lines, sha):
+        # Under "once", adds a file to its repository's share of the totals unless a fork
+        # shares it with its parent or its blob is in the totals already; files of no known
+        # SHA always are. Says whether it was. The SHA is marked only with the lines added,
+        # so a file that fails to record never keeps its blob out of other repositories.
+        if self.shared_code != "once":
+            return True
+        shares = self.repo_shares[repo.full_name]
+        if sha is None:
+            shares.add(language, code_lines, comment_lines)
+            return True
+        if self.inherited(repo, sha):
+            return False
+        with self.totals_lock:
+            if sha in self.counted_blobs:
+                self.shared_files["duplicate"] += 1
+                return False
+            shares.add(language, code_lines, comment_lines)
+            self.counted_blobs.add(sha)
+        return True
 
     def display_results(self):
         for repo, languages in self.repos_languages.items():
@@ -638,7 +399,3 @@ class CodeGrimoire:
             comment_lines = counts["comments"]
             percentage = (code_lines / total_lines) * 100 if total_lines > 0 else 0
             logging.info(f"{lang}: Code lines - {code_lines}, Comment lines - {comment_lines} ({percentage:.2f}%)")
-
-# Usage
-# analyzer = CodeGrimoire(auth)
-# analyzer.analyze_repos()
\ No newline at end of file
@@ -1,2 +1,123 @@
 SUPPORTED_LANGUAGES = {"Python", "JavaScript", "TypeScript", "HTML", "CSS","C", "C++", "C#", "Java", "Ruby", "Rust",
                        "Go", "Perl", "Shell", "PHP", "Swift", "R", "SQL", "Lua"}
+
+import os
+
+# "trees" lists the repository with one recursive git tree call and fetches blobs by SHA,
+# "contents" walks the tree with one get_contents call per directory and file,
+# "archive" streams the default-branch tarball and parses it in a single download,
+# "graphql" lists like "trees" and fetches the blobs a batch at a time with GraphQL queries.
+FETCH_MODES = ("trees", "contents", "archive", "graphql")
+ARCHIVE_TIMEOUT = 60  # seconds to wait on the codeload connection
+# Seconds an analysis may take as a whole. Scans still running at the deadline stop and
+# are reported as truncated, and repositories not started by then are skipped. None, or
+# 0, is no deadline, the default: an analysis that waits up to RATE_LIMIT_MAX_WAIT for
+# the quota to reset is meant to finish in one run rather than be cut short.
+ANALYSIS_TIME_BUDGET = float(os.getenv("CODE_GRIMOIRE_TIME_BUDGET", 0)) or None
+
+CACHE_DIR = os.getenv("CODE_GRIMOIRE_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "code-grimoire"))
+# Bumped whenever line counting changes, so counts cached by an older scanner are never mixed in
+COUNTS_VERSION = 5
+BLOB_CACHE_PATH = os.path.join(CACHE_DIR, f"blobs-v{COUNTS_VERSION}.sqlite3")
+BLOB_CACHE_MAX_ENTRIES = int(os.getenv("CODE_GRIMOIRE_BLOB_CACHE_MAX_ENTRIES", 500_000))
+SNAPSHOT_PATH = os.path.join(CACHE_DIR, f"snapshots-v{COUNTS_VERSION}.sqlite3")
+COMPARE_FILES_LIMIT = 300  # the compare API lists at most this many changed files
+# A blob found in several repositories of an analysis, such as a fork and its parent, is
+# fetched and parsed once. With "once" its lines are counted once in the totals, and the
+# files a fork shares with its parent's default branch not at all; with "per_repo" they
+# are counted for every repository that has them. Either way, each repository's own
+# languages, counts and dependencies cover all of its files.
+SHARED_CODE_POLICIES = ("once", "per_repo")
+SHARED_CODE = os.getenv("CODE_GRIMOIRE_SHARED_CODE", "once")
+# Under "once", the blobs a fork shares with its parent are still downloaded by default,
+# for the fork's own counts. Set CODE_GRIMOIRE_FETCH_INHERITED_BLOBS to 0 to save those
+# downloads: such a file then counts for the fork with the lines of its blob if they are
+# known already, counted earlier in the analysis or in the blob cache, and otherwise with
+# its language and no lines. The totals are the same either way.
+FETCH_INHERITED_BLOBS = os.getenv("CODE_GRIMOIRE_FETCH_INHERITED_BLOBS", "1") != "0"
+
+# Prefilter applied to tree metadata before any blob is downloaded: files larger than
+# MAX_FILE_SIZE bytes and paths matching a comma-separated glob of SKIP_GLOBS are not
+# counted, next to the vendored and generated paths listed in src/prefilter.py. Set it to
+# 0 for no limit, so that dumps of hundreds of MB are counted, as a stream.
+MAX_FILE_SIZE = int(os.getenv("CODE_GRIMOIRE_MAX_FILE_SIZE", 1024 * 1024)) or None
+SKIP_GLOBS = tuple(glob for glob in os.getenv("CODE_GRIMOIRE_SKIP_GLOBS", "").split(",") if glob)
+# Downloaded content is sniffed from its first bytes: a NUL marks it binary, and lines
+# longer than MINIFIED_LINE_LENGTH on average mark it minified. Either counts as no lines.
+SNIFF_BYTES = 8000
+MINIFIED_LINE_LENGTH = 500
+# Files larger than STREAM_FILE_SIZE are never held in memory whole: they are downloaded
+# to disk or read from the archive and counted STREAM_CHUNK_SIZE bytes at a time. It is
+# below the default MAX_FILE_SIZE, so that the files streamed are not all prefiltered out.
+STREAM_FILE_SIZE = 256 * 1024
+STREAM_CHUNK_SIZE = 1024 * 1024
+
+# Overridden to point at GitHub Enterprise or at the mock server of the benchmarks
+GITHUB_API_URL = os.getenv("CODE_GRIMOIRE_GITHUB_API_URL", "https://api.github.com")
+GRAPHQL_URL = os.getenv("CODE_GRIMOIRE_GITHUB_GRAPHQL_URL", f"{GITHUB_API_URL}/graphql")
+REQUEST_TIMEOUT = 30  # seconds per API request
+# A GraphQL batch holds up to GRAPHQL_BATCH_FILES blobs and about GRAPHQL_BATCH_BYTES of
+# content by their listed sizes. A query GitHub gives up on is split in two and the byte
+# target halves, down to single blobs; each query that succeeds doubles it back up.
+GRAPHQL_BATCH_FILES = 100
+GRAPHQL_BATCH_BYTES = 2 * 1024 * 1024
+RATE_LIMIT_THRESHOLD = 10  # calls of the core quota left in reserve; below it requests wait for the reset
+RATE_LIMIT_WINDOW = 3600  # seconds between core quota resets
+RATE_LIMIT_PACING_FRACTION = 0.25  # below this share of the quota, requests are spread until the reset
+# Longest wait for quota before giving up with partial results; a reset is at most a window away
+RATE_LIMIT_MAX_WAIT = int(os.getenv("CODE_GRIMOIRE_RATE_LIMIT_MAX_WAIT", RATE_LIMIT_WINDOW + 60))
+# Concurrency of the async engine: repositories analyzed at once, and API requests in
+# flight across all of them (which is also the size of the shared connection pool)
+DEFAULT_MAX_REPOS = 8
+DEFAULT_MAX_REQUESTS = 32
+MAX_REPOS_LIMIT = 64
+MAX_REQUESTS_LIMIT = 100
+ARCHIVE_SPOOL_SIZE = 64 * 1024 * 1024  # tarballs larger than this are spooled to disk
+
+JOB_HISTORY = 100  # finished analysis jobs kept for GET /jobs/{id}
+# File events queued for one event stream before a slow reader starts missing them;
+# repository events, which carry the running totals, are never dropped
+JOB_EVENT_BUFFER = 10_000
+# A completed analysis is handed back to /analyze calls with the same token and options
+# for RESULT_CACHE_TTL seconds, and concurrent identical calls share one running analysis.
+# At most RESULT_CACHE_MAX_ENTRIES results are kept, the least recently used going first.
+RESULT_CACHE_TTL = int(os.getenv("CODE_GRIMOIRE_RESULT_CACHE_TTL", 300))
+RESULT_CACHE_MAX_ENTRIES = 32
+
+# Parse stage of the async engine: fetched files wait in a bounded queue and are counted
+# in batches by a process pool shared by every analysis
+PARSE_POOL_SIZE = int(os.getenv("CODE_GRIMOIRE_PARSE_WORKERS", os.cpu_count() or 1))
+DEFAULT_PARSE_WORKERS = PARSE_POOL_SIZE  # batches in flight per analysis
+PARSE_QUEUE_SIZE = 256  # files fetched but not yet counted
+PARSE_BATCH_FILES = 64
+PARSE_BATCH_BYTES = 4 * 1024 * 1024
+
+# Conditional-request cache of GitHub API responses: "sqlite", "files" or "none"
+RESPONSE_CACHE_BACKEND = os.getenv("CODE_GRIMOIRE_RESPONSE_CACHE", "sqlite")
+RESPONSE_CACHE_PATH = os.path.join(CACHE_DIR, "responses.sqlite3")
+RESPONSE_CACHE_DIR = os.path.join(CACHE_DIR, "responses")
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("CODE_GRIMOIRE_RESPONSE_CACHE_MAX_ENTRIES", 100_000))
+
+# Sharded analysis of organizations: the repository list is split into shards of
+# SHARD_SIZE repositories in a SQLite work queue, claimed by worker processes on one or
+# more hosts. A claim lasts SHARD_LEASE seconds and is renewed while its shard runs, so
+# the shard of a worker that died is handed out again; after SHARD_MAX_ATTEMPTS failed
+# runs a shard is given up on.
+SHARD_QUEUE_PATH = os.getenv("CODE_GRIMOIRE_SHARD_QUEUE", os.path.join(CACHE_DIR, "shards.sqlite3"))
+SHARD_SIZE = 25
+SHARD_LEASE = 300
+SHARD_MAX_ATTEMPTS = 3
+
+# Every analysis run through the API, with per-repository language counts, for the
+# read-only /results endpoints. Not versioned with the counts: it is history.
+RESULTS_PATH = os.path.join(CACHE_DIR, "results.sqlite3")
+RESULTS_PAGE_SIZE = 20
+# Per-file rows (repository, path, language, lines, bytes) of the last FILE_STATS_RUNS of
+# those runs, one columnar file each, for rollups by any of their dimensions after the fact
+FILE_STATS_DIR = os.path.join(CACHE_DIR, "file-stats")
+FILE_STATS_RUNS = int(os.getenv("CODE_GRIMOIRE_FILE_STATS_RUNS", 50))
+# Upper bounds, in bytes, of the file size buckets of rollups; larger files fall in a last bucket
+FILE_SIZE_BUCKETS = (1024, 10 * 1024, 100 * 1024, 1024 * 1024)
+
+# Upper bounds, in seconds, of the latency histogram buckets served on /metrics
+METRICS_LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
@@ -0,0 +1,50 @@
+from array import array
+from collections import Counter
+
+from src.constants import SUPPORTED_LANGUAGES
+
+# Fixed index of every language in the counter arrays; sorted, so it is the same in every process
+LANGUAGES = tuple(sorted(SUPPORTED_LANGUAGES))
+LANGUAGE_INDEX = {language: index for index, language in enumerate(LANGUAGES)}
+
+
+class LanguageCounters:
+    # Code and comment lines of one repository, one array slot per language. Only the task
+    # analyzing the repository writes to it, so counting needs no lock. CodeGrimoire merges
+    # it into the shared totals once, when the repository is done. dependencies counts the
+    # files importing each dependency, by (language, name).
+    __slots__ = ("code", "comments", "seen", "dependencies")
+
+    def __init__(self):
+        self.code = array("q", bytes(8 * len(LANGUAGES)))
+        self.comments = array("q", bytes(8 * len(LANGUAGES)))
+        self.seen = bytearray(len(LANGUAGES))
+        self.dependencies = Counter()
+
+    def add(self, language, code_lines, comment_lines):
+        index = LANGUAGE_INDEX[language]
+        self.code[index] += code_lines
+        self.comments[index] += comment_lines
+        self.seen[index] = 1
+
+    def add_dependencies(self, language, dependencies):
+        self.dependencies.update((language, dependency) for dependency in dependencies)
+
+    def languages(self):
+        return {LANGUAGES[index] for index, seen in enumerate(self.seen) if seen}
+
+    def counts(self):
+        # {language: (code_lines, comment_lines)} of the languages seen
+        return {
+            LANGUAGES[index]: (self.code[index], self.comments[index])
+            for index, seen in enumerate(self.seen) if seen
+        }
+
+    def merge_into(self, total_lines):
+        # Languages are added in index order, so the totals come out the same whatever
+        # order the repositories finish in
+        for index, language in enumerate(LANGUAGES):
+            if self.seen[index]:
+                counts = total_lines.setdefault(language, {"code": 0, "comments": 0})
+                counts["code"] += self.code[index]
+                counts["comments"] += self.comments[index]
@@ -0,0 +1,144 @@
+import re
+
+# What the imports of each language depend on, found by the scanner in the same pass that
+# counts lines (src/scanner.py). The scanner hands over the lines it counted: stripped,
+# each after a newline, with block comments and multi-line strings already rewritten and
+# line comments dropped, so a commented-out import is never found. Every pattern starts
+# with a literal, most with the newline before a statement, since re looks for a literal
+# prefix far faster than it tries a ^ anchor at every position.
+# Names are what the dependency is known by outside the repository as far as the import
+# alone tells: the top-level module of a Python import, the package of a JavaScript
+# specifier, a Go import path, a Rust crate, a Java package, a C header. Relative imports,
+# and C includes in quotes rather than angle brackets, name files of the repository itself
+# and are left out.
+
+
+def decoded(raw):
+    return raw.decode("utf-8", "replace")
+
+
+def python_names(match):
+    module, imported = match.groups()
+    if module is not None:
+        # "from . import x" and "from .module import x" are relative
+        return [] if module.startswith(b".") else [module]
+    # import a.b as c, d
+    return [name.split()[0] for name in imported.split(b",") if name.strip()]
+
+
+def python_name(module):
+    name = module.split(b".")[0]
+    return None if name == b"__future__" else name
+
+
+def js_name(specifier):
+    # The package of a specifier: "@scope/name/sub" -> "@scope/name", "name/sub" -> "name"
+    if specifier.startswith((b".", b"/")) or b"://" in specifier:
+        return None
+    parts = specifier.split(b"/")
+    return b"/".join(parts[:2]) if specifier.startswith(b"@") and len(parts) > 1 else parts[0]
+
+
+def java_package(name):
+    # java.util.List -> java.util, and for a static import the package of its class
+    package = []
+    for part in name.split(b"."):
+        if part == b"*" or part[:1].isupper():
+            break
+        package.append(part)
+    return b".".join(package) or None
+
+
+def go_paths(match):
+    block, single = match.groups()
+    return GO_BLOCK_PATH.findall(block) if block is not None else [single]
+
+
+class DependencyPattern:
+    # patterns find the imports of a language. names gives the raw names a match imports,
+    # by default its first group, and name normalizes each one, None leaving it out.
+    # keywords are bytes one of which any import contains, checked before anything is matched.
+    # unfinished matches an import still going on at the end of the text, for a language
+    # whose imports may span lines.
+    def __init__(self, patterns, keywords, names=None, name=None, unfinished=None):
+        self.patterns = [re.compile(pattern) for pattern in patterns]
+        self.keywords = keywords
+        self.names = names or (lambda match: [match.group(1)])
+        self.name = name or (lambda raw: raw)
+        self.unfinished = re.compile(unfinished) if unfinished else None
+
+    def present(self, text):
+        return any(keyword in text for keyword in self.keywords)
+
+    def find(self, text, found):
+        # Adds the names text depends on to the set found
+        for pattern in self.patterns:
+            for match in pattern.finditer(text):
+                for raw in self.names(match):
+                    name = self.name(raw.strip())
+                    if name:
+                        found.add(decoded(name))
+
+    def unfinished_tail(self, text):
+        # The end of text from the start of an import it leaves unfinished, for the scanner to
+        # match again with the lines that follow, or b""
+        match = self.unfinished.search(text) if self.unfinished is not None else None
+        return text[match.start():] if match else b""
+
+
+GO_BLOCK_PATH = re.compile(rb'"([^"\n]+)"')
+RUST_LOCAL = {b"crate", b"self", b"super"}
+
+DEPENDENCY_PATTERNS = {
+    "Python": DependencyPattern(
+        [rb"\n(?:from[ \t]+([\w.]+)[ \t]+import\b|import[ \t]+([\w.][\w. \t,]*))"], (b"import",),
+        names=python_names, name=python_name,
+    ),
+    "JavaScript": DependencyPattern(
+        # Statements starting with import "x", import ... from "x", export ... from "x", and
+        # import("x") or require("x"), on their own or assigned to a const, let or var. An
+        # import list may span lines, but never a quote, so nothing is matched in a string.
+        [rb"""\nimport[ \t]*["']([^"'\n]+)["']""",
+         rb"""\n(?:import|export)\b[^;"'`()]*?\bfrom[ \t]*["']([^"'\n]+)["']""",
+         rb"""\n(?:(?:const|let|var)[ \t]+[^=\n]*=[ \t]*)?(?:await[ \t]+)?(?:import|require)[ \t]*\([ \t]*"""
+         rb"""["']([^"'\n]+)["']"""],
+        (b"import", b"export", b"require"), name=js_name,
+        unfinished=rb"""\n(?:import|export)\b[^;"'`()]*\Z""",
+    ),
+    "Go": DependencyPattern(
+        [rb'\nimport[ \t]*(?:\(([^)]*)\)|(?:[\w.]+[ \t]+)?"([^"\n]+)")'], (b"import",), names=go_paths,
+        unfinished=rb"\nimport[ \t]*\([^)]*\Z",
+    ),
+    "Rust": DependencyPattern(
+        [rb"\n(?:pub(?:\([^)\n]*\))?[ \t]+)?(?:use[ \t]+(?:::)?|extern[ \t]+crate[ \t]+)(\w+)"], (b"use", b"crate"),
+        name=lambda crate: None if crate in RUST_LOCAL else crate,
+    ),
+    "Java": DependencyPattern(
+        [rb"\nimport[ \t]+(?:static[ \t]+)?([\w.]*\w)"], (b"import",), name=java_package,
+    ),
+    "C": DependencyPattern([rb"\n#[ \t]*include[ \t]*<([^>\n]+)>"], (b"include",)),
+    "C#": DependencyPattern(
+        [rb"\nusing[ \t]+(?:static[ \t]+)?(?:\w+[ \t]*=[ \t]*)?([\w.]+)[ \t]*;"], (b"using",),
+    ),
+    "Ruby": DependencyPattern(
+        [rb"""\n(?:require|gem)[ \t(]*["']([^"'\n]+)["']"""], (b"require", b"gem"),
+        name=lambda feature: feature.split(b"/")[0],
+    ),
+    "PHP": DependencyPattern([rb"\nuse[ \t]+(?:function[ \t]+|const[ \t]+)?\\?([A-Za-z_]\w*)"], (b"use",)),
+    "Swift": DependencyPattern(
+        [rb"\n(?:@\w+(?:\([^)\n]*\))?[ \t]+)?import[ \t]+"
+         rb"(?:(?:typealias|struct|class|enum|protocol|let|var|func)[ \t]+)?(\w+)"],
+        (b"import",),
+    ),
+    "Perl": DependencyPattern([rb"\n(?:use|require)[ \t]+([A-Z][\w:]*)"], (b"use", b"require")),
+    "Lua": DependencyPattern(
+        [rb"""require[ \t]*\(?[ \t]*["']([^"'\n]+)["']"""], (b"require",),
+        name=lambda module: module.split(b".")[0],
+    ),
+    "R": DependencyPattern(
+        [rb"""library\([ \t]*["']?([\w.]+)""", rb"""require(?:Namespace)?\([ \t]*["']?([\w.]+)"""],
+        (b"library", b"require"),
+    ),
+}
+DEPENDENCY_PATTERNS["TypeScript"] = DEPENDENCY_PATTERNS["JavaScript"]
+DEPENDENCY_PATTERNS["C++"] = DEPENDENCY_PATTERNS["C"]
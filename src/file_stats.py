@@ -0,0 +1,244 @@
+import json
+import os
+import sys
+from array import array
+from bisect import bisect_right
+from threading import Lock
+
+from src.constants import FILE_SIZE_BUCKETS, FILE_STATS_DIR, FILE_STATS_RUNS
+from src.counters import LANGUAGE_INDEX, LANGUAGES
+
+# Dimensions a rollup can group the files by. "directory" is the leading directories of a
+# file's path, as many as the rollup's depth; "size" is the bucket of FILE_SIZE_BUCKETS.
+DIMENSIONS = ("repo", "owner", "language", "directory", "size")
+ROOT_DIRECTORY = "."
+# Columns of a FileStats, as saved: name and array typecode
+COLUMNS = (("repo", "I"), ("language", "B"), ("directory", "I"), ("name_ends", "Q"), ("code", "I"),
+           ("comments", "I"), ("bytes", "Q"))
+
+
+def size_label(size):
+    for unit, scale in (("MB", 1024 * 1024), ("KB", 1024)):
+        if size >= scale and size % scale == 0:
+            return f"{size // scale}{unit}"
+    return f"{size}B"
+
+
+SIZE_LABELS = tuple(
+    f"{size_label(lower)}-{size_label(upper)}" for lower, upper in zip((0, *FILE_SIZE_BUCKETS), FILE_SIZE_BUCKETS)
+) + (f"{size_label(FILE_SIZE_BUCKETS[-1])}+",)
+
+
+def intern(table, ids, value):
+    index = ids.get(value)
+    if index is None:
+        index = ids[value] = len(table)
+        table.append(value)
+    return index
+
+
+def load_numpy():
+    # NumPy, when installed, does the group-bys in bulk; without it they loop over the rows
+    try:
+        import numpy
+    except ImportError:
+        return None
+    return numpy
+
+
+class FileStats:
+    # One row per file recorded by an analysis: repository, path, language, code and comment
+    # lines, bytes, and whether its lines reached the totals (under "once", a blob counted
+    # in another repository doesn't). Each field is a typed array, a few dozen bytes a row:
+    # repositories and directories are indexes into tables of their names, languages their
+    # LANGUAGE_INDEX, and file names are packed into one buffer. Rollups sum the rows by
+    # any DIMENSIONS, so a new breakdown needs no rescan.
+    def __init__(self):
+        self.lock = Lock()
+        self.repos, self.repo_ids = [], {}
+        self.directories, self.directory_ids = [], {}
+        self.columns = {name: array(typecode) for name, typecode in COLUMNS}
+        self.counted = bytearray()
+        self.names = bytearray()
+
+    def __len__(self):
+        return len(self.counted)
+
+    def add(self, repo, path, language, code_lines, comment_lines, size, counted=True):
+        directory, _, name = path.rpartition("/")
+        with self.lock:
+            columns = self.columns
+            columns["repo"].append(intern(self.repos, self.repo_ids, repo))
+            columns["language"].append(LANGUAGE_INDEX[language])
+            columns["directory"].append(intern(self.directories, self.directory_ids, directory))
+            self.names += name.encode()
+            columns["name_ends"].append(len(self.names))
+            columns["code"].append(code_lines)
+            columns["comments"].append(comment_lines)
+            columns["bytes"].append(size)
+            self.counted.append(counted)
+
+    def rows(self):
+        # (repo, path, language, code, comments, bytes) of every file, in the order recorded,
+        # of a table no longer being added to
+        columns = self.columns
+        start = 0
+        for row, end in enumerate(columns["name_ends"]):
+            directory = self.directories[columns["directory"][row]]
+            name = self.names[start:end].decode()
+            start = end
+            yield (self.repos[columns["repo"][row]], f"{directory}/{name}" if directory else name,
+                   LANGUAGES[columns["language"][row]], columns["code"][row], columns["comments"][row],
+                   columns["bytes"][row])
+
+    def rollup(self, by=("language",), depth=1, counted_only=False):
+        # Files, code and comment lines and bytes summed by each combination of the
+        # dimensions in by, most code first. counted_only leaves out the files whose lines
+        # were counted in another repository, so that the sums match the totals.
+        unknown = [dimension for dimension in by if dimension not in DIMENSIONS]
+        if unknown:
+            raise ValueError(f"Unknown rollup dimensions: {', '.join(unknown)}")
+        numpy = load_numpy()
+        with self.lock:
+            keys = [self.key(dimension, depth) for dimension in by]
+            values = [self.columns[name] for name in ("code", "comments", "bytes")]
+            selected = self.counted if counted_only else None
+            if not len(self):
+                groups = {}
+            elif numpy is not None:
+                groups = numpy_group_sums(numpy, keys, values, selected)
+            else:
+                groups = loop_group_sums(keys, values, selected)
+        rolled_up = [
+            {**{dimension: labels[index] for dimension, (_, _, _, labels), index in zip(by, keys, group)},
+             "files": files, "code": code_lines, "comments": comment_lines, "bytes": size}
+            for group, (files, code_lines, comment_lines, size) in groups.items()
+        ]
+        return sorted(rolled_up, key=lambda row: (-row["code"], -row["files"]))
+
+    def key(self, dimension, depth):
+        # (column, mapping, bounds, labels): the group of a row is mapping[value] or its
+        # bucket among bounds, or else its value as it is, and labels name the groups
+        if dimension == "repo":
+            return self.columns["repo"], None, None, self.repos
+        if dimension == "owner":
+            owners, owner_ids = [], {}
+            mapping = [intern(owners, owner_ids, repo.split("/", 1)[0]) for repo in self.repos]
+            return self.columns["repo"], mapping, None, owners
+        if dimension == "language":
+            return self.columns["language"], None, None, LANGUAGES
+        if dimension == "directory":
+            prefixes, prefix_ids = [], {}
+            mapping = [
+                intern(prefixes, prefix_ids, "/".join(directory.split("/")[:depth]) if directory else ROOT_DIRECTORY)
+                for directory in self.directories
+            ]
+            return self.columns["directory"], mapping, None, prefixes
+        return self.columns["bytes"], None, FILE_SIZE_BUCKETS, SIZE_LABELS
+
+    def save(self, path):
+        # A JSON header line with the tables, then the columns' bytes; written aside and
+        # moved into place, so a reader never sees half a file
+        with self.lock, open(path + ".tmp", "wb") as stats_file:
+            header = {"rows": len(self), "byteorder": sys.byteorder, "repos": self.repos,
+                      "directories": self.directories}
+            stats_file.write(json.dumps(header).encode() + b"\n")
+            for name, _ in COLUMNS:
+                self.columns[name].tofile(stats_file)
+            stats_file.write(self.counted)
+            stats_file.write(self.names)
+        os.replace(path + ".tmp", path)
+
+    @classmethod
+    def load(cls, path):
+        file_stats = cls()
+        with open(path, "rb") as stats_file:
+            header = json.loads(stats_file.readline())
+            rows = header["rows"]
+            for name, _ in COLUMNS:
+                column = file_stats.columns[name]
+                column.fromfile(stats_file, rows)
+                if header["byteorder"] != sys.byteorder:
+                    column.byteswap()
+            file_stats.counted = bytearray(stats_file.read(rows))
+            file_stats.names = bytearray(stats_file.read())
+        file_stats.repos = header["repos"]
+        file_stats.repo_ids = {repo: index for index, repo in enumerate(file_stats.repos)}
+        file_stats.directories = header["directories"]
+        file_stats.directory_ids = {directory: index for index, directory in enumerate(file_stats.directories)}
+        return file_stats
+
+
+def numpy_group_sums(numpy, keys, values, selected):
+    # {(group index of each key): (files, code, comments, bytes)}, with the key columns
+    # combined into one integer per row and the sums taken with bincount
+    combined = numpy.zeros(len(values[0]), dtype=numpy.int64)
+    cardinalities = []
+    for column, mapping, bounds, labels in keys:
+        groups = numpy.frombuffer(column, dtype=column.typecode).astype(numpy.int64)
+        if mapping is not None:
+            groups = numpy.asarray(mapping, dtype=numpy.int64)[groups]
+        elif bounds is not None:
+            groups = numpy.searchsorted(numpy.asarray(bounds), groups, side="right")
+        combined = combined * len(labels) + groups
+        cardinalities.append(len(labels))
+    sums = [numpy.frombuffer(column, dtype=column.typecode) for column in values]
+    if selected is not None:
+        mask = numpy.frombuffer(selected, dtype=numpy.uint8).astype(bool)
+        combined, sums = combined[mask], [column[mask] for column in sums]
+    unique, inverse = numpy.unique(combined, return_inverse=True)
+    totals = [numpy.bincount(inverse), *(numpy.bincount(inverse, weights=column) for column in sums)]
+    groups = {}
+    for position, group in enumerate(unique.tolist()):
+        indexes = []
+        for cardinality in reversed(cardinalities):
+            group, index = divmod(group, cardinality)
+            indexes.append(index)
+        groups[tuple(reversed(indexes))] = tuple(int(total[position]) for total in totals)
+    return groups
+
+
+def loop_group_sums(keys, values, selected):
+    # numpy_group_sums, a row at a time
+    columns = []
+    for column, mapping, bounds, _ in keys:
+        if mapping is not None:
+            columns.append(map(mapping.__getitem__, column))
+        elif bounds is not None:
+            columns.append(bisect_right(bounds, value) for value in column)
+        else:
+            columns.append(column)
+    groups = {}
+    for row, (group, code_lines, comment_lines, size) in enumerate(zip(zip(*columns), *values)):
+        if selected is not None and not selected[row]:
+            continue
+        totals = groups.get(group)
+        if totals is None:
+            groups[group] = [1, code_lines, comment_lines, size]
+        else:
+            totals[0] += 1
+            totals[1] += code_lines
+            totals[2] += comment_lines
+            totals[3] += size
+    return {group: tuple(totals) for group, totals in groups.items()}
+
+
+def run_path(run_id, directory=FILE_STATS_DIR):
+    return os.path.join(directory, f"run-{run_id}.columns")
+
+
+def save_run(file_stats, run_id, directory=FILE_STATS_DIR, keep=FILE_STATS_RUNS):
+    # Saves the rows of a run, and deletes those of all but the last keep runs
+    os.makedirs(directory, exist_ok=True)
+    file_stats.save(run_path(run_id, directory))
+    saved = sorted(
+        int(name[len("run-"):-len(".columns")]) for name in os.listdir(directory)
+        if name.startswith("run-") and name.endswith(".columns")
+    )
+    for old_run_id in saved[:-keep]:
+        os.remove(run_path(old_run_id, directory))
+
+
+def load_run(run_id, directory=FILE_STATS_DIR):
+    path = run_path(run_id, directory)
+    return FileStats.load(path) if os.path.exists(path) else None
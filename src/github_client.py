@@ -0,0 +1,171 @@
+import asyncio
+import time
+from contextlib import contextmanager
+
+import httpx
+
+from src.constants import ARCHIVE_TIMEOUT, DEFAULT_MAX_REQUESTS, GITHUB_API_URL, GRAPHQL_URL, REQUEST_TIMEOUT
+from src.metrics import count_request, observe
+from src.rate_budget import TokenScheduler
+from src.response_cache import ResponseCache
+
+
+class GraphQLError(Exception):
+    pass
+
+
+class AsyncGitHubClient:
+    # GitHub REST client shared by every repository task of an analysis. All requests go
+    # through one connection pool, and the semaphore bounds how many are in flight. Tasks
+    # queue on the semaphore rather than on httpx's pool, whose wait would time out.
+    # Every request first gets a token and a start time from the TokenScheduler, which
+    # tracks each token's quota from response headers. Waiting for quota doesn't hold a
+    # connection. Requests made with shared=False only use the first token. With a
+    # response_cache, GETs are revalidated with conditional requests and a 304 is
+    # answered from the cache. Requests are timed and counted by outcome into the metrics,
+    # and into profile when given; a caller's stage, such as blob_fetch, is timed over the
+    # same exchange, never over the wait for quota or for a slot. GraphQL queries have a
+    # points quota of their own, so they get a scheduler of their own.
+    def __init__(self, tokens, max_requests=DEFAULT_MAX_REQUESTS, base_url=GITHUB_API_URL, response_cache=None,
+                 profile=None, graphql_url=GRAPHQL_URL):
+        self.requests = asyncio.Semaphore(max_requests)
+        self.scheduler = TokenScheduler(tokens, profile=profile)
+        self.graphql_scheduler = TokenScheduler(tokens, profile=profile)
+        self.graphql_url = graphql_url
+        self.profile = profile
+        self.response_cache = response_cache
+        self.client = httpx.AsyncClient(
+            base_url=base_url,
+            headers={"Accept": "application/vnd.github+json"},
+            limits=httpx.Limits(max_connections=max_requests, max_keepalive_connections=max_requests),
+            timeout=httpx.Timeout(REQUEST_TIMEOUT, pool=None),
+            follow_redirects=True,
+        )
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.client.aclose()
+
+    async def get(self, url, shared=True, cache=True, stage=None, **params):
+        # An empty params dict would replace the query of a pagination link
+        params = {key: value for key, value in params.items() if value is not None} or None
+        cache = self.response_cache if cache else None
+        while True:
+            budget = await self.scheduler.acquire(shared)
+            request = self.client.build_request("GET", url, params=params, headers=self.auth(budget))
+            if cache is not None:
+                key = ResponseCache.key(budget.token, str(request.url))
+                cached = cache.load(key)
+                if cached is not None:
+                    request.headers.update(self.conditional_headers(cached))
+            async with self.requests:
+                with self.exchange("api_request", stage):
+                    response = await self.client.send(request)
+            if not self.rate_limited(budget, response):
+                break
+            count_request("rate_limited", self.profile)
+        if cache is not None and cached is not None and response.status_code == 304:
+            budget.refund()  # 304s don't count against the quota
+            cache.record(hit=True)
+            count_request("not_modified", self.profile)
+            headers = {"Content-Type": "application/json", **({"Link": cached.link} if cached.link else {})}
+            return httpx.Response(200, headers=headers, content=cached.body, request=request)
+        count_request("error" if response.is_error else "ok", self.profile)
+        response.raise_for_status()
+        if cache is not None:
+            cache.record(hit=False)
+            cache.store(key, response)
+        return response
+
+    async def get_json(self, url, shared=True, cache=True, stage=None, **params):
+        return (await self.get(url, shared, cache, stage, **params)).json()
+
+    async def graphql(self, query, variables, shared=True, stage=None):
+        # The response of a GraphQL query. Errors that came with no data at all raise
+        # GraphQLError; with partial data, what is missing is for the caller to notice.
+        while True:
+            budget = await self.graphql_scheduler.acquire(shared)
+            async with self.requests:
+                with self.exchange("api_request", stage):
+                    response = await self.client.post(self.graphql_url, json={"query": query, "variables": variables},
+                                                      headers=self.auth(budget))
+            if not self.rate_limited(budget, response):
+                break
+            count_request("rate_limited", self.profile)
+        count_request("error" if response.is_error else "ok", self.profile)
+        response.raise_for_status()
+        data = response.json()
+        if data.get("errors") and not data.get("data"):
+            raise GraphQLError("; ".join(error.get("message", "") for error in data["errors"]))
+        return data
+
+    async def get_pages(self, url, shared=True, **params):
+        # Every item of a paginated listing, following the Link headers
+        return [item async for page in self.iter_pages(url, shared, **params) for item in page]
+
+    async def iter_pages(self, url, shared=True, stage=None, **params):
+        # The pages of a paginated listing as they arrive, so a caller can start on the
+        # first one while the next is fetched
+        response = await self.get(url, shared, stage=stage, per_page=100, **params)
+        yield response.json()
+        while "next" in response.links:
+            response = await self.get(response.links["next"]["url"], shared, stage=stage)
+            yield response.json()
+
+    async def download(self, url, fileobj, shared=True, raw=False, stage=None):
+        # Streams the response body into fileobj; redirects to codeload are followed. With
+        # raw, the raw media type is asked for, so a blob comes as its bytes and not as JSON.
+        while True:
+            budget = await self.scheduler.acquire(shared)
+            headers = {**self.auth(budget), **({"Accept": "application/vnd.github.raw"} if raw else {})}
+            async with self.requests:
+                with self.exchange(stage):
+                    async with self.client.stream("GET", url, headers=headers, timeout=ARCHIVE_TIMEOUT) as response:
+                        if self.rate_limited(budget, response):
+                            count_request("rate_limited", self.profile)
+                            continue
+                        count_request("error" if response.is_error else "ok", self.profile)
+                        response.raise_for_status()
+                        async for chunk in response.aiter_bytes():
+                            fileobj.write(chunk)
+                        return
+
+    @contextmanager
+    def exchange(self, *stages):
+        # Times an HTTP exchange as each of stages, leaving out those that are None
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - started
+            for stage in stages:
+                if stage is not None:
+                    observe(stage, seconds, self.profile)
+
+    @staticmethod
+    def auth(budget):
+        return {"Authorization": f"token {budget.token}"}
+
+    @staticmethod
+    def conditional_headers(cached):
+        headers = {}
+        if cached.etag:
+            headers["If-None-Match"] = cached.etag
+        if cached.last_modified:
+            headers["If-Modified-Since"] = cached.last_modified
+        return headers
+
+    @staticmethod
+    def rate_limited(budget, response):
+        # Records the quota a response reports, and whether it was refused for lack of it.
+        # A refused request is retried; the scheduler holds it back until the reset, or
+        # for Retry-After seconds after a secondary rate limit.
+        budget.update_from_headers(response.headers)
+        if response.status_code not in (403, 429):
+            return False
+        if "Retry-After" in response.headers:
+            budget.next_at = max(budget.next_at, time.time() + int(response.headers["Retry-After"]))
+            return True
+        return response.headers.get("X-RateLimit-Remaining") == "0"
@@ -0,0 +1,44 @@
+from src.constants import GRAPHQL_BATCH_FILES
+
+BLOB_FIELDS = "... on Blob { text byteSize isBinary isTruncated }"
+
+
+def blob_query(shas):
+    # One aliased object lookup per blob. Blobs are looked up by SHA rather than by
+    # HEAD:path, so the contents are those of the tree that was listed and paths need no
+    # escaping.
+    lookups = "\n".join(f'    b{index}: object(oid: "{sha}") {{ {BLOB_FIELDS} }}' for index, sha in enumerate(shas))
+    return f"query($owner: String!, $name: String!) {{\n  repository(owner: $owner, name: $name) {{\n{lookups}\n  }}\n}}"
+
+
+def query_variables(repo):
+    owner, name = repo.full_name.split("/", 1)
+    return {"owner": owner, "name": name}
+
+
+def read_blobs(data, count):
+    # (kind, content, size) of each blob of a blob_query response, in order. kind is
+    # "text" with the content as bytes, "binary", or "missing" for a blob the response
+    # left out or cut short, which has to be fetched on its own.
+    repository = (data.get("data") or {}).get("repository") or {}
+    blobs = []
+    for index in range(count):
+        blob = repository.get(f"b{index}")
+        if not blob or blob.get("isTruncated") or (blob.get("text") is None and not blob.get("isBinary")):
+            blobs.append(("missing", None, None))
+        elif blob["isBinary"]:
+            blobs.append(("binary", None, blob["byteSize"]))
+        else:
+            blobs.append(("text", blob["text"].encode(), blob["byteSize"]))
+    return blobs
+
+
+def take_batch(pending, max_bytes, max_files=GRAPHQL_BATCH_FILES):
+    # Pops files off the front of the deque pending, up to max_bytes by their listed size
+    # or max_files of them, and always at least one. Files are (path, sha, size, language).
+    batch = [pending.popleft()]
+    size = batch[0][2] or 0
+    while pending and len(batch) < max_files and size + (pending[0][2] or 0) <= max_bytes:
+        batch.append(pending.popleft())
+        size += batch[-1][2] or 0
+    return batch
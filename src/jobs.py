@@ -0,0 +1,157 @@
+import asyncio
+import logging
+import time
+import uuid
+from collections import OrderedDict
+
+from src.constants import JOB_EVENT_BUFFER, JOB_HISTORY, RESULT_CACHE_MAX_ENTRIES, RESULT_CACHE_TTL
+from src.metrics import ANALYSES
+
+
+class AnalysisJob:
+    # One background analysis. CodeGrimoire reports to it through on_event. The job keeps
+    # the latest state for GET /jobs/{id} and forwards each event to the open streams.
+    # Streams that connect late start from a state event instead of a replay, so the
+    # job never keeps per-file history.
+    def __init__(self, key=None):
+        self.id = uuid.uuid4().hex
+        self.key = key  # identifies the analysis for JobManager's sharing, if it can be shared
+        self.status = "queued"
+        self.created_at = time.time()
+        self.finished_at = None
+        self.total_repos = None
+        self.progress = {}
+        self.total_lines = {}
+        self.result = None
+        self.error = None
+        self.task = None
+        self.subscribers = set()
+
+    @property
+    def finished(self):
+        return self.finished_at is not None
+
+    def publish(self, event):
+        # Called on the event loop
+        if event["event"] in ("started", "listed"):
+            # None until the listing is complete, when "listed" brings the count
+            self.total_repos = event["repos"]
+        elif event["event"] == "repo":
+            self.progress[event["repo"]] = event["status"]
+            self.total_lines = event["total_lines"]
+        for queue in self.subscribers:
+            if event["event"] != "file" or queue.qsize() < JOB_EVENT_BUFFER:
+                queue.put_nowait(event)
+
+    def finish(self, status, result=None, error=None):
+        self.status, self.result, self.error = status, result, error
+        self.finished_at = time.time()
+        ANALYSES.inc(status)
+        self.publish({"event": "done", "status": status, "error": error})
+
+    def state(self):
+        completed = sum(1 for status in self.progress.values() if status == "Completed")
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+            "repos": self.total_repos,
+            "completed_repos": completed,
+            "progress": self.progress,
+            "total_lines": self.total_lines,
+            "result": self.result,
+            "error": self.error,
+        }
+
+    async def events(self):
+        # The current state, then every event until the job finishes. Whether there are
+        # more is decided with the state: events queued while it is being sent still follow.
+        queue = asyncio.Queue()
+        self.subscribers.add(queue)
+        try:
+            finished = self.finished
+            yield {"event": "state", **self.state()}
+            if finished:
+                return
+            while True:
+                event = await queue.get()
+                yield event
+                if event["event"] == "done":
+                    return
+        finally:
+            self.subscribers.discard(queue)
+
+
+class JobManager:
+    # Runs analyses as tasks on the event loop and keeps the last JOB_HISTORY finished ones.
+    # Analyses submitted with a key are shared (single flight): a submission with the key
+    # of a running job joins it, and one within ttl seconds of a completed job gets that
+    # job back. Partial and failed jobs are not reused. The cached jobs are kept past the
+    # history, max_cached of them at most.
+    def __init__(self, history=JOB_HISTORY, ttl=RESULT_CACHE_TTL, max_cached=RESULT_CACHE_MAX_ENTRIES):
+        self.history = history
+        self.ttl = ttl
+        self.max_cached = max_cached
+        self.jobs = OrderedDict()
+        self.in_flight = {}  # key -> running job
+        self.cached = OrderedDict()  # key -> completed job, least recently used first
+
+    def submit(self, analyze, key=None, reuse=True):
+        # analyze takes the job's publish callback and returns the analysis coroutine.
+        # Returns the job and whether it is an existing one; with reuse off, a cached result
+        # is passed over, though a running job is still joined.
+        if key is not None:
+            job = self.in_flight.get(key) or (self.cached_job(key) if reuse else None)
+            if job is not None:
+                return job, True
+        job = AnalysisJob(key)
+        self.jobs[job.id] = job
+        if key is not None:
+            self.in_flight[key] = job
+        job.task = asyncio.create_task(self.run(job, analyze))
+        self.prune()
+        return job, False
+
+    def cached_job(self, key):
+        job = self.cached.get(key)
+        if job is None:
+            return None
+        if self.expires_in(job) <= 0:
+            del self.cached[key]
+            return None
+        self.cached.move_to_end(key)
+        return job
+
+    def expires_in(self, job):
+        # Seconds a finished job's result may still be reused
+        return job.finished_at + self.ttl - time.time()
+
+    def get(self, job_id):
+        return self.jobs.get(job_id)
+
+    async def run(self, job, analyze):
+        job.status = "running"
+        try:
+            result = await analyze(job.publish)
+        except Exception as e:
+            logging.exception(f"Analysis job {job.id} failed")
+            job.finish("failed", error=str(e))
+            return
+        finally:
+            if self.in_flight.get(job.key) is job:
+                del self.in_flight[job.key]
+        # Results come back partial when the rate limit or the deadline cut the analysis short
+        cut_short = "Rate Limit Hit" in job.progress.values() or result.get("truncated_repos")
+        job.finish("partial" if cut_short else "completed", result)
+        if job.key is not None and job.status == "completed":
+            self.cached[job.key] = job
+            self.cached.move_to_end(job.key)
+            while len(self.cached) > self.max_cached:
+                self.cached.popitem(last=False)
+
+    def prune(self):
+        cached = {job.id for job in self.cached.values()}
+        finished = [job_id for job_id, job in self.jobs.items() if job.finished and job_id not in cached]
+        for job_id in finished[:max(0, len(finished) - self.history)]:
+            del self.jobs[job_id]
@@ -0,0 +1,188 @@
+import logging
+import os
+import subprocess
+import threading
+from collections import namedtuple
+
+from src import metrics
+from src.code_grimoire import CodeGrimoire
+from src.constants import DEFAULT_PARSE_WORKERS, SHARED_CODE
+from src.parse_pool import batches, count_batch, count_paths, create_parse_executor, map_bounded
+
+LocalRepo = namedtuple("LocalRepo", ["name", "full_name", "path", "bare"])
+
+
+class LocalCodeGrimoire(CodeGrimoire):
+    # CodeGrimoire over repositories on disk instead of the GitHub API. Each path is a
+    # repository, or a directory of them such as a mirror folder.
+    # - Bare repositories are read at HEAD from the object store through one
+    #   `git cat-file --batch` process. Blobs already in the blob cache are never read.
+    #   With a snapshot store, an unmoved HEAD costs a single rev-parse.
+    # - Checkouts and plain directories are read from the working tree: the tracked files
+    #   when git knows the directory, every file otherwise.
+    # Counting runs on the parse process pool. Working-tree files are opened by the workers
+    # themselves, so their contents never pass through this process.
+    def __init__(self, paths, blob_cache=None, snapshot_store=None, on_event=None,
+                 parse_workers=DEFAULT_PARSE_WORKERS, parse_executor=None, shared_code=SHARED_CODE, file_stats=None):
+        super().__init__(blob_cache=blob_cache, snapshot_store=snapshot_store, on_event=on_event,
+                         shared_code=shared_code, file_stats=file_stats)
+        self.paths = paths
+        self.parse_workers = parse_workers
+        self.parse_executor = parse_executor
+
+    def analyze_repos(self):
+        repos = self.find_repos()
+        self.total_repos = len(repos)
+        self.emit("started", repos=len(repos))
+        executor = self.parse_executor or create_parse_executor(self.parse_workers)
+        try:
+            for repo in repos:
+                self.process_repository(repo, executor)
+                self.log_progress(self.total_repos)
+        finally:
+            if executor is not self.parse_executor:
+                executor.shutdown()
+        logging.info("Analysis completed for all repositories.")
+        return self.prepare_complete_results()
+
+    def find_repos(self):
+        repos = []
+        for path in self.paths:
+            path = os.path.abspath(path)
+            repo = self.as_repo(path)
+            if repo is None:
+                children = sorted(os.path.join(path, child) for child in os.listdir(path))
+                found = [child for child in map(self.as_repo, children) if child is not None]
+                # A directory that holds no repositories is analyzed as one
+                repos.extend(found or [LocalRepo(os.path.basename(path), f"local:{path}", path, False)])
+            else:
+                repos.append(repo)
+        return repos
+
+    @staticmethod
+    def as_repo(path):
+        name = os.path.basename(path)
+        if os.path.isdir(os.path.join(path, ".git")):
+            return LocalRepo(name, f"local:{path}", path, False)
+        if os.path.isfile(os.path.join(path, "HEAD")) and os.path.isdir(os.path.join(path, "objects")):
+            return LocalRepo(name.removesuffix(".git"), f"local:{path}", path, True)
+        return None
+
+    def process_repository(self, repo, executor):
+        self.update_progress(repo.full_name, "Started")
+        self.begin_repository(repo)
+        status = "Completed"
+        try:
+            if repo.bare:
+                self.process_bare(repo, executor)
+            else:
+                self.process_checkout(repo, executor)
+        except (OSError, subprocess.CalledProcessError) as e:
+            self.mark_failed(repo, e)
+            status = "Failed"
+        finally:
+            self.finish_repository(repo)
+        self.update_progress(repo.full_name, status)
+
+    def process_bare(self, repo, executor):
+        head_sha = self.git(repo, "rev-parse", "HEAD").decode().strip()
+        if self.snapshot_store is not None:
+            snapshot = self.snapshot_store.get(repo.full_name)
+            if snapshot and snapshot.head_sha == head_sha:
+                self.record_snapshot(repo)
+                return
+            self.repo_files[repo.full_name] = {}
+        missing = []
+        for path, sha, size in self.list_tree(repo, head_sha):
+            if not self.wanted(path, size):
+                continue
+            language = self.language_of(path)
+            cached = self.cached_counts(sha, language)
+            if cached is not None:
+                self.record_file(repo, path, *cached, sha)
+            else:
+                missing.append((path, sha, language))
+        contents = zip(self.read_blobs(repo, [sha for _, sha, _ in missing]), (language for _, _, language in missing))
+        counted = map_bounded(executor, count_batch, batches(contents, size_of=lambda item: len(item[0])),
+                              self.parse_workers * 2)
+        for (path, sha, language), counts in zip(missing, self.observed(counted)):
+            self.record_file(repo, path, *self.store_counts(sha, language, counts), sha)
+        if self.snapshot_store is not None:
+            self.save_snapshot(repo, head_sha, None)
+
+    def list_tree(self, repo, ref):
+        # (path, blob sha, size) of every regular file at ref; symlinks and submodules are skipped
+        with self.timed("directory_listing"):
+            listing = self.git(repo, "ls-tree", "-r", "-l", "-z", "--full-tree", ref)
+        for entry in listing.split(b"\0"):
+            if not entry:
+                continue
+            meta, path = entry.split(b"\t", 1)
+            mode, kind, sha, size = meta.split()
+            if kind == b"blob" and mode != b"120000":
+                yield os.fsdecode(path), sha.decode(), int(size)
+
+    @staticmethod
+    def read_blobs(repo, shas):
+        # Contents of the given blobs, in order, from a single cat-file process. The names
+        # are written from a thread so that neither pipe can fill up and stall the other.
+        process = subprocess.Popen(["git", "-C", repo.path, "cat-file", "--batch"],
+                                   stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+
+        def write_names():
+            with process.stdin:
+                for sha in shas:
+                    process.stdin.write(sha.encode() + b"\n")
+
+        writer = threading.Thread(target=write_names, daemon=True)
+        writer.start()
+        try:
+            for _ in shas:
+                size = int(process.stdout.readline().split()[2])
+                yield process.stdout.read(size)
+                process.stdout.read(1)  # the newline after each object
+        finally:
+            process.stdout.close()
+            process.wait()
+            writer.join()
+
+    def process_checkout(self, repo, executor):
+        files = []
+        for path in self.list_checkout(repo):
+            language = self.language_of(path)
+            full_path = os.path.join(repo.path, path)
+            if not language or not os.path.isfile(full_path) or os.path.islink(full_path):
+                continue
+            if self.prefilter.wanted(path, os.path.getsize(full_path)):
+                files.append((path, full_path, language))
+        counted = map_bounded(executor, count_paths,
+                              batches((full_path, language) for _, full_path, language in files),
+                              self.parse_workers * 2)
+        for (path, _, _), counts in zip(files, self.observed(counted)):
+            self.record_file(repo, path, *counts)
+
+    def observed(self, counted):
+        # The counts of each file, in order, from the (counts, timings) of each batch
+        for batch_counts, timings in counted:
+            metrics.observe_parse(timings, self.profile)
+            yield from batch_counts
+
+    def list_checkout(self, repo):
+        # Relative paths of the tracked files, or of every file outside .git without git
+        try:
+            with self.timed("directory_listing"):
+                tracked = self.git(repo, "ls-files", "-z")
+        except (OSError, subprocess.CalledProcessError):
+            tracked = None
+        if tracked is not None:
+            return [os.fsdecode(path) for path in tracked.split(b"\0") if path]
+        paths = []
+        for directory, subdirectories, file_names in os.walk(repo.path):
+            subdirectories[:] = [name for name in subdirectories if name != ".git"]
+            relative = os.path.relpath(directory, repo.path)
+            paths.extend(os.path.normpath(os.path.join(relative, name)).replace(os.sep, "/") for name in file_names)
+        return paths
+
+    @staticmethod
+    def git(repo, *args):
+        return subprocess.run(["git", "-C", repo.path, *args], check=True, capture_output=True).stdout
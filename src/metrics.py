@@ -0,0 +1,167 @@
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from threading import Lock
+
+from src.constants import METRICS_LATENCY_BUCKETS
+
+
+class Counter:
+    # A Prometheus counter, with one value per combination of label values
+    kind = "counter"
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self.lock = Lock()
+        self.values = {}
+
+    def inc(self, *label_values, amount=1):
+        with self.lock:
+            self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def samples(self):
+        with self.lock:
+            return [(self.name, self.labels, label_values, value) for label_values, value in sorted(self.values.items())]
+
+
+class Histogram:
+    # A Prometheus histogram. Each combination of label values keeps a count per bucket,
+    # made cumulative only when rendered, plus the sum and count of what was observed.
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labels=(), buckets=METRICS_LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self.buckets = buckets
+        self.lock = Lock()
+        self.values = {}  # label values -> [bucket counts, the last one past every bound; sum; count]
+
+    def observe(self, value, *label_values):
+        index = bisect_left(self.buckets, value)
+        with self.lock:
+            state = self.values.get(label_values)
+            if state is None:
+                state = self.values[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def samples(self):
+        with self.lock:
+            values = sorted((label_values, list(counts), total, count)
+                            for label_values, (counts, total, count) in self.values.items())
+        samples = []
+        for label_values, counts, total, count in values:
+            cumulative = 0
+            for bound, bucket_count in zip((*self.buckets, "+Inf"), counts):
+                cumulative += bucket_count
+                samples.append((f"{self.name}_bucket", (*self.labels, "le"), (*label_values, str(bound)), cumulative))
+            samples.append((f"{self.name}_sum", self.labels, label_values, total))
+            samples.append((f"{self.name}_count", self.labels, label_values, count))
+        return samples
+
+
+STAGE_SECONDS = Histogram("code_grimoire_stage_seconds", "Time spent in each stage of the analyses.", ("stage",))
+PARSE_SECONDS = Histogram("code_grimoire_parse_seconds", "Time to count the lines of one file.", ("language",))
+PARSED_BYTES = Counter("code_grimoire_parsed_bytes_total", "Bytes of source counted.", ("language",))
+API_REQUESTS = Counter("code_grimoire_api_requests_total", "GitHub API requests by outcome.", ("outcome",))
+ANALYSES = Counter("code_grimoire_analyses_total", "Analysis jobs finished, by status.", ("status",))
+METRICS = (STAGE_SECONDS, PARSE_SECONDS, PARSED_BYTES, API_REQUESTS, ANALYSES)
+
+
+def render():
+    # Every metric of this process in the Prometheus text exposition format
+    lines = []
+    for metric in METRICS:
+        lines.append(f"# HELP {metric.name} {metric.help_text}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        for name, labels, label_values, value in metric.samples():
+            pairs = ",".join(f'{label}="{escape(label_value)}"' for label, label_value in zip(labels, label_values))
+            lines.append(f"{name}{{{pairs}}} {value}" if pairs else f"{name} {value}")
+    return "\n".join(lines) + "\n"
+
+
+def escape(label_value):
+    return str(label_value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Profile:
+    # Where the time of one analysis went, for its report. Stages of different
+    # repositories and files overlap, so their seconds can add up to more than the wall
+    # time; compare each with the wall time to see what bound the run: API requests,
+    # rate limit waits or parsing.
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.lock = Lock()
+        self.stages = {}  # stage -> [count, seconds, longest]
+        self.languages = {}  # language -> [files, bytes, seconds]
+        self.api_requests = {}  # outcome -> count
+
+    def add_stage(self, stage, seconds):
+        with self.lock:
+            totals = self.stages.setdefault(stage, [0, 0.0, 0.0])
+            totals[0] += 1
+            totals[1] += seconds
+            totals[2] = max(totals[2], seconds)
+
+    def add_parse(self, language, size, seconds):
+        with self.lock:
+            totals = self.languages.setdefault(language, [0, 0, 0.0])
+            totals[0] += 1
+            totals[1] += size
+            totals[2] += seconds
+
+    def add_request(self, outcome):
+        with self.lock:
+            self.api_requests[outcome] = self.api_requests.get(outcome, 0) + 1
+
+    def report(self):
+        with self.lock:
+            return {
+                "wall_seconds": time.perf_counter() - self.started,
+                "stages": {
+                    stage: {"count": count, "seconds": seconds, "max_seconds": longest}
+                    for stage, (count, seconds, longest) in self.stages.items()
+                },
+                "languages": {
+                    language: {"files": files, "bytes": size, "seconds": seconds}
+                    for language, (files, size, seconds) in self.languages.items()
+                },
+                "api_requests": dict(self.api_requests),
+            }
+
+
+def observe(stage, seconds, profile=None):
+    STAGE_SECONDS.observe(seconds, stage)
+    if profile is not None:
+        profile.add_stage(stage, seconds)
+
+
+@contextmanager
+def timed(stage, profile=None):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(stage, time.perf_counter() - started, profile)
+
+
+def observe_parse(timings, profile=None):
+    # timings are the (language, bytes, seconds) of each file of a batch; the parse stage
+    # gets one observation per batch
+    for language, size, seconds in timings:
+        PARSE_SECONDS.observe(seconds, language)
+        PARSED_BYTES.inc(language, amount=size)
+        if profile is not None:
+            profile.add_parse(language, size, seconds)
+    if timings:
+        observe("parse", sum(seconds for _, _, seconds in timings), profile)
+
+
+def count_request(outcome, profile=None):
+    API_REQUESTS.inc(outcome)
+    if profile is not None:
+        profile.add_request(outcome)
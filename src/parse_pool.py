@@ -0,0 +1,130 @@
+import asyncio
+import multiprocessing
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+from src.constants import PARSE_BATCH_BYTES, PARSE_BATCH_FILES, PARSE_POOL_SIZE, PARSE_QUEUE_SIZE
+from src.metrics import observe_parse
+from src.prefilter import count_source, count_stream
+
+
+def create_parse_executor(workers=PARSE_POOL_SIZE):
+    # Spawned rather than forked: the parent runs an event loop and SQLite connections on
+    # several threads, which a forked child would inherit mid-operation
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+
+
+def count_batch(batch):
+    # Runs in a worker process. Returns the counts, and the (language, bytes, seconds) of
+    # each file for metrics.observe_parse, as the worker's own metrics never reach the parent.
+    counts, timings = [], []
+    for content, language in batch:
+        started = time.perf_counter()
+        counts.append(count_source(content, language))
+        timings.append((language, len(content), time.perf_counter() - started))
+    return counts, timings
+
+
+def count_paths(batch):
+    # Runs in a worker process and reads the files itself, as a stream, so their contents
+    # never have to be sent over from the parent nor held whole. Returns what count_batch does.
+    counts, timings = [], []
+    for path, language in batch:
+        started = time.perf_counter()
+        with open(path, "rb") as source_file:
+            counts.append(count_stream(source_file, language))
+        timings.append((language, os.path.getsize(path), time.perf_counter() - started))
+    return counts, timings
+
+
+def batches(items, size_of=None):
+    # Groups items into lists of at most PARSE_BATCH_FILES items and, when size_of is
+    # given, about PARSE_BATCH_BYTES
+    batch, size = [], 0
+    for item in items:
+        batch.append(item)
+        size += size_of(item) if size_of else 0
+        if len(batch) >= PARSE_BATCH_FILES or size >= PARSE_BATCH_BYTES:
+            yield batch
+            batch, size = [], 0
+    if batch:
+        yield batch
+
+
+def map_bounded(executor, function, iterable, max_in_flight):
+    # executor.map, except that it pulls from iterable only as results are taken, so a
+    # lazily produced input is never held in memory all at once. Results come in order.
+    in_flight = deque()
+    for item in iterable:
+        if len(in_flight) >= max_in_flight:
+            yield in_flight.popleft().result()
+        in_flight.append(executor.submit(function, item))
+    while in_flight:
+        yield in_flight.popleft().result()
+
+
+class ParseStage:
+    # Second stage of the async pipeline. The I/O workers hand fetched files to count(),
+    # which only waits while the bounded queue is full; that wait is the backpressure on
+    # fetching. The dispatcher sends batches to the process pool, with at most `workers`
+    # of them in flight. Files that arrive while every slot is busy go into the next
+    # batch, so batches grow when counting is the bottleneck and stay small when it isn't.
+    def __init__(self, executor, workers, queue_size=PARSE_QUEUE_SIZE, profile=None):
+        self.executor = executor
+        self.profile = profile
+        self.queue = asyncio.Queue(queue_size)
+        self.batch_slots = asyncio.Semaphore(workers)
+        self.dispatcher = None
+        self.closed = False
+
+    async def __aenter__(self):
+        self.dispatcher = asyncio.create_task(self.dispatch())
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.closed = True
+        self.dispatcher.cancel()
+        await asyncio.gather(self.dispatcher, return_exceptions=True)
+        # Files still queued will never be counted; this also frees anyone blocked on put()
+        while not self.queue.empty():
+            self.queue.get_nowait()[2].cancel()
+
+    async def count(self, content, language):
+        # Queues one file and returns a future of its (code_lines, comment_lines, dependencies)
+        if self.closed:
+            raise RuntimeError("The parse stage is closed")
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((content, language, future))
+        return future
+
+    async def dispatch(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await self.batch_slots.acquire()
+            batch = [await self.queue.get()]
+            size = len(batch[0][0])
+            while size < PARSE_BATCH_BYTES and len(batch) < PARSE_BATCH_FILES and not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+                size += len(batch[-1][0])
+            counting = loop.run_in_executor(self.executor, count_batch, [(content, language) for content, language, _ in batch])
+            counting.add_done_callback(partial(self.resolve, batch))
+
+    def resolve(self, batch, counting):
+        self.batch_slots.release()
+        futures = [future for _, _, future in batch]
+        if counting.cancelled():
+            for future in futures:
+                future.cancel()
+        elif counting.exception() is not None:
+            for future in futures:
+                if not future.done():
+                    future.set_exception(counting.exception())
+        else:
+            batch_counts, timings = counting.result()
+            observe_parse(timings, self.profile)
+            for future, counts in zip(futures, batch_counts):
+                if not future.done():
+                    future.set_result(counts)
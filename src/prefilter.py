@@ -0,0 +1,89 @@
+import re
+from collections import Counter
+from fnmatch import fnmatchcase
+from functools import partial
+from itertools import chain
+from threading import Lock
+
+from src.constants import MAX_FILE_SIZE, MINIFIED_LINE_LENGTH, SKIP_GLOBS, SNIFF_BYTES, STREAM_CHUNK_SIZE
+from src.scanner import scan_chunks, scan_lines
+
+# After GitHub linguist's vendor.yml and generated.rb: dependencies checked into the
+# repository, build output, and files written by tools rather than people
+VENDORED = re.compile("|".join((
+    r"(^|/)node_modules/",
+    r"(^|/)bower_components/",
+    r"(^|/)(vendor|vendors|_vendor|third[-_]?party|3rdparty|Pods|Carthage)/",
+    r"(^|/)(dist|deps)/",
+    r"(^|/)(\.?venv|site-packages|__pycache__)/",
+)))
+GENERATED = re.compile("|".join((
+    r"[.-]min\.(js|css)$",
+    r"[.-]bundle\.js$",
+    r"\.pb\.(go|cc|h)$",
+    r"_pb2(_grpc)?\.py$",
+    r"\.generated\.\w+$",
+    r"(^|/)jquery[^/]*\.js$",
+)))
+
+
+def sniff(content):
+    # "binary" or "minified" when the first bytes of content say it isn't source to count
+    sample = content[:SNIFF_BYTES]
+    if b"\0" in sample:
+        return "binary"
+    if len(sample) == SNIFF_BYTES and sample.count(b"\n") < SNIFF_BYTES // MINIFIED_LINE_LENGTH:
+        return "minified"
+    return None
+
+
+def count_source(content, language):
+    # (code, comments, dependencies, bytes): scan_lines and the size of content, except that
+    # binary and minified content counts as no lines and imports nothing
+    if sniff(content) is not None:
+        return 0, 0, (), len(content)
+    return (*scan_lines(content, language), len(content))
+
+
+def count_stream(fileobj, language):
+    # count_source over a binary file object, read STREAM_CHUNK_SIZE bytes at a time
+    chunks = iter(partial(fileobj.read, STREAM_CHUNK_SIZE), b"")
+    first = next(chunks, b"")
+    if sniff(first) is not None:
+        return 0, 0, (), len(first) + sum(map(len, chunks))
+    return (*scan_chunks(chain((first,), chunks), language), fileobj.tell())
+
+
+class FilePrefilter:
+    # Decides from a file's path and size alone, before anything is downloaded, whether
+    # it is worth counting. Vendored and generated paths, paths matching one of
+    # skip_globs and files over max_size bytes are skipped. A size of None, for listings
+    # that don't carry one, passes. Skipped files are tallied by reason for the results.
+    def __init__(self, skip_globs=SKIP_GLOBS, max_size=MAX_FILE_SIZE):
+        self.skip_globs = skip_globs
+        self.max_size = max_size
+        self.lock = Lock()
+        self.skipped = Counter()
+
+    def skip_reason(self, path, size=None):
+        if VENDORED.search(path):
+            return "vendored"
+        if GENERATED.search(path):
+            return "generated"
+        if any(fnmatchcase(path, glob) for glob in self.skip_globs):
+            return "excluded"
+        if size is not None and self.max_size is not None and size > self.max_size:
+            return "too_large"
+        return None
+
+    def wanted(self, path, size=None):
+        reason = self.skip_reason(path, size)
+        if reason is None:
+            return True
+        with self.lock:
+            self.skipped[reason] += 1
+        return False
+
+    def stats(self):
+        with self.lock:
+            return dict(self.skipped)
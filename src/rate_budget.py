@@ -0,0 +1,94 @@
+import asyncio
+import logging
+import time
+
+from src.constants import RATE_LIMIT_MAX_WAIT, RATE_LIMIT_PACING_FRACTION, RATE_LIMIT_THRESHOLD, RATE_LIMIT_WINDOW
+from src.metrics import observe
+
+
+class RateLimitException(Exception):
+    pass
+
+
+class RateBudget:
+    # Core API quota of one token, as reported by the X-RateLimit-* headers of its responses.
+    # reserve() hands out start times. They are immediate while more than
+    # RATE_LIMIT_PACING_FRACTION of the quota is left. Below that, the rest of the quota is
+    # spread evenly over the time until the window resets. When only RATE_LIMIT_THRESHOLD
+    # calls are left, they start at the reset.
+    def __init__(self, token):
+        self.token = token
+        self.remaining = None
+        self.limit = None
+        self.reset_at = None
+        self.next_at = 0.0
+
+    def update(self, remaining, limit, reset_at):
+        # Responses can arrive out of order. A later reset means a new window; within a
+        # window the quota only goes down, so the lowest count seen is the freshest.
+        if self.reset_at is None or reset_at > self.reset_at:
+            self.remaining, self.limit, self.reset_at = remaining, limit, reset_at
+        elif reset_at == self.reset_at:
+            self.remaining = min(self.remaining, remaining)
+
+    def update_from_headers(self, headers):
+        if "X-RateLimit-Remaining" in headers and "X-RateLimit-Reset" in headers:
+            self.update(int(headers["X-RateLimit-Remaining"]), int(headers.get("X-RateLimit-Limit", 0)),
+                        int(headers["X-RateLimit-Reset"]))
+
+    def reserve(self, now):
+        # Start time of the next request; it is counted against the quota right away
+        if self.remaining is None:
+            return now  # nothing is known until the first response
+        if now >= self.reset_at:
+            # The window has reset; the next response reports the new one
+            self.remaining, self.reset_at = self.limit, now + RATE_LIMIT_WINDOW
+        start = max(now, self.next_at)
+        if self.remaining <= RATE_LIMIT_THRESHOLD:
+            # Out of quota: wait for the reset, and assume a full quota after it
+            start = self.next_at = max(start, self.reset_at + 1)
+            self.remaining, self.reset_at = self.limit, self.reset_at + RATE_LIMIT_WINDOW
+        elif self.remaining < self.limit * RATE_LIMIT_PACING_FRACTION:
+            self.next_at = start + (self.reset_at - start) / (self.remaining - RATE_LIMIT_THRESHOLD)
+        self.remaining -= 1
+        return start
+
+    def refund(self):
+        # For a request that turned out not to count, such as a 304
+        if self.remaining is not None:
+            self.remaining += 1
+
+    def exhausted_for(self, now):
+        # Seconds until this token may make another request
+        if self.remaining is None or self.remaining > RATE_LIMIT_THRESHOLD:
+            return max(0.0, self.next_at - now)
+        return max(0.0, self.reset_at + 1 - now)
+
+
+class TokenScheduler:
+    # Shares requests across one or more tokens. Each request goes to the token that can
+    # start it soonest, with ties rotating round-robin. Requests that only the first token
+    # is authorized for, such as private repositories, are pinned to it. Waits longer
+    # than max_wait raise RateLimitException instead of sleeping, so a caller can settle
+    # for partial results. Waits are timed into the rate_limit_wait metrics and profile.
+    def __init__(self, tokens, max_wait=RATE_LIMIT_MAX_WAIT, profile=None):
+        self.budgets = [RateBudget(token) for token in tokens]
+        self.max_wait = max_wait
+        self.profile = profile
+        self.turn = 0
+
+    async def acquire(self, shared=True):
+        now = time.time()
+        budgets = self.budgets if shared else self.budgets[:1]
+        self.turn = (self.turn + 1) % len(budgets)
+        rotated = budgets[self.turn:] + budgets[:self.turn]
+        budget = min(rotated, key=lambda candidate: candidate.exhausted_for(now))
+        delay = budget.reserve(now) - now
+        if delay > 0:
+            if self.max_wait is not None and delay > self.max_wait:
+                raise RateLimitException(f"Rate limit resets in {delay:.0f}s, past the {self.max_wait}s limit.")
+            if delay > 1:
+                logging.info(f"Rate limit budget low, waiting {delay:.0f}s before the next request")
+            observe("rate_limit_wait", delay, self.profile)
+            await asyncio.sleep(delay)
+        return budget
@@ -0,0 +1,138 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import time
+from collections import namedtuple
+from threading import Lock
+
+from src.constants import (RESPONSE_CACHE_BACKEND, RESPONSE_CACHE_DIR, RESPONSE_CACHE_MAX_ENTRIES,
+                           RESPONSE_CACHE_PATH)
+
+# Validators and body of a cached response. The Link header is kept because a 304 may not
+# repeat it, and pagination needs it.
+CachedResponse = namedtuple("CachedResponse", ["etag", "last_modified", "link", "body"])
+
+
+def create_response_cache(backend=RESPONSE_CACHE_BACKEND):
+    if backend == "sqlite":
+        return SQLiteResponseCache()
+    if backend == "files":
+        return FileResponseCache()
+    if backend == "none":
+        return None
+    raise ValueError(f"Unknown response cache backend: {backend}")
+
+
+class ResponseCache:
+    # GitHub API responses kept with their ETag and Last-Modified validators. The client
+    # revalidates them with If-None-Match / If-Modified-Since. A 304 answer doesn't count
+    # against the rate limit and is served from here, so repeat scans cost next to no
+    # quota. Subclasses store entries with load() and save().
+    def __init__(self):
+        self.stats_lock = Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(token, url):
+        # Responses depend on who asks, so each token has its own entries
+        return f"{hashlib.sha256(token.encode()).hexdigest()[:16]} {url}"
+
+    def store(self, key, response):
+        etag, last_modified = response.headers.get("ETag"), response.headers.get("Last-Modified")
+        if etag or last_modified:
+            self.save(key, CachedResponse(etag, last_modified, response.headers.get("Link"), response.content))
+
+    def record(self, hit):
+        with self.stats_lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def stats(self):
+        with self.stats_lock:
+            requests = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / requests if requests else 0.0,
+            }
+
+
+class SQLiteResponseCache(ResponseCache):
+    def __init__(self, path=RESPONSE_CACHE_PATH, max_entries=RESPONSE_CACHE_MAX_ENTRIES):
+        super().__init__()
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.max_entries = max_entries
+        self.lock = Lock()
+        self.writes_since_eviction = 0
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        with self.lock, self.connection:
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute("PRAGMA synchronous=NORMAL")
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, etag TEXT, last_modified TEXT, link TEXT, body BLOB NOT NULL, "
+                "last_used REAL NOT NULL)"
+            )
+            self.connection.execute("CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used)")
+
+    def load(self, key):
+        with self.lock, self.connection:
+            row = self.connection.execute(
+                "SELECT etag, last_modified, link, body FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None:
+                self.connection.execute("UPDATE responses SET last_used = ? WHERE key = ?", (time.time(), key))
+        return CachedResponse(*row) if row else None
+
+    def save(self, key, cached):
+        with self.lock, self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO responses (key, etag, last_modified, link, body, last_used) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, *cached, time.time()),
+            )
+            self.writes_since_eviction += 1
+            if self.writes_since_eviction >= max(1, self.max_entries // 100):
+                self.writes_since_eviction = 0
+                deleted = self.connection.execute(
+                    "DELETE FROM responses WHERE rowid IN "
+                    "(SELECT rowid FROM responses ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                    (self.max_entries,),
+                ).rowcount
+                if deleted:
+                    logging.debug(f"Evicted {deleted} entries from the response cache")
+
+
+class FileResponseCache(ResponseCache):
+    # One file per response, named by a hash of its key: a JSON header line followed by the
+    # body. Nothing is evicted; delete the directory to reset it.
+    def __init__(self, directory=RESPONSE_CACHE_DIR):
+        super().__init__()
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, key):
+        return os.path.join(self.directory, hashlib.sha256(key.encode()).hexdigest())
+
+    def load(self, key):
+        try:
+            with open(self.path(key), "rb") as cached_file:
+                header = json.loads(cached_file.readline())
+                return CachedResponse(header["etag"], header["last_modified"], header["link"], cached_file.read())
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def save(self, key, cached):
+        path = self.path(key)
+        header = json.dumps({"etag": cached.etag, "last_modified": cached.last_modified, "link": cached.link})
+        # Written aside and renamed, so a reader never sees half a file
+        temporary_path = f"{path}.{os.getpid()}.tmp"
+        with open(temporary_path, "wb") as cached_file:
+            cached_file.write(header.encode() + b"\n" + cached.body)
+        os.replace(temporary_path, path)
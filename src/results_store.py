@@ -0,0 +1,190 @@
+import os
+import sqlite3
+import time
+from threading import Lock
+
+from src.constants import RESULTS_PAGE_SIZE, RESULTS_PATH
+
+
+class ResultsStore:
+    # Results of finished analyses: one row per run, one per run, repository and language
+    # with its code and comment lines, one likewise with the repository's share of the
+    # run's totals, and one per run, repository and dependency with the files importing it.
+    # Shares differ from counts under the "once" policy, where a file inherited from a
+    # parent or already counted for another repository counts for its repository but not
+    # for the totals; totals are summed from shares, so they come out as the run's own.
+    # The indexes serve the dashboard queries: the totals of a run, the repositories using
+    # a language or depending on a package, the dependencies of a repository or an owner,
+    # and the totals of an owner across runs. Runs cut short by the rate limit or the
+    # deadline are kept, marked incomplete, and left out of "latest".
+    def __init__(self, path=RESULTS_PATH):
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.lock = Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        with self.lock, self.connection:
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS runs ("
+                "id INTEGER PRIMARY KEY, fetch_mode TEXT NOT NULL, started_at REAL NOT NULL, "
+                "finished_at REAL NOT NULL, complete INTEGER NOT NULL, repos INTEGER NOT NULL)"
+            )
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS run_languages ("
+                "run_id INTEGER NOT NULL, language TEXT NOT NULL, repo TEXT NOT NULL, owner TEXT NOT NULL, "
+                "code INTEGER NOT NULL, comments INTEGER NOT NULL, PRIMARY KEY (run_id, language, repo))"
+            )
+            self.connection.execute("CREATE INDEX IF NOT EXISTS run_languages_owner ON run_languages (owner, run_id)")
+            self.connection.execute("CREATE INDEX IF NOT EXISTS run_languages_repo ON run_languages (repo, run_id)")
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS run_shares ("
+                "run_id INTEGER NOT NULL, language TEXT NOT NULL, repo TEXT NOT NULL, owner TEXT NOT NULL, "
+                "code INTEGER NOT NULL, comments INTEGER NOT NULL, PRIMARY KEY (run_id, language, repo))"
+            )
+            self.connection.execute("CREATE INDEX IF NOT EXISTS run_shares_owner ON run_shares (owner, run_id)")
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS run_dependencies ("
+                "run_id INTEGER NOT NULL, dependency TEXT NOT NULL, language TEXT NOT NULL, repo TEXT NOT NULL, "
+                "owner TEXT NOT NULL, files INTEGER NOT NULL, PRIMARY KEY (run_id, dependency, language, repo))"
+            )
+            self.connection.execute(
+                "CREATE INDEX IF NOT EXISTS run_dependencies_owner ON run_dependencies (owner, run_id)"
+            )
+            self.connection.execute("CREATE INDEX IF NOT EXISTS run_dependencies_repo ON run_dependencies (repo, run_id)")
+
+    def save_run(self, fetch_mode, started_at, complete, repo_counts, repo_dependencies=None,
+                 repo_shares=None):
+        # repo_counts maps a repository's full name to {language: (code, comments)},
+        # repo_dependencies to {(language, dependency): files}, and repo_shares to the part
+        # of its counts in the totals, like repo_counts, which it defaults to
+        with self.lock, self.connection:
+            run_id = self.connection.execute(
+                "INSERT INTO runs (fetch_mode, started_at, finished_at, complete, repos) VALUES (?, ?, ?, ?, ?)",
+                (fetch_mode, started_at, time.time(), complete, len(repo_counts)),
+            ).lastrowid
+            self.connection.executemany(
+                "INSERT INTO run_languages (run_id, language, repo, owner, code, comments) VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    (run_id, language, repo, repo.split("/", 1)[0], code_lines, comment_lines)
+                    for repo, counts in repo_counts.items()
+                    for language, (code_lines, comment_lines) in counts.items()
+                ),
+            )
+            self.connection.executemany(
+                "INSERT INTO run_shares (run_id, language, repo, owner, code, comments) VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    (run_id, language, repo, repo.split("/", 1)[0], code_lines, comment_lines)
+                    for repo, counts in (repo_counts if repo_shares is None else repo_shares).items()
+                    for language, (code_lines, comment_lines) in counts.items()
+                ),
+            )
+            self.connection.executemany(
+                "INSERT INTO run_dependencies (run_id, dependency, language, repo, owner, files) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    (run_id, dependency, language, repo, repo.split("/", 1)[0], files)
+                    for repo, dependencies in (repo_dependencies or {}).items()
+                    for (language, dependency), files in dependencies.items()
+                ),
+            )
+        return run_id
+
+    def runs(self, limit=RESULTS_PAGE_SIZE, before=None):
+        # Newest first; pass the last id seen as before for the next page
+        with self.lock:
+            rows = self.connection.execute(
+                "SELECT id, fetch_mode, started_at, finished_at, complete, repos FROM runs "
+                "WHERE id < ? ORDER BY id DESC LIMIT ?",
+                (before if before is not None else 2 ** 63 - 1, limit),
+            ).fetchall()
+        return [self.run_row(row) for row in rows]
+
+    def run(self, run_id):
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT id, fetch_mode, started_at, finished_at, complete, repos FROM runs WHERE id = ?", (run_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            languages = self.connection.execute(
+                "SELECT repo, language FROM run_languages WHERE run_id = ?", (run_id,)
+            ).fetchall()
+            totals = self.connection.execute(
+                "SELECT language, SUM(code), SUM(comments) FROM run_shares WHERE run_id = ? GROUP BY language",
+                (run_id,),
+            ).fetchall()
+        total_lines = {
+            language: {"code": code_lines, "comments": comment_lines} for language, code_lines, comment_lines in totals
+        }
+        repos_languages = {}
+        for repo, language in languages:
+            repos_languages.setdefault(repo, []).append(language)
+        return {**self.run_row(row), "total_lines": total_lines, "repos_languages": repos_languages}
+
+    def latest_run_id(self):
+        with self.lock:
+            row = self.connection.execute("SELECT MAX(id) FROM runs WHERE complete").fetchone()
+        return row[0]
+
+    def repos_using(self, language, run_id):
+        with self.lock:
+            rows = self.connection.execute(
+                "SELECT repo, code, comments FROM run_languages WHERE run_id = ? AND language = ? ORDER BY code DESC",
+                (run_id, language),
+            ).fetchall()
+        return [{"repo": repo, "code": code_lines, "comments": comment_lines} for repo, code_lines, comment_lines in rows]
+
+    def repos_depending_on(self, dependency, run_id, language=None):
+        with self.lock:
+            rows = self.connection.execute(
+                "SELECT repo, language, files FROM run_dependencies WHERE run_id = ? AND dependency = ? "
+                "AND (? IS NULL OR language = ?) ORDER BY files DESC",
+                (run_id, dependency, language, language),
+            ).fetchall()
+        return [{"repo": repo, "language": language, "files": files} for repo, language, files in rows]
+
+    def repo_dependencies(self, repo, run_id):
+        with self.lock:
+            rows = self.connection.execute(
+                "SELECT dependency, language, files FROM run_dependencies WHERE run_id = ? AND repo = ? "
+                "ORDER BY files DESC, dependency",
+                (run_id, repo),
+            ).fetchall()
+        return [{"dependency": dependency, "language": language, "files": files} for dependency, language, files in rows]
+
+    def owner_dependencies(self, owner, run_id):
+        # Dependencies across one owner's repositories, with how many of them use each
+        with self.lock:
+            rows = self.connection.execute(
+                "SELECT dependency, language, COUNT(*), SUM(files) FROM run_dependencies "
+                "WHERE run_id = ? AND owner = ? GROUP BY dependency, language ORDER BY COUNT(*) DESC, dependency",
+                (run_id, owner),
+            ).fetchall()
+        return [
+            {"dependency": dependency, "language": language, "repos": repos, "files": files}
+            for dependency, language, repos, files in rows
+        ]
+
+    def owner_history(self, owner, limit=RESULTS_PAGE_SIZE):
+        # Language totals of one owner's repositories in each of the last runs that covered
+        # them: their shares, so a file counted in the run's totals once is counted here once
+        with self.lock:
+            rows = self.connection.execute(
+                "SELECT runs.id, runs.finished_at, language, SUM(code), SUM(comments) FROM run_shares "
+                "JOIN runs ON runs.id = run_shares.run_id "
+                "WHERE owner = ? AND run_id IN "
+                "(SELECT DISTINCT run_id FROM run_shares WHERE owner = ? ORDER BY run_id DESC LIMIT ?) "
+                "GROUP BY runs.id, language ORDER BY runs.id",
+                (owner, owner, limit),
+            ).fetchall()
+        history = {}
+        for run_id, finished_at, language, code_lines, comment_lines in rows:
+            entry = history.setdefault(run_id, {"run_id": run_id, "finished_at": finished_at, "total_lines": {}})
+            entry["total_lines"][language] = {"code": code_lines, "comments": comment_lines}
+        return list(history.values())
+
+    @staticmethod
+    def run_row(row):
+        run_id, fetch_mode, started_at, finished_at, complete, repos = row
+        return {"run_id": run_id, "fetch_mode": fetch_mode, "started_at": started_at, "finished_at": finished_at,
+                "complete": bool(complete), "repos": repos}
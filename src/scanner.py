@@ -0,0 +1,517 @@
+import re
+
+from src.dependencies import DEPENDENCY_PATTERNS
+
+# Line counter shared by every language, driven by the SYNTAX table below.
+#
+# A line counts as code if any part of it lies outside comments and as a comment if it only
+# holds comment text; blank lines are not counted. The raw bytes are scanned without being
+# decoded: every delimiter is ASCII, and UTF-8 never puts ASCII bytes inside a multi-byte
+# character. The non-blank lines are stripped by bytes methods mapped over the whole file
+# and joined back, each after a LINE_START, so no Python code runs per line and what a
+# line starts with is found by counting LINE_START plus a prefix. That is enough as long
+# as nothing on a line is hidden by a comment, which is why block comments, and strings
+# that can span lines, are rewritten in the joined lines before counting: the comments a
+# line starts with are dropped, and the line with them when nothing else is on it, so
+# the lines that are gone, and those starting with a line comment, are comment lines.
+# A comment after code only goes when it spans lines, taking their newlines with it, and
+# string text becomes code. Regex substitutions do all of this for the comments starting
+# a line; only an opener after something else on its line and not closed on it, which a
+# string or line comment before it may hide, needs CommentScan, which walks that stretch
+# in Python and rewrites a comment of any length with a single slice.
+#
+# count_chunks gives the same counts for a source that arrives in chunks, holding about
+# SEGMENT_BYTES at a time: it counts segments of whole lines, carrying over the partial
+# last line and any comment or string still open at the end of a segment. CommentScan
+# picks such a span up at the start of the next segment and rewrites it up to its closer,
+# just as it would have in the whole source. A single line is never split, so memory is
+# bounded by the longest line rather than by the size of the file.
+#
+# scan_lines and scan_chunks also give the dependencies the source imports, matched by the
+# patterns of src/dependencies.py against the lines just counted, minus the comment lines,
+# so imports cost no second pass over the raw source. An import a segment leaves
+# unfinished, like a Go import block, is matched again along with the next segment.
+#
+# Differences from the old per-language parse_*_file methods, all intentional:
+#   - block comments are found anywhere on a line, and code before a block comment or
+#     after its closer makes the line a code line (the old parsers only noticed blocks
+#     opening at the start of a line and counted every line they touched as comments);
+#   - comment markers inside string literals are ignored;
+#   - lines of multi-line strings (backticks, triple quotes) are code even when they look
+#     like comments;
+#   - blank lines inside block comments are not counted (HTML, CSS, Ruby and Lua used to);
+#   - a Python triple-quoted string is a comment only when nothing precedes it on its
+#     line, and a one-line docstring no longer flips the rest of the file into a comment;
+#   - Lua block comments close at "]]" and Ruby "=begin" must start a line, as in the languages;
+#   - files that aren't valid UTF-8 are counted instead of raising UnicodeDecodeError.
+# Regex literals in JavaScript and Perl are not recognised and are scanned as plain code.
+
+# line: line comment prefixes
+# block: (opener, closer) pairs of block comments
+# strings: single-line string quotes, so comment markers inside strings are skipped
+# multiline_strings: string delimiters that may span lines
+# docstrings: multi-line strings that count as comments when nothing precedes them on their line
+C_LIKE = {"line": ("//",), "block": (("/*", "*/"),), "strings": ('"', "'")}
+SYNTAX = {
+    "Python": {"line": ("#",), "strings": ('"', "'"), "docstrings": ('"""', "'''")},
+    "JavaScript": {"line": ("//",), "block": (("/*", "*/"),), "strings": ('"', "'"), "multiline_strings": ("`",)},
+    "TypeScript": {"line": ("//",), "block": (("/*", "*/"),), "strings": ('"', "'"), "multiline_strings": ("`",)},
+    "C": C_LIKE,
+    "C++": C_LIKE,
+    "C#": C_LIKE,
+    "Java": {"line": ("//",), "block": (("/*", "*/"),), "strings": ('"', "'"), "multiline_strings": ('"""',)},
+    "Go": {"line": ("//",), "block": (("/*", "*/"),), "strings": ('"', "'"), "multiline_strings": ("`",)},
+    "Rust": {"line": ("//",), "block": (("/*", "*/"),), "strings": ('"',)},  # ' also starts lifetimes
+    "Swift": {"line": ("//",), "block": (("/*", "*/"),), "strings": ('"',), "multiline_strings": ('"""',)},
+    "PHP": {"line": ("//", "#"), "block": (("/*", "*/"),), "strings": ('"', "'")},
+    "CSS": {"block": (("/*", "*/"),), "strings": ('"', "'")},
+    "SQL": {"line": ("--",), "block": (("/*", "*/"),), "strings": ("'", '"')},
+    "Lua": {"line": ("--",), "block": (("--[[", "]]"),), "strings": ('"', "'")},
+    "HTML": {"block": (("<!--", "-->"),)},
+    "Ruby": {"line": ("#",), "block": (("=begin", "=end"),), "block_at_line_start": True, "strings": ('"', "'")},
+    # Without block comments or multi-line strings a line is classified by how it starts,
+    # so these need no string handling
+    "Shell": {"line": ("#",)},
+    "Perl": {"line": ("#",)},
+    "R": {"line": ("#",)},
+}
+
+LINE_START = b"\x00"  # put before every counted line, so that what a line starts with can be counted
+LINE = b"\n" + LINE_START
+COLUMN_ZERO = b"\x01"  # stands in for the first byte of a delimiter that must start a line
+# Bytes the scanner puts in the source never come from it: the rare file holding them reads them as code
+AS_SOURCE = bytes.maketrans(LINE_START + COLUMN_ZERO, b"??")
+AS_CODE = bytes(byte if byte in b"\n" else ord("s") for byte in range(256))  # string text, newlines kept
+BLANKS = (b" ", b"\t")
+LINE_ENDS = (b"\n", b"")
+TRAILING_BLANKS = re.compile(rb"[ \t]*")
+BLOCK, STRING, DOCSTRING = "block", "string", "docstring"
+SEGMENT_BYTES = 1024 * 1024  # bytes of whole lines count_chunks counts at a time
+
+
+def quoted(quote, unclosed=True):
+    # A string on one line; an unclosed one runs to the end of the line
+    return re.escape(quote) + string_rest(quote) + (b"?" if unclosed else b"")
+
+
+def string_rest(quote, end=None):
+    # What follows the opening quote of a string on one line, up to its closing quote, or to
+    # the pattern end instead when given
+    q = re.escape(quote)
+    return b"[^" + q + b"\\\\\\n]*(?:\\\\.[^" + q + b"\\\\\\n]*)*" + (q if end is None else end)
+
+
+def closed_by(opener, closer, within=b""):
+    # A comment from opener to the first closer, not crossing the bytes in within. Matching
+    # up to the first byte of the closer at a time is faster than a lazy .*? trying the
+    # closer after every byte.
+    first, rest = re.escape(closer[:1]), re.escape(closer[1:])
+    other = b"[^" + first + re.escape(within) + b"]*"
+    return re.escape(opener) + other + b"(?:" + first + b"(?!" + rest + b")" + other + b")*" + re.escape(closer)
+
+
+def counted_lines(source):
+    # The non-blank lines of source, stripped and joined each after a LINE, and how many there are
+    lines = list(filter(None, map(bytes.strip, source.split(b"\n"))))
+    lines.insert(0, b"")
+    return LINE.join(lines), len(lines) - 1
+
+
+class CompiledSyntax:
+    def __init__(self, syntax, dependencies=None):
+        self.line = tuple(prefix.encode() for prefix in syntax.get("line", ()))
+        self.line_starts = tuple(LINE_START + prefix for prefix in self.line)
+        self.dependencies = dependencies  # DependencyPattern of the language, if it has one
+        # Line comments, dropped from the counted lines before dependencies are matched
+        self.comment_lines = (
+            re.compile(b"\n(?:" + b"|".join(map(re.escape, self.line)) + b")[^\n]*") if self.line else None
+        )
+        # Block delimiters that must start a line are told apart from the same bytes
+        # elsewhere before lines are stripped, by swapping their first byte for COLUMN_ZERO
+        self.column_zero = []
+        self.kinds = {}
+        self.closers = {}
+        for opener, closer in syntax.get("block", ()):
+            opener, closer = opener.encode(), closer.encode()
+            if syntax.get("block_at_line_start", False):
+                self.column_zero += [(b"\n" + delimiter, b"\n" + COLUMN_ZERO + delimiter[1:])
+                                     for delimiter in (opener, closer)]
+                opener, closer = COLUMN_ZERO + opener[1:], LINE + COLUMN_ZERO + closer[1:]
+            self.kinds[opener], self.closers[opener] = BLOCK, closer
+        for quote in syntax.get("multiline_strings", ()):
+            self.kinds[quote.encode()], self.closers[quote.encode()] = STRING, quote.encode()
+        for quote in syntax.get("docstrings", ()):
+            self.kinds[quote.encode()], self.closers[quote.encode()] = DOCSTRING, quote.encode()
+        # Openers of comments and strings that can span lines
+        self.openers = tuple(self.kinds)
+        self.comment_openers = tuple(opener for opener, kind in self.kinds.items() if kind is not STRING)
+
+        quotes = syntax.get("strings", ()) + syntax.get("multiline_strings", ()) + syntax.get("docstrings", ())
+        quotes = sorted({quote.encode() for quote in quotes}, key=len, reverse=True)
+        # What can hide an opener: a string or line comment earlier on the same line
+        hiders = [re.escape(prefix) + b"[^\\n]*" for prefix in self.line] + [quoted(quote) for quote in quotes]
+        self.hiders = re.compile(b"|".join(hiders)) if hiders else None
+        first_bytes = {hider[:1] for hider in self.line + tuple(quotes)}
+        self.may_hide = re.compile(b"[" + re.escape(b"".join(sorted(first_bytes))) + b"]") if hiders else None
+
+        # The comments starting a line are dropped by one regex substitution, along with the
+        # comments closed on that line after them and the blanks between, leaving the line
+        # starting with whatever follows, or gone along with its newline. A comment starting a line can only be
+        # hidden by a string or comment opened on an earlier line, whose opener is left in
+        # place for CommentScan. Comments after something else on their line are kept when
+        # they are closed on it: the line is code whatever they hold.
+        # Docstrings are comments only where they start a line, like blocks that must.
+        first, then = [], []
+        for opener, kind in self.kinds.items():
+            closer = self.closers[opener]
+            if kind is not STRING:
+                first.append(re.escape(opener) + b"(?<=" + re.escape(LINE_START + opener) + b")"
+                             + closed_by(b"", closer))
+            if kind is DOCSTRING:
+                then.append(quoted(opener, unclosed=False))
+            elif kind is BLOCK and not self.column_zero:
+                then.append(closed_by(opener, closer, within=b"\n"))
+        self.comments = None
+        if first:
+            self.comments = re.compile(b"(?:" + b"|".join(first) + b")[ \t]*"
+                                       + (b"(?:(?:" + b"|".join(then) + b")[ \t]*)*" if then else b"")
+                                       + b"(?:" + re.escape(LINE) + b")?")
+        # Comments closed after something else on their line, blanked out before dependencies
+        # are matched
+        self.inline_comments = re.compile(b"|".join(then)) if then else None
+        # Template literals, text blocks and triple-quoted strings closed on their first line
+        # are plain code
+        one_line_strings = [
+            quoted(quote.encode(), unclosed=False)
+            for quote in syntax.get("multiline_strings", ()) + syntax.get("docstrings", ())
+        ]
+        self.one_line_strings = re.compile(b"|".join(one_line_strings)) if one_line_strings else None
+        # Openers the substitutions may get wrong: of comments opened after something else
+        # on their line and of strings, when they aren't closed on their line. One pattern
+        # per opener, as re only looks for the literal prefix of a single one quickly.
+        left = []
+        for opener, kind in self.kinds.items():
+            closer = self.closers[opener]
+            if kind is STRING:
+                left.append(re.escape(opener) + b"(?!" + string_rest(closer) + b")")
+                continue
+            if not self.column_zero:
+                closed = string_rest(closer) if kind is DOCSTRING else closed_by(b"", closer, within=b"\n")
+                left.append(re.escape(opener) + b"(?<!" + re.escape(LINE_START + opener) + b")(?!" + closed + b")")
+        self.left_openers = tuple(map(re.compile, left))
+        if left:
+            # A line whose openers are all hidden, by a string or line comment opened before
+            # them or a comment starting the line, read from its start to its end. Its tokens
+            # can each be read one way only, and the plain text between them is matched whole,
+            # so backtracking neither finds a wrong reading nor takes exponential time. A
+            # line holding a closer never is, as it may close a comment starting an earlier
+            # line, and what it hides is known only then.
+            stops = sorted(set(self.openers) | set(self.line), key=len, reverse=True)
+            stop_bytes = {stop[:1] for stop in stops}
+            quote_bytes = {quote[:1] for quote in quotes}
+            plain = b"[^\\n" + re.escape(b"".join(sorted(stop_bytes | quote_bytes))) + b"]*"
+            tokens = [closed_by(opener, self.closers[opener], within=b"\n") if kind is BLOCK
+                       else quoted(opener, unclosed=False) for opener, kind in self.kinds.items()]
+            stopped = b"(?!" + b"|".join(map(re.escape, stops)) + b")"
+            tokens += [stopped + re.escape(quote) + string_rest(quote, b"(?:" + re.escape(quote) + b"|(?=\\n|\\Z))")
+                       for quote in quotes if quote not in self.kinds]
+            if stop_bytes - quote_bytes:
+                tokens.append(stopped + b"[" + re.escape(b"".join(sorted(stop_bytes - quote_bytes))) + b"]")
+            comments = self.comment_openers
+            hidden_line = plain + b"(?:(?:" + b"|".join(tokens) + b")" + plain + b")*(?:(?=\\n|\\Z)"
+            if self.line:
+                hidden_line += (b"|(?!" + b"|".join(map(re.escape, self.openers)) + b")(?:"
+                                + b"|".join(map(re.escape, self.line)) + b")[^\\n]*")
+            hidden_line += b")"
+            if comments:
+                hidden_line = (b"(?![^\\n]*(?:" + b"|".join(re.escape(self.closers[opener]) for opener in comments)
+                               + b"))(?:(?:" + b"|".join(map(re.escape, comments)) + b")[^\\n]*|" + hidden_line + b")")
+            self.hidden_line = re.compile(hidden_line)
+
+    def count_lines(self, source):
+        code_lines, comment_lines, _, _ = self.count_segment(source)
+        return code_lines, comment_lines
+
+    def scan_lines(self, source):
+        dependencies = set()
+        code_lines, comment_lines, _, _ = self.count_segment(source, dependencies=dependencies)
+        return code_lines, comment_lines, tuple(sorted(dependencies))
+
+    def scan_chunks(self, chunks):
+        dependencies = set()
+        code_lines, comment_lines = self.count_chunks(chunks, dependencies)
+        return code_lines, comment_lines, tuple(sorted(dependencies))
+
+    def count_chunks(self, chunks, dependencies=None):
+        code_lines = comment_lines = 0
+        open_span = None  # (closer, kind) of a comment or string left open by the last segment
+        unfinished = b""  # the lines of an import the last segment left unfinished
+        buffer = bytearray()
+        for chunk in chunks:
+            buffer += chunk
+            if len(buffer) < SEGMENT_BYTES:
+                continue
+            cut = buffer.rfind(b"\n") + 1
+            if cut == 0:
+                continue  # one long line so far
+            segment = bytes(buffer[:cut])
+            del buffer[:cut]
+            segment_code, segment_comments, open_span, unfinished = self.count_segment(
+                segment, open_span, dependencies, unfinished)
+            code_lines, comment_lines = code_lines + segment_code, comment_lines + segment_comments
+        segment_code, segment_comments, _, _ = self.count_segment(bytes(buffer), open_span, dependencies, unfinished)
+        return code_lines + segment_code, comment_lines + segment_comments
+
+    def count_segment(self, source, open_span=None, dependencies=None, unfinished=None):
+        # (code_lines, comment_lines, open_span, unfinished) of source, which starts inside
+        # open_span when one is given; the open_span returned is what is left open at the end
+        # of source. dependencies, a set, gets what source imports when given. unfinished is
+        # given when more segments follow, as the lines of an import the last one left
+        # unfinished, matched again with those of source; the unfinished returned is then
+        # those source leaves.
+        if LINE_START in source or COLUMN_ZERO in source:
+            source = source.translate(AS_SOURCE)
+        if self.column_zero:
+            source = b"\n" + source
+            for delimiter, at_column_zero in self.column_zero:
+                source = source.replace(delimiter, at_column_zero)
+        text, lines = counted_lines(source)
+        if not lines:
+            return 0, 0, open_span, unfinished
+        comment_lines = 0
+        if open_span is not None or any(opener in text for opener in self.openers):
+            text, open_span = self.rewrite(text, open_span)
+            # The lines that held nothing but comments are gone, but for the last one, left empty
+            comment_lines = lines - text.count(b"\n") + text.endswith(LINE_START)
+        comment_lines += sum(text.count(prefix) for prefix in self.line_starts)
+        if (dependencies is not None and self.dependencies is not None
+                and (unfinished or self.dependencies.present(text))):
+            text = text.replace(LINE, b"\n")
+            if self.inline_comments is not None:
+                text = self.inline_comments.sub(b" ", text)
+            text = (unfinished or b"") + (self.comment_lines.sub(b"", text) if self.line else text)
+            self.dependencies.find(text, dependencies)
+            if unfinished is not None:
+                unfinished = self.dependencies.unfinished_tail(text)
+        return lines - comment_lines, comment_lines, open_span, unfinished
+
+    def rewrite(self, text, open_span):
+        # (text, open_span) with the comments of text dropped and its multi-line strings
+        # turned into code: by the substitutions alone unless left_openers finds an opener
+        # they would leave, and by rewrite_spans otherwise
+        next_found = [pattern.search(text) for pattern in self.left_openers]
+        if open_span is None and self.find_left_opener(text, 0, next_found) is None:
+            return self.substitute(text)
+        return self.rewrite_spans(text, open_span, next_found)
+
+    def find_left_opener(self, text, pos, next_found):
+        # The first match of left_openers from pos on a line that hidden_line doesn't match.
+        # next_found holds the match of each pattern from an earlier position, or None when
+        # it has none left, and is kept up to date.
+        while True:
+            found = None
+            for i, candidate in enumerate(next_found):
+                if candidate is not None and candidate.start() < pos:
+                    candidate = next_found[i] = self.left_openers[i].search(text, pos)
+                if candidate is not None and (found is None or candidate.start() < found.start()):
+                    found = candidate
+            if found is None:
+                return None
+            hidden = self.hidden_line.match(text, text.rfind(b"\n", 0, found.start()) + 1 + len(LINE_START))
+            if hidden is None:
+                return found
+            pos = hidden.end()
+
+    def substitute(self, text):
+        # (text, open_span) rewritten by the substitutions, for text in which left_openers
+        # finds nothing. The only opener they can leave starting a line is then that of a
+        # comment never closed, which runs to the end of text and so comes after any closer
+        # but one overlapping it, as in "/*/".
+        if self.comments is not None:
+            text = self.comments.sub(b"", text)
+        if self.one_line_strings is not None:
+            text = self.one_line_strings.sub(b"s", text)
+        left = []
+        for opener in self.comment_openers:
+            start = text.find(LINE_START + opener, max(text.rfind(self.closers[opener]) - len(LINE_START + opener), 0))
+            if start != -1:
+                left.append((start, opener))
+        if not left:
+            return text, None
+        start, opener = min(left)
+        return text[:start + len(LINE_START)], (self.closers[opener], BLOCK)
+
+    def rewrite_spans(self, text, open_span, next_found):
+        # rewrite for text holding openers find_left_opener finds. The lines before each one
+        # are substituted, and CommentScan walks from its line to the end of the line its span
+        # closes on.
+        scan = CommentScan(self, text)
+        pieces = scan.pieces
+        pos = 0 if open_span is None else scan.walk(0, open_span, to_line_end=True)
+        while pos < len(text):
+            found = self.find_left_opener(text, pos, next_found)
+            stop = len(text) if found is None else text.rfind(b"\n", pos, found.start())
+            rewritten, open_span = self.substitute(text[pos:stop + len(LINE)])
+            if found is None:
+                pieces.append(rewritten)
+                scan.open_span = open_span
+                break
+            if open_span is not None:
+                # The opener found is within a comment starting an earlier line
+                scan.walk(pos)
+                break
+            pieces.append(rewritten)
+            pos = scan.walk(stop + len(LINE), to_line_end=True)
+        return b"".join(pieces), scan.open_span
+
+
+class CommentScan:
+    # Walks the openers in the counted lines of a source in order, adding to pieces a copy of
+    # them with every block comment dropped, as CompiledSyntax.rewrite drops them, and every
+    # multi-line string turned into code.
+    def __init__(self, syntax, source):
+        self.syntax = syntax
+        self.source = source
+        self.next_opener = {opener: source.find(opener) for opener in syntax.openers}
+        self.pieces = []
+        if len(syntax.openers) == 1:
+            # Most languages have a single opener, which bytes.find locates directly
+            self.find_opener = self.find_only_opener
+        self.open_span = None  # (closer, kind) of a span still open at the end of the source
+
+    def walk(self, pos, open_span=None, to_line_end=False):
+        # Adds the source from pos, which starts a line or continues open_span, rewritten to
+        # pieces, up to its end or, with to_line_end, to the first newline no span crosses
+        # after the line pos starts; returns where it stopped.
+        source = self.source
+        find, rfind, count = source.find, source.rfind, source.count
+        kinds, closers = self.syntax.kinds, self.syntax.closers
+        append = self.pieces.append
+        line_end = find(b"\n", pos + 1) if to_line_end else -1
+        blank_until = -1  # where a line stops being blank after the comments dropped from its start
+        if open_span is not None:
+            # The source continues a span opened in an earlier segment, from its first line
+            (closer, kind), start, opener = open_span, len(LINE), b""
+        else:
+            start, opener = self.find_span(pos)
+        while opener is not None and not (-1 < line_end < start):
+            line_start = rfind(b"\n", 0, start) + 2
+            at_line_start = start == line_start or start == blank_until
+            if opener:
+                kind, closer = kinds[opener], closers[opener]
+                if kind is DOCSTRING:
+                    kind = BLOCK if at_line_start else STRING
+            if kind is STRING:
+                end = self.find_string_end(closer, start + len(opener))
+            else:
+                end = find(closer, start + len(opener) if opener else 0)
+                end = end if end == -1 else end + len(closer)
+            if end == -1:
+                end = len(source)
+                self.open_span = closer, kind
+            append(source[pos:start])
+            if kind is STRING:
+                append(source[start:end].translate(AS_CODE))
+            else:
+                if source[end:end + 1] in BLANKS:
+                    end = TRAILING_BLANKS.match(source, end).end()
+                if source[end:end + 1] in LINE_ENDS:
+                    # Nothing follows: a line holding only comments goes, and so do the
+                    # lines of a comment opened after code
+                    end += len(LINE) if at_line_start and end < len(source) else 0
+                elif at_line_start:
+                    blank_until = end
+                elif count(b"\n", start, end):
+                    append(LINE)  # what follows the comment keeps the line it is on
+                    blank_until = end
+            pos = end
+            if to_line_end:
+                line_end = find(b"\n", pos)
+            start, opener = self.find_span(pos)
+        stop = len(source) if line_end == -1 else line_end
+        append(source[pos:stop])
+        return stop
+
+    def find_span(self, pos):
+        # (position, opener) of the first opener at or after pos, the end of the last span,
+        # that no string or line comment hides; (-1, None) if there is none
+        source, may_hide = self.source, self.syntax.may_hide
+        start, opener = self.find_opener(pos)
+        while opener is not None and may_hide is not None:
+            line_start = source.rfind(b"\n", 0, start) + 1
+            segment_start = line_start if line_start > pos else pos
+            if segment_start >= start or not may_hide.search(source, segment_start, start):
+                break
+            hidden_until = self.hidden_until(segment_start, start)
+            if hidden_until is None:
+                break
+            start, opener = self.find_opener(hidden_until)
+        return start, opener
+
+    def find_only_opener(self, pos):
+        opener = self.syntax.openers[0]
+        found = self.next_opener[opener] if pos == 0 else self.source.find(opener, pos)
+        return found, opener if found != -1 else None
+
+    def find_opener(self, pos):
+        # Earliest opener at or after pos, as (position, opener)
+        first, first_opener = -1, None
+        for opener, found in self.next_opener.items():
+            if -1 < found < pos:
+                found = self.next_opener[opener] = self.source.find(opener, pos)
+            if found != -1 and (first_opener is None or found < first or
+                                (found == first and len(opener) > len(first_opener))):
+                first, first_opener = found, opener
+        return first, first_opener
+
+    def hidden_until(self, segment_start, start):
+        # Where the string or line comment hiding the opener at start ends, if one does
+        for hider in self.syntax.hiders.finditer(self.source, segment_start):
+            if hider.start() >= start:
+                return None
+            if hider.end() > start:
+                return hider.end()
+        return None
+
+    def find_string_end(self, quote, pos):
+        # End of the string opened just before pos, skipping escaped quotes; -1 if it isn't closed
+        source = self.source
+        while True:
+            found = source.find(quote, pos)
+            if found == -1:
+                return -1
+            escape = found
+            while escape > pos and source[escape - 1] == 0x5c:  # backslash
+                escape -= 1
+            if (found - escape) % 2 == 0:
+                return found + len(quote)
+            pos = found + 1
+
+
+COMPILED_SYNTAX = {
+    language: CompiledSyntax(syntax, DEPENDENCY_PATTERNS.get(language)) for language, syntax in SYNTAX.items()
+}
+
+
+def count_lines(source, language):
+    """Return (code_lines, comment_lines) for the raw source of a supported language."""
+    return COMPILED_SYNTAX[language].count_lines(source)
+
+
+def count_chunks(chunks, language):
+    """Return count_lines(b"".join(chunks), language), reading the chunks as a stream."""
+    return COMPILED_SYNTAX[language].count_chunks(chunks)
+
+
+def scan_lines(source, language):
+    """Return (code_lines, comment_lines, dependencies) for the raw source of a supported language.
+
+    dependencies is the sorted tuple of the names the source imports, as src/dependencies.py
+    finds them.
+    """
+    return COMPILED_SYNTAX[language].scan_lines(source)
+
+
+def scan_chunks(chunks, language):
+    """Return scan_lines(b"".join(chunks), language), reading the chunks as a stream."""
+    return COMPILED_SYNTAX[language].scan_chunks(chunks)
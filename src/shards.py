@@ -0,0 +1,258 @@
+import argparse
+import asyncio
+import datetime
+import json
+import logging
+import multiprocessing
+import os
+import socket
+import sqlite3
+import time
+from contextlib import contextmanager
+from threading import Lock
+
+from src.async_grimoire import AsyncCodeGrimoire, RepoInfo
+from src.blob_cache import BlobCache
+from src.constants import (ANALYSIS_TIME_BUDGET, DEFAULT_MAX_REPOS, DEFAULT_MAX_REQUESTS, FETCH_MODES, PARSE_POOL_SIZE,
+                           SHARD_LEASE, SHARD_MAX_ATTEMPTS, SHARD_QUEUE_PATH, SHARD_SIZE, SHARED_CODE,
+                           SHARED_CODE_POLICIES)
+from src.snapshots import SnapshotStore
+
+
+def repo_to_json(repo):
+    return {**repo._asdict(), "pushed_at": repo.pushed_at.isoformat() if repo.pushed_at else None}
+
+
+def repo_from_json(data):
+    pushed_at = data["pushed_at"]
+    return RepoInfo(**{**data, "pushed_at": datetime.datetime.fromisoformat(pushed_at) if pushed_at else None})
+
+
+class ShardQueue:
+    # Work queue of an analysis split into shards, in one SQLite file that every worker
+    # opens. Claims are made in IMMEDIATE transactions, so two workers never get the same
+    # shard. Workers on other hosts can share the file over a network filesystem as long
+    # as it honors SQLite's locks. Finished shards keep their partial results there for
+    # merge_results.
+    def __init__(self, path=SHARD_QUEUE_PATH):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.lock = Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False, timeout=60, isolation_level=None)
+        with self.lock:
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS shards ("
+                "id INTEGER PRIMARY KEY, repos TEXT NOT NULL, state TEXT NOT NULL DEFAULT 'pending', "
+                "worker TEXT, lease_until REAL, attempts INTEGER NOT NULL DEFAULT 0, result TEXT)"
+            )
+
+    @contextmanager
+    def transaction(self):
+        # BEGIN IMMEDIATE takes the write lock up front, which makes a claim atomic
+        self.connection.execute("BEGIN IMMEDIATE")
+        try:
+            yield self.connection
+        except BaseException:
+            self.connection.execute("ROLLBACK")
+            raise
+        self.connection.execute("COMMIT")
+
+    def enqueue(self, repos, shard_size=SHARD_SIZE):
+        # Repositories go in largest first, so the longest shards are claimed first
+        repos = sorted(repos, key=lambda repo: repo.size or 0, reverse=True)
+        shards = [repos[start:start + shard_size] for start in range(0, len(repos), shard_size)]
+        with self.lock, self.transaction() as connection:
+            connection.executemany(
+                "INSERT INTO shards (repos) VALUES (?)",
+                ((json.dumps([repo_to_json(repo) for repo in shard]),) for shard in shards),
+            )
+        return len(shards)
+
+    def claim(self, worker):
+        # (shard id, repos) of a pending shard, or of one whose lease ran out; None when none is left
+        with self.lock, self.transaction() as connection:
+            row = connection.execute(
+                "SELECT id, repos FROM shards WHERE state = 'pending' OR (state = 'claimed' AND lease_until < ?) "
+                "ORDER BY id LIMIT 1",
+                (time.time(),),
+            ).fetchone()
+            if row is None:
+                return None
+            connection.execute(
+                "UPDATE shards SET state = 'claimed', worker = ?, lease_until = ?, attempts = attempts + 1 "
+                "WHERE id = ?",
+                (worker, time.time() + SHARD_LEASE, row[0]),
+            )
+        return row[0], [repo_from_json(repo) for repo in json.loads(row[1])]
+
+    def renew(self, shard_id, worker):
+        with self.lock:
+            self.connection.execute(
+                "UPDATE shards SET lease_until = ? WHERE id = ? AND worker = ? AND state = 'claimed'",
+                (time.time() + SHARD_LEASE, shard_id, worker),
+            )
+
+    def complete(self, shard_id, worker, result):
+        with self.lock:
+            self.connection.execute(
+                "UPDATE shards SET state = 'done', result = ? WHERE id = ? AND worker = ?",
+                (json.dumps(result), shard_id, worker),
+            )
+
+    def release(self, shard_id, worker, failed=True):
+        # Hands a shard back, or gives up on it after SHARD_MAX_ATTEMPTS failed runs. Every
+        # claim counts as an attempt, so that a worker dying mid-shard counts too; a run that
+        # didn't fail, but was cut short by the rate limit, takes its attempt back.
+        with self.lock:
+            self.connection.execute(
+                "UPDATE shards SET attempts = attempts - ?, "
+                "state = CASE WHEN attempts - ? >= ? THEN 'failed' ELSE 'pending' END, "
+                "worker = NULL, lease_until = NULL WHERE id = ? AND worker = ?",
+                (not failed, not failed, SHARD_MAX_ATTEMPTS, shard_id, worker),
+            )
+
+    def progress(self):
+        with self.lock:
+            rows = self.connection.execute("SELECT state, COUNT(*) FROM shards GROUP BY state").fetchall()
+        return dict(rows)
+
+    def results(self):
+        with self.lock:
+            rows = self.connection.execute("SELECT result FROM shards WHERE state = 'done' ORDER BY id").fetchall()
+        return [json.loads(result) for result, in rows]
+
+
+def merge_results(results):
+    # Reduces the partial results of the shards into one, as a single analysis reports
+    # it. Shards are added in id order, so the result doesn't depend on which worker
+    # finished first.
+    merged = {"total_lines": {}, "repos_languages": {}, "repos_dependencies": {}, "truncated_repos": {},
+              "skipped_files": {}}
+    for result in results:
+        for language, counts in result["total_lines"].items():
+            totals = merged["total_lines"].setdefault(language, {"code": 0, "comments": 0})
+            totals["code"] += counts["code"]
+            totals["comments"] += counts["comments"]
+        for repo, languages in result["repos_languages"].items():
+            merged["repos_languages"].setdefault(repo, set()).update(languages)
+        for repo, dependencies in result.get("repos_dependencies", {}).items():
+            merged["repos_dependencies"].setdefault(repo, set()).update(dependencies)
+        merged["truncated_repos"].update(result.get("truncated_repos", {}))
+        for reason, count in result.get("skipped_files", {}).items():
+            merged["skipped_files"][reason] = merged["skipped_files"].get(reason, 0) + count
+    merged["repos_languages"] = {repo: sorted(languages) for repo, languages in merged["repos_languages"].items()}
+    merged["repos_dependencies"] = {
+        repo: sorted(dependencies) for repo, dependencies in merged["repos_dependencies"].items()
+    }
+    return merged
+
+
+async def list_targets(token, orgs, users):
+    return await AsyncCodeGrimoire(token, orgs=orgs, users=users).list_repos()
+
+
+async def run_shards(queue, worker, tokens, fetch_mode, max_repos, max_requests, parse_workers,
+                     shared_code=SHARED_CODE, time_budget=ANALYSIS_TIME_BUDGET):
+    # Claims and analyzes shards until none is left. A shard cut short by the rate limit is
+    # handed back for another worker, or a later run, and this worker stops. time_budget
+    # bounds each shard, whose repositories left unfinished are reported truncated, and
+    # shared_code applies within a shard: under "once", a blob in two shards counts in both.
+    blob_cache, snapshot_store = BlobCache(), SnapshotStore()
+    while (claimed := queue.claim(worker)) is not None:
+        shard_id, repos = claimed
+        logging.info(f"{worker} analyzing shard {shard_id} ({len(repos)} repositories)")
+        grimoire = AsyncCodeGrimoire(tokens[0], blob_cache=blob_cache, snapshot_store=snapshot_store,
+                                     max_repos=max_repos, max_requests=max_requests, parse_workers=parse_workers,
+                                     extra_tokens=tokens[1:], shared_code=shared_code, time_budget=time_budget)
+        analysis = asyncio.create_task(grimoire.analyze_repos(fetch_mode, repos=repos))
+        try:
+            while not analysis.done():
+                await asyncio.wait({analysis}, timeout=SHARD_LEASE / 3)
+                queue.renew(shard_id, worker)
+            result = analysis.result()
+        except Exception:
+            logging.exception(f"Shard {shard_id} failed")
+            queue.release(shard_id, worker)
+            continue
+        if "Rate Limit Hit" in result.get("progress", {}).values():
+            queue.release(shard_id, worker, failed=False)
+            logging.warning(f"{worker} is out of rate limit; stopping")
+            return
+        queue.complete(shard_id, worker, {
+            "total_lines": result["total_lines"],
+            "repos_languages": {repo: sorted(languages) for repo, languages in result["repos_languages"].items()},
+            "repos_dependencies": result["repos_dependencies"],
+            "truncated_repos": result["truncated_repos"],
+            "skipped_files": result["skipped_files"],
+        })
+
+
+def work(queue_path, tokens, fetch_mode, max_repos, max_requests, parse_workers, shared_code, time_budget):
+    # Entry point of a worker process
+    worker = f"{socket.gethostname()}:{os.getpid()}"
+    asyncio.run(run_shards(ShardQueue(queue_path), worker, tokens, fetch_mode, max_repos, max_requests,
+                           parse_workers, shared_code, time_budget))
+
+
+def run_workers(queue_path, processes, tokens, fetch_mode="trees", max_repos=DEFAULT_MAX_REPOS,
+                max_requests=DEFAULT_MAX_REQUESTS, parse_workers=None, shared_code=SHARED_CODE,
+                time_budget=ANALYSIS_TIME_BUDGET):
+    parse_workers = parse_workers or max(1, PARSE_POOL_SIZE // processes)
+    context = multiprocessing.get_context("spawn")
+    workers = [
+        context.Process(target=work, args=(queue_path, tokens, fetch_mode, max_repos, max_requests, parse_workers,
+                                           shared_code, time_budget))
+        for _ in range(processes)
+    ]
+    for process in workers:
+        process.start()
+    for process in workers:
+        process.join()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m src.shards",
+        description="Analyze organizations or users at scale: enqueue their repositories in shards, run workers "
+                    "(on this host or others sharing the queue file), then merge the shards' results.",
+    )
+    parser.add_argument("--queue", default=SHARD_QUEUE_PATH, help="path of the SQLite work queue")
+    commands = parser.add_subparsers(dest="command", required=True)
+    enqueue = commands.add_parser("enqueue", help="list the repositories of orgs and users into shards")
+    enqueue.add_argument("--org", action="append", default=[])
+    enqueue.add_argument("--user", action="append", default=[])
+    enqueue.add_argument("--shard-size", type=int, default=SHARD_SIZE)
+    work_command = commands.add_parser("work", help="run worker processes until the queue is drained")
+    work_command.add_argument("--processes", type=int, default=1)
+    work_command.add_argument("--fetch-mode", choices=FETCH_MODES, default="trees")
+    work_command.add_argument("--max-repos", type=int, default=DEFAULT_MAX_REPOS)
+    work_command.add_argument("--max-requests", type=int, default=DEFAULT_MAX_REQUESTS)
+    work_command.add_argument("--parse-workers", type=int)
+    work_command.add_argument("--shared-code", choices=SHARED_CODE_POLICIES, default=SHARED_CODE)
+    work_command.add_argument("--time-budget", type=float, default=ANALYSIS_TIME_BUDGET,
+                              help="seconds each shard may take before it stops and reports what it has; 0 for "
+                                   "no deadline")
+    commands.add_parser("status", help="count the shards in each state")
+    commands.add_parser("merge", help="print the merged results of the finished shards as JSON")
+    args = parser.parse_args(argv)
+
+    # TOKEN reads private repositories; EXTRA_TOKENS add quota for public ones
+    tokens = [token for token in [os.getenv("TOKEN"), *os.getenv("EXTRA_TOKENS", "").split(",")] if token]
+    queue = ShardQueue(args.queue)
+    if args.command == "enqueue":
+        if not args.org and not args.user:
+            parser.error("enqueue needs at least one --org or --user")
+        repos = asyncio.run(list_targets(tokens[0], args.org, args.user))
+        print(f"Enqueued {len(repos)} repositories in {queue.enqueue(repos, args.shard_size)} shards")
+    elif args.command == "work":
+        run_workers(args.queue, args.processes, tokens, args.fetch_mode, args.max_repos, args.max_requests,
+                    args.parse_workers, args.shared_code, args.time_budget or None)
+        print(json.dumps(queue.progress()))
+    elif args.command == "status":
+        print(json.dumps(queue.progress()))
+    else:
+        print(json.dumps({**merge_results(queue.results()), "shards": queue.progress()}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+import os
+import sqlite3
+import time
+from collections import namedtuple
+from threading import Lock
+
+from src.constants import SNAPSHOT_PATH
+
+Snapshot = namedtuple("Snapshot", ["head_sha", "pushed_at"])
+
+
+class SnapshotStore:
+    # Last analyzed state of each repository: the HEAD commit it was scanned at and the
+    # per-file counts behind its language totals. Per-file rows are what make delta
+    # updates possible, since a compare diff names files rather than languages. Each file
+    # keeps its blob SHA, so a replay can leave out blobs already counted elsewhere, and
+    # the dependencies it imports, newline-separated, and its size.
+    def __init__(self, path=SNAPSHOT_PATH):
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.lock = Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        with self.lock, self.connection:
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS repo_snapshots ("
+                "repo TEXT PRIMARY KEY, head_sha TEXT NOT NULL, pushed_at TEXT, updated_at REAL NOT NULL)"
+            )
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS repo_files ("
+                "repo TEXT NOT NULL, path TEXT NOT NULL, language TEXT NOT NULL, "
+                "code INTEGER NOT NULL, comments INTEGER NOT NULL, dependencies TEXT NOT NULL, bytes INTEGER NOT NULL, "
+                "sha TEXT, "
+                "PRIMARY KEY (repo, path))"
+            )
+
+    def get(self, repo):
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT head_sha, pushed_at FROM repo_snapshots WHERE repo = ?", (repo,)
+            ).fetchone()
+        return Snapshot(*row) if row else None
+
+    def files(self, repo):
+        # (path, language, code, comments, dependencies, bytes, blob sha) of every file; the SHA may be None
+        with self.lock:
+            rows = self.connection.execute(
+                "SELECT path, language, code, comments, dependencies, bytes, sha FROM repo_files WHERE repo = ?",
+                (repo,),
+            ).fetchall()
+        return [
+            (path, language, code_lines, comment_lines, tuple(dependencies.split("\n")) if dependencies else (), size,
+             sha)
+            for path, language, code_lines, comment_lines, dependencies, size, sha in rows
+        ]
+
+    def save(self, repo, head_sha, pushed_at, files):
+        # files maps path -> (language, code, comments, dependencies, bytes, blob sha) for the whole repository
+        with self.lock, self.connection:
+            self.connection.execute("DELETE FROM repo_files WHERE repo = ?", (repo,))
+            self._write(repo, head_sha, pushed_at, files)
+
+    def apply_delta(self, repo, head_sha, pushed_at, removed_paths, files):
+        with self.lock, self.connection:
+            self.connection.executemany(
+                "DELETE FROM repo_files WHERE repo = ? AND path = ?", ((repo, path) for path in removed_paths)
+            )
+            self._write(repo, head_sha, pushed_at, files)
+
+    def touch(self, repo, pushed_at):
+        with self.lock, self.connection:
+            self.connection.execute(
+                "UPDATE repo_snapshots SET pushed_at = ?, updated_at = ? WHERE repo = ?", (pushed_at, time.time(), repo)
+            )
+
+    def _write(self, repo, head_sha, pushed_at, files):
+        self.connection.executemany(
+            "INSERT OR REPLACE INTO repo_files (repo, path, language, code, comments, dependencies, bytes, sha) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                (repo, path, language, code_lines, comment_lines, "\n".join(dependencies), size, sha)
+                for path, (language, code_lines, comment_lines, dependencies, size, sha) in files.items()
+            ),
+        )
+        self.connection.execute(
+            "INSERT OR REPLACE INTO repo_snapshots (repo, head_sha, pushed_at, updated_at) VALUES (?, ?, ?, ?)",
+            (repo, head_sha, pushed_at, time.time()),
+        )
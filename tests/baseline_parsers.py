@@ -0,0 +1,417 @@
+import re
+
+# The per-language parsers CodeGrimoire had before src/scanner.py, kept as they were, as the
+# reference tests/test_scanner.py holds the scanner's counts to. parse_python_file also
+# returns the modules the source imports, first.
+
+
+def parse_python_file(file_content):
+    imports = set()
+    code_lines = 0
+    comment_lines = 0
+    inside_multiline_comment = False
+
+    for line in file_content.splitlines():
+        stripped_line = line.strip()
+
+        # Skip blank lines
+        if not stripped_line:
+            continue
+
+        # Detect and handle multi-line comment blocks
+        if stripped_line.startswith("'''") or stripped_line.startswith('"""'):
+            inside_multiline_comment = not inside_multiline_comment
+            comment_lines += 1
+            continue
+
+        if inside_multiline_comment or stripped_line.startswith("#"):
+            comment_lines += 1
+            continue
+
+        # Count as a code line if it's not a comment or blank
+        code_lines += 1
+
+        # Parsing for import statements
+        if re.match(r'^import (\w+)|^from (\w+) import', stripped_line):
+            imports.add(re.match(r'^import (\w+)|^from (\w+) import', stripped_line).group(1) or re.match(
+                r'^import (\w+)|^from (\w+) import', stripped_line).group(2))
+
+    return imports, code_lines, comment_lines
+
+
+def parse_c_file(file_content):
+    code_lines = 0
+    comment_lines = 0
+    inside_block_comment = False
+
+    for line in file_content.splitlines():
+        stripped_line = line.strip()
+
+        # Skip blank lines
+        if not stripped_line:
+            continue
+
+        # Handle block comments
+        if stripped_line.startswith("/*") or inside_block_comment:
+            inside_block_comment = True
+            comment_lines += 1
+            if "*/" in stripped_line:
+                inside_block_comment = False
+            continue
+
+        # Handle single-line comments
+        if stripped_line.startswith("//"):
+            comment_lines += 1
+            continue
+
+        # Count as a code line if it's not a comment
+        code_lines += 1
+
+    return code_lines, comment_lines
+
+
+def parse_rust_file(file_content):
+    code_lines = 0
+    comment_lines = 0
+    inside_block_comment = False
+
+    for line in file_content.splitlines():
+        stripped_line = line.strip()
+
+        # Handle block comments
+        if stripped_line.startswith("/*") or inside_block_comment:
+            inside_block_comment = True
+            comment_lines += 1
+            if "*/" in stripped_line:
+                inside_block_comment = False
+            continue
+
+        # Handle single-line comments
+        if stripped_line.startswith("//"):
+            comment_lines += 1
+            continue
+
+        # Non-empty and non-comment line is considered as a code line
+        if stripped_line and not inside_block_comment:
+            code_lines += 1
+
+    return code_lines, comment_lines
+
+
+def parse_go_file(file_content):
+    code_lines = 0
+    comment_lines = 0
+    inside_block_comment = False
+
+    for line in file_content.splitlines():
+        stripped_line = line.strip()
+
+        # Handle block comments
+        if stripped_line.startswith("/*") or inside_block_comment:
+            inside_block_comment = True
+            comment_lines += 1
+            if "*/" in stripped_line:
+                inside_block_comment = False
+            continue
+
+        # Handle single-line comments
+        if stripped_line.startswith("//"):
+            comment_lines += 1
+            continue
+
+        # Non-empty and non-comment line is considered as a code line
+        if stripped_line and not inside_block_comment:
+            code_lines += 1
+
+    return code_lines, comment_lines
+
+
+def parse_shell_file(file_content):
+    code_lines = 0
+    comment_lines = 0
+
+    for line in file_content.splitlines():
+        stripped_line = line.strip()
+
+        # Handle single-line comments
+        if stripped_line.startswith("#"):
+            comment_lines += 1
+            continue
+
+        # Non-empty line is considered as a code line
+        if stripped_line:
+            code_lines += 1
+
+    return code_lines, comment_lines
+
+
+def parse_swift_file(file_content):
+    code_lines = 0
+    comment_lines = 0
+    inside_block_comment = False
+
+    for line in file_content.splitlines():
+        stripped_line = line.strip()
+
+        # Handle block comments
+        if stripped_line.startswith("/*") or inside_block_comment:
+            inside_block_comment = True
+            comment_lines += 1
+            if "*/" in stripped_line:
+                inside_block_comment = False
+            continue
+
+        # Handle single-line and documentation comments
+        if stripped_line.startswith("//"):
+            comment_lines += 1
+            continue
+
+        # Non-empty and non-comment line is considered as a code line
+        if stripped_line and not inside_block_comment:
+            code_lines += 1
+
+    return code_lines, comment_lines
+
+
+def parse_lua_file(file_content):
+    code_lines = 0
+    comment_lines = 0
+    inside_block_comment = False
+
+    for line in file_content.splitlines():
+        stripped_line = line.strip()
+
+        # Handle block comments
+        if stripped_line.startswith("--[[") or inside_block_comment:
+            inside_block_comment = True
+            comment_lines += 1
+            if stripped_line.endswith("--]]"):
+                inside_block_comment = False
+            continue
+
+        # Handle single-line comments
+        if stripped_line.startswith("--") and not stripped_line.startswith("--[["):
+            comment_lines += 1
+            continue
+
+        # Non-empty and non-comment line is considered as a code line
+        if stripped_line and not inside_block_comment:
+            code_lines += 1
+
+    return code_lines, comment_lines
+
+
+def parse_r_file(file_content):
+    code_lines = 0
+    comment_lines = 0
+
+    for line in file_content.splitlines():
+        stripped_line = line.strip()
+
+        # Handle single-line comments
+        if stripped_line.startswith("#"):
+            comment_lines += 1
+            continue
+
+        # Non-empty line is considered as a code line
+        if stripped_line:
+            code_lines += 1
+
+    return code_lines, comment_lines
+
+
+def parse_sql_file(file_content):
+    code_lines = 0
+    comment_lines = 0
+    inside_block_comment = False
+
+    for line in file_content.splitlines():
+        stripped_line = line.strip()
+
+        # Handle block comments
+        if stripped_line.startswith("/*") or inside_block_comment:
+            inside_block_comment = True
+            comment_lines += 1
+            if "*/" in stripped_line:
+                inside_block_comment = False
+            continue
+
+        # Handle single-line comments
+        if stripped_line.startswith("--"):
+            comment_lines += 1
+            continue
+
+        # Non-empty and non-comment line is considered as a code line
+        if stripped_line and not inside_block_comment:
+            code_lines += 1
+
+    return code_lines, comment_lines
+
+
+def parse_php_file(file_content):
+    code_lines = 0
+    comment_lines = 0
+    inside_block_comment = False
+
+    for line in file_content.splitlines():
+        stripped_line = line.strip()
+
+        # Handle block comments
+        if stripped_line.startswith("/*") or inside_block_comment:
+            inside_block_comment = True
+            comment_lines += 1
+            if "*/" in stripped_line:
+                inside_block_comment = False
+            continue
+
+        # Handle single-line comments
+        if stripped_line.startswith("//") or stripped_line.startswith("#"):
+            comment_lines += 1
+            continue
+
+        # Non-empty and non-comment line is considered as a code line
+        if stripped_line and not inside_block_comment:
+            code_lines += 1
+
+    return code_lines, comment_lines
+
+
+def parse_perl_file(file_content):
+    code_lines = 0
+    comment_lines = 0
+
+    for line in file_content.splitlines():
+        stripped_line = line.strip()
+
+        # Handle single-line comments
+        if stripped_line.startswith("#"):
+            comment_lines += 1
+            continue
+
+        # Non-empty line is considered as a code line
+        if stripped_line:
+            code_lines += 1
+
+    return code_lines, comment_lines
+
+
+def parse_javascript_file(file_content):
+    code_lines = 0
+    comment_lines = 0
+    inside_block_comment = False
+
+    for line in file_content.splitlines():
+        stripped_line = line.strip()
+
+        # Skip blank lines
+        if not stripped_line:
+            continue
+
+        # Handle block comments
+        if stripped_line.startswith("/*") or inside_block_comment:
+            inside_block_comment = True
+            comment_lines += 1
+            if "*/" in stripped_line:
+                inside_block_comment = False
+            continue
+
+        # Handle single-line comments
+        if stripped_line.startswith("//"):
+            comment_lines += 1
+            continue
+
+        # Count as a code line if it's not a comment
+        code_lines += 1
+
+    return code_lines, comment_lines
+
+
+def parse_html_file(file_content):
+    code_lines = 0
+    comment_lines = 0
+    inside_comment = False
+
+    for line in file_content.splitlines():
+        stripped_line = line.strip()
+
+        if stripped_line.startswith("<!--"):
+            inside_comment = True
+
+        if inside_comment:
+            comment_lines += 1
+            if stripped_line.endswith("-->"):
+                inside_comment = False
+            continue
+
+        if stripped_line and not inside_comment:
+            code_lines += 1
+
+    return code_lines, comment_lines
+
+
+def parse_css_file(file_content):
+    code_lines = 0
+    comment_lines = 0
+    inside_comment = False
+
+    for line in file_content.splitlines():
+        stripped_line = line.strip()
+
+        if stripped_line.startswith("/*"):
+            inside_comment = True
+
+        if inside_comment:
+            comment_lines += 1
+            if stripped_line.endswith("*/"):
+                inside_comment = False
+            continue
+
+        if stripped_line and not inside_comment:
+            code_lines += 1
+
+    return code_lines, comment_lines
+
+
+def parse_ruby_file(file_content):
+    code_lines = 0
+    comment_lines = 0
+    inside_multiline_comment = False
+
+    for line in file_content.splitlines():
+        stripped_line = line.strip()
+
+        if stripped_line.startswith("=begin"):
+            inside_multiline_comment = True
+            comment_lines += 1
+            continue
+
+        if stripped_line.startswith("=end"):
+            inside_multiline_comment = False
+            comment_lines += 1
+            continue
+
+        if inside_multiline_comment or stripped_line.startswith("#"):
+            comment_lines += 1
+            continue
+
+        if stripped_line:  # Non-empty line
+            code_lines += 1
+
+    return code_lines, comment_lines
+
+
+# The parser of each language, as CodeGrimoire.parse_file picked them by extension; TypeScript
+# went to the JavaScript parser, and C++, C# and Java to the C parser
+PARSERS = {
+    "Python": parse_python_file, "JavaScript": parse_javascript_file, "TypeScript": parse_javascript_file,
+    "C": parse_c_file, "C++": parse_c_file, "C#": parse_c_file, "Java": parse_c_file, "Rust": parse_rust_file,
+    "Go": parse_go_file, "Shell": parse_shell_file, "Swift": parse_swift_file, "Lua": parse_lua_file,
+    "R": parse_r_file, "SQL": parse_sql_file, "PHP": parse_php_file, "Perl": parse_perl_file,
+    "HTML": parse_html_file, "CSS": parse_css_file, "Ruby": parse_ruby_file,
+}
+
+
+def baseline_counts(source, language):
+    # (code_lines, comment_lines) of raw source, decoded as parse_file decoded it
+    result = PARSERS[language](source.decode("utf-8"))
+    return result[1:] if language == "Python" else result
@@ -0,0 +1,51 @@
+import os
+import tempfile
+import threading
+from functools import partial
+
+import pytest
+
+# Settings are read as src is imported: the caches of the tests go to a directory of their own
+os.environ["CODE_GRIMOIRE_CACHE_DIR"] = tempfile.mkdtemp(prefix="code-grimoire-tests-")
+os.environ.pop("CODE_GRIMOIRE_TIME_BUDGET", None)
+
+from benchmarks.corpus import generate_corpus
+from benchmarks.mock_github import MockGitHub
+from src import async_grimoire
+from src.github_client import AsyncGitHubClient
+from src.parse_pool import create_parse_executor
+
+
+@pytest.fixture(scope="session")
+def parse_executor():
+    # One process pool for the whole session; spawning workers is the slow part of a test
+    executor = create_parse_executor(2)
+    yield executor
+    executor.shutdown()
+
+
+@pytest.fixture
+def serve_github(monkeypatch):
+    # Serves a corpus with benchmarks.mock_github from a thread of this process, and points
+    # the async engine's client at it
+    servers = []
+
+    def serve(corpus):
+        server = MockGitHub(corpus)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        url = f"http://127.0.0.1:{server.server_address[1]}"
+        monkeypatch.setattr(async_grimoire, "AsyncGitHubClient",
+                            partial(AsyncGitHubClient, base_url=url, graphql_url=f"{url}/graphql"))
+        servers.append(server)
+        return server
+
+    yield serve
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def owned_corpus(*full_names, files=12, file_size=600, seed=0, languages=None):
+    # A synthetic corpus whose repositories have the given full names, each with files of its own
+    corpus = generate_corpus(len(full_names), files, file_size, languages or {"Python": 2, "JavaScript": 1}, 0.2, seed)
+    return [repo._replace(name=full_name.split("/")[1], full_name=full_name) for repo, full_name in zip(corpus, full_names)]
@@ -0,0 +1,89 @@
+import json
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+from benchmarks.parsers import expected_totals
+from conftest import owned_corpus
+from src import api
+from src.async_grimoire import AsyncCodeGrimoire
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(api, "TOKEN", "token")
+    with TestClient(api.app) as client:
+        yield client
+
+
+def finished_job(client, job_id):
+    while (state := client.get(f"/jobs/{job_id}").json())["status"] not in ("completed", "failed"):
+        time.sleep(0.05)
+    return state
+
+
+@pytest.mark.parametrize("query", ["", "&time_budget=0"])
+def test_analyze_runs_without_a_deadline(serve_github, client, monkeypatch, query):
+    serve_github(owned_corpus("alice/tools", "bob/tools"))
+    budgets = []
+
+    class RecordingGrimoire(AsyncCodeGrimoire):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            budgets.append(self.time_budget)
+
+    monkeypatch.setattr(api, "AsyncCodeGrimoire", RecordingGrimoire)
+    response = client.post(f"/analyze?max_repos=2{query}", headers={"Cache-Control": "no-cache"})
+    assert response.status_code == 202
+    state = finished_job(client, response.json()["job_id"])
+
+    assert budgets == [None]
+    assert state["status"] == "completed"
+    assert state["result"]["truncated_repos"] == {}
+    assert client.post("/analyze?time_budget=-1").status_code == 422
+
+
+def test_analyze_keeps_the_file_rows_of_its_run(serve_github, client):
+    corpus = owned_corpus("alice/tools", "bob/tools")
+    serve_github(corpus)
+    response = client.post("/analyze?max_repos=2", headers={"Cache-Control": "no-cache"})
+    run_id = finished_job(client, response.json()["job_id"])["result"]["run_id"]
+
+    rollup = client.get(f"/results/runs/{run_id}/rollup?by=repo")
+    assert rollup.status_code == 200
+    files = {group["repo"]: group["files"] for group in rollup.json()["groups"]}
+    assert files == {repo.full_name: sum(1 for corpus_file in repo.files if corpus_file.language) for repo in corpus}
+
+
+def test_stored_totals_count_shared_files_once(serve_github, client):
+    # Two repositories of one owner with the same files: each counts them all, the totals
+    # of the run and of the owner only once
+    tools, copy = owned_corpus("alice/tools", "alice/copy")
+    corpus = [tools, copy._replace(files=tools.files)]
+    serve_github(corpus)
+    response = client.post("/analyze?max_repos=2&shared_code=once", headers={"Cache-Control": "no-cache"})
+    result = finished_job(client, response.json()["job_id"])["result"]
+    totals = {language: counts for language, counts in result["total_lines"].items() if any(counts.values())}
+    assert totals == expected_totals(corpus, "once")
+
+    assert client.get(f"/results/runs/{result['run_id']}").json()["total_lines"] == totals
+    history = client.get("/results/owners/alice/history").json()
+    assert history[-1]["run_id"] == result["run_id"]
+    assert history[-1]["total_lines"] == totals
+    assert client.get("/results/languages/Python/repos").json()["repos"][0]["code"] == totals["Python"]["code"]
+
+
+def test_job_events_are_served_as_server_sent_events(serve_github, client):
+    serve_github(owned_corpus("alice/tools"))
+    response = client.post("/analyze?max_repos=1", headers={"Cache-Control": "no-cache"})
+    job_id = response.json()["job_id"]
+    finished_job(client, job_id)
+
+    with client.stream("GET", f"/jobs/{job_id}/events") as events:
+        assert events.headers["Content-Type"].startswith("text/event-stream")
+        body = "".join(events.iter_text())
+    event, data = body.split("\n\n")[0].split("\n")
+    assert event == "event: state"
+    assert json.loads(data.removeprefix("data: "))["status"] == "completed"
+    assert body.endswith("\n\n") and body.count("event: ") == 1
@@ -0,0 +1,177 @@
+import asyncio
+
+import pytest
+
+from benchmarks.corpus import generate_corpus
+from benchmarks.parsers import expected_totals
+from conftest import owned_corpus
+from src.async_grimoire import AsyncCodeGrimoire, RepoInfo
+from src.github_client import AsyncGitHubClient
+
+
+def analyze(parse_executor, **options):
+    grimoire = AsyncCodeGrimoire("token", parse_executor=parse_executor, parse_workers=2, **options)
+    return grimoire, asyncio.run(grimoire.analyze_repos())
+
+
+def test_same_named_repos_are_reported_apart(serve_github, parse_executor):
+    corpus = [*owned_corpus("alice/dotfiles", languages={"Python": 1}),
+              *owned_corpus("bob/dotfiles", seed=1, languages={"JavaScript": 1})]
+    serve_github(corpus)
+    grimoire, result = analyze(parse_executor, time_budget=None)
+
+    assert {repo: sorted(languages) for repo, languages in result["repos_languages"].items()} == {
+        "alice/dotfiles": ["Python"], "bob/dotfiles": ["JavaScript"],
+    }
+    assert set(result["repos_dependencies"]) == {"alice/dotfiles", "bob/dotfiles"}
+    assert grimoire.progress == {"alice/dotfiles": "Completed", "bob/dotfiles": "Completed"}
+
+
+def test_same_named_repos_truncate_apart(serve_github, parse_executor):
+    # Past the deadline before anything starts, each repository is skipped under its own name
+    serve_github(owned_corpus("alice/dotfiles", "bob/dotfiles"))
+    grimoire, result = analyze(parse_executor, time_budget=0)
+
+    assert result["truncated_repos"] == {"alice/dotfiles": None, "bob/dotfiles": None}
+    assert grimoire.progress == {"alice/dotfiles": "Deadline Exceeded", "bob/dotfiles": "Deadline Exceeded"}
+
+
+def test_failed_blob_stops_the_scan_and_marks_the_repo(serve_github, parse_executor):
+    # One blob of alice/tools can't be fetched. Its other downloads stop with it, nothing
+    # of it is recorded once it is finished, and it is reported failed and truncated
+    # while bob/tools, scanned alongside, completes.
+    corpus = [*owned_corpus("alice/tools", files=60), *owned_corpus("bob/tools", files=60, seed=1)]
+    server = serve_github(corpus)
+    missing = next(corpus_file for corpus_file in corpus[0].files if corpus_file.language)
+    del server.blobs["alice/tools"][missing.sha]
+    grimoire = AsyncCodeGrimoire("token", parse_executor=parse_executor, parse_workers=2, max_requests=4,
+                                 time_budget=None)
+    finished, late = set(), []
+    finish_repository, record_file = grimoire.finish_repository, grimoire.record_file
+
+    def finish(repo):
+        finished.add(repo.full_name)
+        finish_repository(repo)
+
+    def record(repo, path, *counts):
+        if repo.full_name in finished:
+            late.append(path)
+        record_file(repo, path, *counts)
+
+    grimoire.finish_repository, grimoire.record_file = finish, record
+    result = asyncio.run(grimoire.analyze_repos())
+
+    assert late == []
+    assert grimoire.progress == {"alice/tools": "Failed", "bob/tools": "Completed"}
+    assert result["truncated_repos"] == {"alice/tools": None}
+
+
+def test_forks_keep_their_own_counts_under_once(serve_github, parse_executor):
+    # repo-001 and repo-002 fork repo-000. The totals count each blob once, while every
+    # repository reports all of its files.
+    corpus = generate_corpus(3, 20, 600, {"Python": 2, "JavaScript": 1}, 0.2, seed=3, forks=1.0)
+    assert [repo.parent for repo in corpus] == [None, "benchmark/repo-000", "benchmark/repo-000"]
+    serve_github(corpus)
+    grimoire, result = analyze(parse_executor, time_budget=None, shared_code="once")
+
+    totals = {language: counts for language, counts in result["total_lines"].items() if any(counts.values())}
+    assert totals == expected_totals(corpus, "once")
+    for repo in corpus:
+        own = expected_totals([repo], "per_repo")
+        assert grimoire.repo_counts[repo.full_name] == {
+            language: (counts["code"], counts["comments"]) for language, counts in own.items()
+        }
+        assert result["repos_languages"][repo.full_name] == set(own)
+    assert result["shared_files"]["inherited"] > 0
+
+
+@pytest.mark.parametrize("fetch_mode", ["trees", "graphql"])
+def test_a_fork_can_leave_its_parents_blobs_unfetched(serve_github, parse_executor, monkeypatch, fetch_mode):
+    # Only the fork is analyzed: the files it shares with its parent keep their languages
+    # but get no lines, and none of their blobs is downloaded
+    parent, fork, _ = generate_corpus(3, 20, 600, {"Python": 2, "JavaScript": 1}, 0.2, seed=3, forks=1.0)
+    serve_github([parent, fork])
+    fetched = []
+    fetch_blob, fetch_blob_batch = AsyncCodeGrimoire.fetch_blob, AsyncCodeGrimoire.fetch_blob_batch
+
+    async def spy_fetch_blob(self, repo, sha):
+        fetched.append(sha)
+        return await fetch_blob(self, repo, sha)
+
+    async def spy_fetch_blob_batch(self, repo, batch):
+        fetched.extend(sha for _, sha, _, _ in batch)
+        return await fetch_blob_batch(self, repo, batch)
+
+    monkeypatch.setattr(AsyncCodeGrimoire, "fetch_blob", spy_fetch_blob)
+    monkeypatch.setattr(AsyncCodeGrimoire, "fetch_blob_batch", spy_fetch_blob_batch)
+    grimoire = AsyncCodeGrimoire("token", parse_executor=parse_executor, parse_workers=2, time_budget=None,
+                                 repo_names=[fork.full_name], shared_code="once", fetch_inherited=False)
+    result = asyncio.run(grimoire.analyze_repos(fetch_mode))
+
+    parent_blobs = {corpus_file.sha for corpus_file in parent.files}
+    own = expected_totals([fork._replace(files=[corpus_file for corpus_file in fork.files
+                                                if corpus_file.sha not in parent_blobs])], "per_repo")
+    assert fetched and not parent_blobs.intersection(fetched)
+    assert {language: counts for language, counts in result["total_lines"].items() if any(counts.values())} == own
+    assert grimoire.repo_counts[fork.full_name] == {
+        language: (own.get(language, {}).get("code", 0), own.get(language, {}).get("comments", 0))
+        for language in expected_totals([fork], "per_repo")
+    }
+
+
+@pytest.mark.parametrize("fetch_mode", ["trees", "contents", "archive", "graphql"])
+def test_extensions_are_matched_whatever_their_case(serve_github, parse_executor, fetch_mode):
+    (repo,) = owned_corpus("alice/tools")
+    files = [corpus_file._replace(path=corpus_file.path.rsplit(".", 1)[0] + ".PY")
+             if corpus_file.language == "Python" else corpus_file for corpus_file in repo.files]
+    serve_github([repo._replace(files=files)])
+    grimoire = AsyncCodeGrimoire("token", parse_executor=parse_executor, parse_workers=2, time_budget=None)
+    result = asyncio.run(grimoire.analyze_repos(fetch_mode))
+
+    assert {language: counts for language, counts in result["total_lines"].items() if any(counts.values())} \
+        == expected_totals([repo])
+    assert result["repos_languages"]["alice/tools"] == {"Python", "JavaScript"}
+
+
+def test_a_blob_is_marked_counted_only_once_recorded():
+    grimoire = AsyncCodeGrimoire("token", shared_code="once")
+    repo = RepoInfo("tools", "alice/tools", "main", None, False, 1)
+    with pytest.raises(KeyError):
+        grimoire.record_counts(repo, "tool.py", "Python", 3, 1, (), 40, "blob")  # never begun
+    assert "blob" not in grimoire.counted_blobs
+
+    grimoire.begin_repository(repo)
+    grimoire.record_counts(repo, "tool.py", "Python", 3, 1, (), 40, "blob")
+    grimoire.record_counts(repo, "copy/tool.py", "Python", 3, 1, (), 40, "blob")
+    grimoire.finish_repository(repo)
+    assert grimoire.total_lines["Python"] == {"code": 3, "comments": 1}
+    assert grimoire.repo_counts["alice/tools"] == {"Python": (6, 2)}
+
+
+@pytest.mark.parametrize("stage", ["blob_fetch", "directory_listing"])
+def test_stage_timings_leave_out_the_wait_for_a_request_slot(serve_github, stage):
+    # The only request slot is held for a while before the engine's request gets it; its
+    # stage is timed over the exchange alone, as api_request is
+    corpus = owned_corpus("alice/tools")
+    server = serve_github(corpus)
+    repo = RepoInfo("tools", "alice/tools", "main", None, False, 1)
+    grimoire = AsyncCodeGrimoire("token")
+    slot_wait = 0.3
+
+    async def fetch():
+        base_url = f"http://127.0.0.1:{server.server_address[1]}"
+        async with AsyncGitHubClient(["token"], max_requests=1, profile=grimoire.profile, base_url=base_url) as client:
+            grimoire.client = client
+            if stage == "blob_fetch":
+                request = asyncio.create_task(grimoire.fetch_blob(repo, corpus[0].files[0].sha))
+            else:
+                request = asyncio.create_task(grimoire.list_directory(repo, ""))
+            async with client.requests:
+                await asyncio.sleep(slot_wait)
+            await request
+
+    asyncio.run(fetch())
+    stages = grimoire.profile.report()["stages"]
+    assert stages[stage]["count"] == 1
+    assert stages[stage]["seconds"] < slot_wait
+    assert stages[stage]["seconds"] == stages["api_request"]["seconds"]
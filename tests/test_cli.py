@@ -0,0 +1,34 @@
+import pytest
+
+from conftest import owned_corpus
+from src import cli
+from src.file_stats import FileStats
+
+
+@pytest.fixture
+def analyzed(monkeypatch):
+    # The arguments main hands to analyze
+    calls = []
+    monkeypatch.setattr(cli, "analyze", lambda args: calls.append(args) or 0)
+    return calls
+
+
+@pytest.mark.parametrize("argv, time_budget", [([], None), (["--time-budget", "0"], None),
+                                               (["--time-budget", "90"], 90.0)])
+def test_time_budget_defaults_to_no_deadline(analyzed, argv, time_budget):
+    assert cli.main(["analyze", "--token", "token", *argv, "alice/tools"]) == 0
+    assert analyzed[0].time_budget == time_budget
+
+
+@pytest.mark.parametrize("keep", [False, True])
+def test_file_stats_are_kept_only_with_the_option(serve_github, monkeypatch, tmp_path, keep):
+    corpus = owned_corpus("alice/tools")
+    serve_github(corpus)
+    added = []
+    monkeypatch.setattr(FileStats, "add", lambda self, *row: added.append(row))
+    path = tmp_path / "files.stats"
+    argv = ["analyze", "--token", "token", "--no-cache", "--parse-workers", "1", "alice/tools"]
+
+    assert cli.main(argv + (["--file-stats", str(path)] if keep else [])) == 0
+    assert len(added) == (sum(1 for corpus_file in corpus[0].files if corpus_file.language) if keep else 0)
+    assert path.exists() == keep
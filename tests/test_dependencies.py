@@ -0,0 +1,72 @@
+import pytest
+
+from src import scanner
+from src.scanner import scan_chunks, scan_lines
+
+
+def dependencies(source, language):
+    return scan_lines(source, language)[2]
+
+
+JS_SOURCE = b"""\
+import a from "a";
+import {
+    b,
+    c as d,
+} from "@scope/b/sub";
+import "side-effect";
+import * as fs from "node:fs";
+export * from "e";
+export { f } from './f';
+const g = require("g");
+let { h } = require('h/sub');
+require("i");
+const j = await import("j");
+import local from "./local";
+"""
+
+
+def test_javascript_imports_are_found_at_statement_starts():
+    assert dependencies(JS_SOURCE, "JavaScript") == ("@scope/b", "a", "e", "g", "h", "i", "j", "node:fs", "side-effect")
+    assert dependencies(JS_SOURCE, "TypeScript") == dependencies(JS_SOURCE, "JavaScript")
+
+
+@pytest.mark.parametrize("line", [
+    b"""console.log("import 'x'");""",
+    b"""const message = "require('x')";""",
+    b"""warn('see import x from "x"');""",
+    b"""const help = `export * from "x"`;""",
+    b"""// import x from "x";""",
+    b"""/* const x = require("x"); */""",
+])
+def test_javascript_imports_in_strings_and_comments_are_not_found(line):
+    assert dependencies(line + b"\nimport y from 'y';\n", "JavaScript") == ("y",)
+
+
+GO_SOURCE = b"""\
+package main
+
+import "errors"
+import (
+    "fmt"
+    str "strings"
+)
+"""
+
+
+def test_go_imports_are_found_singly_and_in_blocks():
+    assert dependencies(GO_SOURCE, "Go") == ("errors", "fmt", "strings")
+
+
+@pytest.mark.parametrize("language, source", [("Go", GO_SOURCE), ("JavaScript", JS_SOURCE)])
+def test_imports_spanning_segments_are_found(language, source, monkeypatch):
+    # Read a byte at a time, every line is a segment of its own, so an import block or list
+    # spans several
+    monkeypatch.setattr(scanner, "SEGMENT_BYTES", 1)
+    assert scan_chunks([source[i:i + 1] for i in range(len(source))], language) == scan_lines(source, language)
+
+
+@pytest.mark.parametrize("language", ["C", "C++"])
+def test_only_angle_bracket_includes_are_dependencies(language):
+    source = b'#include <stdio.h>\n# include <sys/types.h>\n#include "local.h"\n#include "../util/util.h"\n'
+    assert dependencies(source, language) == ("stdio.h", "sys/types.h")
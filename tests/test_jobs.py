@@ -0,0 +1,135 @@
+import asyncio
+
+import pytest
+
+from src import jobs
+from src.jobs import JobManager
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1_700_000_000.0
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(jobs, "time", clock)
+    return clock
+
+
+def gated_analysis(result=None):
+    # An analyze callback for JobManager.submit that runs until release is set, and
+    # records each call; the analysis publishes a repo event, then returns result
+    calls = []
+    release = asyncio.Event()
+
+    def analyze(publish):
+        calls.append(publish)
+
+        async def run():
+            await release.wait()
+            publish({"event": "repo", "repo": "alice/tools", "status": "Completed", "total_lines": {}})
+            return result if result is not None else {"truncated_repos": {}}
+
+        return run()
+
+    return analyze, calls, release
+
+
+def test_identical_submissions_share_one_analysis(clock):
+    async def scenario():
+        manager = JobManager(ttl=60)
+        analyze, calls, release = gated_analysis()
+        job, shared = manager.submit(analyze, key="alice")
+        joined, joined_shared = manager.submit(analyze, key="alice")
+        other, other_shared = manager.submit(analyze, key="bob")
+        assert (shared, joined_shared, other_shared) == (False, True, False)
+        assert joined is job and other is not job
+        # A running job is joined even when a fresh result is asked for
+        assert manager.submit(analyze, key="alice", reuse=False) == (job, True)
+
+        release.set()
+        await asyncio.gather(job.task, other.task)
+        assert len(calls) == 2
+        assert job.status == "completed"
+        assert manager.submit(analyze, key="alice") == (job, True)
+        fresh, fresh_shared = manager.submit(analyze, key="alice", reuse=False)
+        assert fresh is not job and not fresh_shared
+        await fresh.task
+
+    asyncio.run(scenario())
+
+
+def test_cached_results_expire_after_the_ttl(clock):
+    async def scenario():
+        manager = JobManager(ttl=60)
+        analyze, calls, release = gated_analysis()
+        release.set()
+        job, _ = manager.submit(analyze, key="alice")
+        await job.task
+        clock.now += 59
+        assert manager.expires_in(job) == 1
+        assert manager.submit(analyze, key="alice") == (job, True)
+        clock.now += 1
+        expired, shared = manager.submit(analyze, key="alice")
+        assert expired is not job and not shared
+        await expired.task
+        assert len(calls) == 2
+
+    asyncio.run(scenario())
+
+
+def test_partial_and_failed_results_are_not_reused(clock):
+    async def scenario():
+        manager = JobManager(ttl=60)
+        analyze, _, release = gated_analysis({"truncated_repos": {"alice/tools": None}})
+        release.set()
+        partial, _ = manager.submit(analyze, key="alice")
+        await partial.task
+        assert partial.status == "partial"
+
+        def fail(publish):
+            async def run():
+                raise RuntimeError("listing failed")
+            return run()
+
+        failed, _ = manager.submit(fail, key="bob")
+        await failed.task
+        assert (failed.status, failed.error) == ("failed", "listing failed")
+        assert manager.submit(analyze, key="alice")[0] is not partial
+        assert manager.submit(fail, key="bob")[0] is not failed
+
+    asyncio.run(scenario())
+
+
+def test_event_streams_start_from_the_state_and_end_with_done(monkeypatch):
+    monkeypatch.setattr(jobs, "JOB_EVENT_BUFFER", 2)
+
+    async def scenario():
+        manager = JobManager()
+        analyze, calls, release = gated_analysis()
+        job, _ = manager.submit(analyze, key="alice")
+        await asyncio.sleep(0)  # the job starts, and calls analyze
+        stream = job.events()
+        assert (await stream.__anext__())["event"] == "state"
+        # A slow reader misses file events past the buffer, never repo events
+        for index in range(3):
+            calls[0]({"event": "file", "repo": "alice/tools", "path": f"{index}.py"})
+        release.set()
+        await job.task
+        events = [event async for event in stream]
+        assert [event["event"] for event in events] == ["file", "file", "repo", "done"]
+        assert events[-1] == {"event": "done", "status": "completed", "error": None}
+        assert job.subscribers == set()
+
+        # A stream opened after the job finished gets its final state and nothing else
+        late = [event async for event in job.events()]
+        assert [event["event"] for event in late] == ["state"]
+        assert late[0]["status"] == "completed"
+        assert late[0]["completed_repos"] == 1
+
+    asyncio.run(scenario())
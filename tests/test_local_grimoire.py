@@ -0,0 +1,63 @@
+import pytest
+
+from benchmarks.local import write_repos
+from benchmarks.parsers import expected_totals
+from conftest import owned_corpus
+from src import cli
+from src.local_grimoire import LocalCodeGrimoire
+from src.snapshots import SnapshotStore
+
+
+def totals(result):
+    return {language: counts for language, counts in result["total_lines"].items() if any(counts.values())}
+
+
+@pytest.fixture
+def on_disk(tmp_path):
+    # Two repositories of the corpus committed under tmp_path/checkout, and cloned bare under tmp_path/bare
+    corpus = owned_corpus("alice/tools", "alice/site")
+    write_repos(corpus, str(tmp_path))
+    return corpus, tmp_path
+
+
+@pytest.mark.parametrize("kind", ["checkout", "bare"])
+def test_repositories_on_disk_are_counted(on_disk, parse_executor, kind):
+    corpus, directory = on_disk
+    grimoire = LocalCodeGrimoire([str(directory / kind)], parse_executor=parse_executor, parse_workers=2)
+    result = grimoire.analyze_repos()
+
+    assert totals(result) == expected_totals(corpus)
+    assert grimoire.total_repos == 2
+    assert set(grimoire.progress.values()) == {"Completed"}
+    assert result["truncated_repos"] == {}
+
+
+def test_an_unmoved_bare_head_is_replayed_from_its_snapshot(on_disk, parse_executor, monkeypatch):
+    corpus, directory = on_disk
+    snapshot_store = SnapshotStore(":memory:")
+
+    def analyze():
+        return LocalCodeGrimoire([str(directory / "bare")], snapshot_store=snapshot_store,
+                                 parse_executor=parse_executor, parse_workers=2).analyze_repos()
+
+    assert totals(analyze()) == expected_totals(corpus)
+
+    monkeypatch.setattr(LocalCodeGrimoire, "read_blobs", lambda *args: pytest.fail("read a blob again"))
+    assert totals(analyze()) == expected_totals(corpus)
+
+
+def test_cli_analyzes_local_paths_without_a_token(on_disk, monkeypatch):
+    corpus, directory = on_disk
+    monkeypatch.delenv("TOKEN", raising=False)
+    finish_repository = LocalCodeGrimoire.finish_repository
+    finished = []
+
+    def spy_finish_repository(self, repo):
+        finished.append(repo.name)
+        finish_repository(self, repo)
+
+    monkeypatch.setattr(LocalCodeGrimoire, "finish_repository", spy_finish_repository)
+
+    assert cli.main(["analyze", "--local", "--no-cache", "--parse-workers", "1",
+                     str(directory / "checkout" / "tools"), str(directory / "bare")]) == 0
+    assert sorted(finished) == ["site", "tools", "tools"]
@@ -0,0 +1,113 @@
+import asyncio
+
+import httpx
+import pytest
+
+from src import github_client, rate_budget
+from src.constants import RATE_LIMIT_THRESHOLD, RATE_LIMIT_WINDOW
+from src.github_client import AsyncGitHubClient
+from src.rate_budget import RateBudget, RateLimitException, TokenScheduler
+
+NOW = 1_700_000_000.0
+
+
+class FakeClock:
+    # Stands in for the time module; sleeping moves it forward and is recorded
+    def __init__(self):
+        self.now = NOW
+        self.sleeps = []
+
+    def time(self):
+        return self.now
+
+    def perf_counter(self):
+        return self.now
+
+    async def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(rate_budget, "time", clock)
+    monkeypatch.setattr(github_client, "time", clock)
+    monkeypatch.setattr(rate_budget.asyncio, "sleep", clock.sleep)
+    return clock
+
+
+def budget(remaining, limit=5000, reset_in=1000, token="token"):
+    budget = RateBudget(token)
+    budget.update(remaining, limit, NOW + reset_in)
+    return budget
+
+
+def test_requests_start_at_once_until_the_quota_runs_low():
+    plenty = budget(4000)
+    assert [plenty.reserve(NOW) for _ in range(3)] == [NOW] * 3
+    assert plenty.remaining == 3997
+    assert RateBudget("token").reserve(NOW) == NOW  # nothing known before the first response
+
+
+def test_a_low_quota_is_spread_until_the_reset():
+    # 1000 calls of which RATE_LIMIT_THRESHOLD are held back, over 990s: one a second
+    low = budget(1000, reset_in=1000 - RATE_LIMIT_THRESHOLD)
+    starts = [low.reserve(NOW) for _ in range(4)]
+    assert starts[0] == NOW
+    assert [later - earlier for earlier, later in zip(starts, starts[1:])] == pytest.approx([1.0, 1.0, 1.0], rel=0.01)
+
+
+def test_the_last_calls_wait_for_the_reset():
+    exhausted = budget(RATE_LIMIT_THRESHOLD)
+    assert exhausted.exhausted_for(NOW) == 1001
+    assert exhausted.reserve(NOW) == NOW + 1001
+    # A full quota is assumed after the reset, in a window that ends RATE_LIMIT_WINDOW later
+    assert exhausted.remaining == 4999
+    assert exhausted.reset_at == NOW + 1000 + RATE_LIMIT_WINDOW
+    assert exhausted.reserve(NOW + 1001) == NOW + 1001
+
+
+def test_a_window_past_its_reset_starts_over_and_304s_are_refunded():
+    exhausted = budget(RATE_LIMIT_THRESHOLD)
+    assert exhausted.reserve(NOW + 2000) == NOW + 2000
+    assert exhausted.remaining == 4999
+    exhausted.refund()
+    assert exhausted.remaining == 5000
+
+
+def test_the_scheduler_moves_to_a_token_with_quota_left(clock):
+    scheduler = TokenScheduler(["first", "second"])
+    scheduler.budgets[0].update(RATE_LIMIT_THRESHOLD, 5000, NOW + 600)
+    scheduler.budgets[1].update(4000, 5000, NOW + 600)
+
+    assert {asyncio.run(scheduler.acquire()).token for _ in range(4)} == {"second"}
+    assert clock.sleeps == []
+    # Pinned to the first token, a request waits for its reset
+    assert asyncio.run(scheduler.acquire(shared=False)).token == "first"
+    assert clock.sleeps == [601]
+
+
+def test_the_scheduler_gives_up_on_waits_past_max_wait(clock):
+    scheduler = TokenScheduler(["token"], max_wait=60)
+    scheduler.budgets[0].update(RATE_LIMIT_THRESHOLD, 5000, NOW + 600)
+    with pytest.raises(RateLimitException):
+        asyncio.run(scheduler.acquire())
+    assert clock.sleeps == []
+
+
+def test_a_secondary_limit_holds_the_token_back_for_retry_after(clock):
+    scheduler = TokenScheduler(["token"])
+    limited = scheduler.budgets[0]
+    limited.update(4000, 5000, NOW + 600)
+    request = httpx.Request("GET", "https://api.github.com/user/repos")
+    response = httpx.Response(403, headers={"Retry-After": "30", "X-RateLimit-Remaining": "3999",
+                                            "X-RateLimit-Reset": str(int(NOW + 600))}, request=request)
+    assert AsyncGitHubClient.rate_limited(limited, response)
+    asyncio.run(scheduler.acquire())
+    assert clock.sleeps == [30]
+    assert clock.now == NOW + 30
+
+    # A 403 with quota left and no Retry-After is an error of its own, not retried
+    forbidden = httpx.Response(403, headers={"X-RateLimit-Remaining": "3998"}, request=request)
+    assert not AsyncGitHubClient.rate_limited(limited, forbidden)
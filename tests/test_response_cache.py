@@ -0,0 +1,64 @@
+import asyncio
+
+import httpx
+import pytest
+
+from src.github_client import AsyncGitHubClient
+from src.response_cache import FileResponseCache, SQLiteResponseCache
+
+BASE_URL = "https://api.github.com"
+NEXT_PAGE = f'<{BASE_URL}/user/repos?page=2>; rel="next"'
+
+
+@pytest.fixture(params=["sqlite", "files"])
+def response_cache(request, tmp_path):
+    return SQLiteResponseCache(":memory:") if request.param == "sqlite" else FileResponseCache(str(tmp_path))
+
+
+def stub_github(versions):
+    # A transport serving /user/repos from versions, a list of bodies whose last one is
+    # current, as GitHub does: with an ETag and a Link, and a 304 with neither when
+    # If-None-Match names the current body
+    requests = []
+
+    def handle(request):
+        requests.append(request)
+        body = versions[-1]
+        etag = f'"v{len(versions)}"'
+        headers = {"X-RateLimit-Remaining": "4000", "X-RateLimit-Limit": "5000", "X-RateLimit-Reset": "4000000000"}
+        if request.headers.get("If-None-Match") == etag:
+            return httpx.Response(304, headers={**headers, "ETag": etag})
+        return httpx.Response(200, headers={**headers, "ETag": etag, "Link": NEXT_PAGE}, content=body)
+
+    return httpx.MockTransport(handle), requests
+
+
+async def get_repos(client):
+    response = await client.get("/user/repos")
+    return response.content, response.links["next"]["url"], client.scheduler.budgets[0].remaining
+
+
+def test_a_304_is_answered_from_the_cache(response_cache):
+    versions = [b'[{"name": "tools"}]']
+    transport, requests = stub_github(versions)
+    client = AsyncGitHubClient(["token"], response_cache=response_cache)
+    client.client = httpx.AsyncClient(base_url=BASE_URL, transport=transport)
+
+    async def revalidate():
+        first = await get_repos(client)
+        second = await get_repos(client)
+        versions.append(b'[{"name": "tools"}, {"name": "data"}]')
+        third = await get_repos(client)
+        return first, second, third
+
+    first, second, third = asyncio.run(revalidate())
+
+    assert "If-None-Match" not in requests[0].headers
+    assert requests[1].headers["If-None-Match"] == '"v1"'
+    assert first[:2] == second[:2] == (versions[0], f"{BASE_URL}/user/repos?page=2")
+    assert second[2] == first[2]  # the 304 didn't count against the quota
+    # A changed resource is served and cached anew
+    assert requests[2].headers["If-None-Match"] == '"v1"'
+    assert third[0] == versions[1]
+    assert response_cache.load(response_cache.key("token", f"{BASE_URL}/user/repos")).etag == '"v2"'
+    assert response_cache.stats() == {"hits": 1, "misses": 2, "hit_ratio": 1 / 3}
@@ -0,0 +1,98 @@
+import random
+
+import pytest
+
+from baseline_parsers import baseline_counts, parse_python_file
+from benchmarks.corpus import source_file
+from src import scanner
+from src.scanner import SYNTAX, scan_chunks, scan_lines
+
+
+def chunked(source, size):
+    return [source[start:start + size] for start in range(0, len(source), size)]
+
+
+@pytest.mark.parametrize("language", sorted(SYNTAX))
+def test_counts_match_the_baseline_parsers_on_the_corpus(language, monkeypatch):
+    # Sources of the benchmark corpus, whose comments all open at the start of a line,
+    # are counted as the old parse_*_file methods counted them, whole or in small segments
+    monkeypatch.setattr(scanner, "SEGMENT_BYTES", 257)
+    rng = random.Random(language)
+    for comment_density in (0.0, 0.2, 0.6):
+        source = source_file(rng, language, 20_000, comment_density)
+        code_lines, comment_lines, _ = scan_lines(source, language)
+        assert (code_lines, comment_lines) == baseline_counts(source, language)
+        assert scan_chunks(chunked(source, 100), language) == (code_lines, comment_lines, ())
+
+
+def test_python_imports_match_the_baseline_parser():
+    source = b"import os.path\nfrom collections import deque\nimport json as j\n\nx = deque()\n"
+    imports, code_lines, comment_lines = parse_python_file(source.decode())
+    assert scan_lines(source, "Python") == (code_lines, comment_lines, tuple(sorted(imports)))
+
+
+# The differences from the old parsers the header of src/scanner.py lists, as
+# (language, source, counts of the old parser, counts of the scanner)
+DIFFERENCES = [
+    # block comments are found anywhere on a line, and code before or after one makes a code line
+    ("C", b"int a; /* starts\nstill a comment */\nint b;\n", (3, 0), (2, 1)),
+    ("C", b"/* note */ int a;\n", (0, 1), (1, 0)),
+    # comment markers inside string literals are ignored
+    ("C", b'x = "/*"; y = 2; /* a\nb */\n', (2, 0), (1, 1)),
+    ("C", b'x = "/* a";\nb */\n', (2, 0), (2, 0)),
+    # lines of multi-line strings are code
+    ("JavaScript", b"s = `\n// not a comment\n`;\n", (2, 1), (3, 0)),
+    ("Python", b'x = """\n# not a comment\n"""\n', (1, 2), (3, 0)),
+    # blank lines inside block comments are not counted
+    ("CSS", b"/* a\n\nb */\n", (0, 3), (0, 2)),
+    ("HTML", b"<!-- a\n\nb -->\n", (0, 3), (0, 2)),
+    ("Ruby", b"=begin\n\n=end\n", (0, 3), (0, 2)),
+    ("Lua", b"--[[ a\n\n]]\n", (0, 3), (0, 2)),
+    # a one-line docstring no longer turns the rest of the file into comments
+    ("Python", b'x = 1\n"""Docstring."""\ny = 2\n', (1, 2), (2, 1)),
+    # Lua block comments close at "]]", and Ruby "=begin" must start a line
+    ("Lua", b"--[[ a\n]]\nx = 1\n", (0, 3), (1, 2)),
+    ("Ruby", b"  =begin\nx = 1\n", (0, 2), (2, 0)),
+]
+
+
+@pytest.mark.parametrize("language, source, old_counts, counts", DIFFERENCES)
+def test_documented_differences_from_the_baseline_parsers(language, source, old_counts, counts, monkeypatch):
+    assert baseline_counts(source, language) == old_counts
+    assert scan_lines(source, language)[:2] == counts
+    monkeypatch.setattr(scanner, "SEGMENT_BYTES", 1)
+    assert scan_chunks(chunked(source, 3), language)[:2] == counts
+
+
+# Multi-line comments and docstrings as they appear in real sources, as (language, source,
+# counts)
+MULTI_LINE = [
+    ("Java", b"    /**\n     * Adds two numbers.\n     *\n     * @param a the first\n     */\n"
+             b"    int add(int a, int b) { return a + b; } /* inline */\n", (1, 5)),
+    # a comment opener inside a comment doesn't hide the closer after it
+    ("C", b"/** Frees a list.\n * The list must not be used after /* see alloc.c */\n"
+          b"void free_list(list *l);\n", (1, 2)),
+    ("C", b"struct s {\n    int a; /* the first\n              field */\n    int b;\n};\n", (4, 1)),
+    ("C", b"/* a\n   b */ int x; /* c\n   d */\n", (1, 2)),
+    ("C", b"//* banner *//\nint x;\n", (1, 1)),
+    ("C", b"int x;\n/* never\n   closed\n", (1, 2)),
+    ("JavaScript", b"/**\n * Greets.\n */\nconst s = `/* not\n  a comment */`;\n", (2, 3)),
+    ("CSS", b"/*\n * Theme\n */\na { color: red; } /* note */\n/* one */ /* two */\n", (1, 4)),
+    ("Python", b'def f():\n    """Summary.\n\n    Details, with a # and \'\'\' quotes.\n    """\n'
+               b"    return 1\n", (2, 3)),
+    ("Python", b'"""Module."""\nx = """not a\n# docstring"""\n', (2, 1)),
+]
+
+
+@pytest.mark.parametrize("language, source, counts", MULTI_LINE)
+def test_multi_line_comments_and_docstrings(language, source, counts, monkeypatch):
+    assert scan_lines(source, language)[:2] == counts
+    monkeypatch.setattr(scanner, "SEGMENT_BYTES", 1)
+    assert scan_chunks(chunked(source, 3), language)[:2] == counts
+
+
+def test_invalid_utf8_is_counted_instead_of_raising():
+    source = b"x = '\xff'\n# note\n"
+    with pytest.raises(UnicodeDecodeError):
+        baseline_counts(source, "Python")
+    assert scan_lines(source, "Python") == (1, 1, ())
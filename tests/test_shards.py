@@ -0,0 +1,60 @@
+import asyncio
+
+from benchmarks.parsers import expected_totals
+from conftest import owned_corpus
+from src.async_grimoire import RepoInfo
+from src.constants import SHARD_MAX_ATTEMPTS
+from src.shards import ShardQueue, merge_results, run_shards
+
+
+def shard_result(repo, languages, truncated=None):
+    return {"total_lines": {language: {"code": 1, "comments": 0} for language in languages},
+            "repos_languages": {repo: languages}, "repos_dependencies": {repo: []},
+            "truncated_repos": {} if truncated is None else {repo: truncated}, "skipped_files": {}}
+
+
+def repo_info(repo):
+    return RepoInfo(repo.name, repo.full_name, "main", None, False, 1)
+
+
+def test_merge_keeps_same_named_repos_of_different_owners_apart():
+    merged = merge_results([shard_result("alice/.github", ["Python"], truncated=3),
+                            shard_result("bob/.github", ["Go"])])
+
+    assert merged["repos_languages"] == {"alice/.github": ["Python"], "bob/.github": ["Go"]}
+    assert merged["truncated_repos"] == {"alice/.github": 3}
+    assert merged["total_lines"] == {"Python": {"code": 1, "comments": 0}, "Go": {"code": 1, "comments": 0}}
+
+
+def test_only_failed_runs_count_toward_giving_up_on_a_shard(tmp_path):
+    queue = ShardQueue(str(tmp_path / "shards.sqlite3"))
+    queue.enqueue([repo_info(repo) for repo in owned_corpus("carol/tools")])
+    for _ in range(SHARD_MAX_ATTEMPTS + 1):
+        shard_id, _ = queue.claim("worker")
+        queue.release(shard_id, "worker", failed=False)  # cut short by the rate limit
+    assert queue.progress() == {"pending": 1}
+
+    for _ in range(SHARD_MAX_ATTEMPTS):
+        shard_id, _ = queue.claim("worker")
+        queue.release(shard_id, "worker")
+    assert queue.progress() == {"failed": 1}
+
+
+def test_shards_are_analyzed_with_the_policy_and_budget_given(serve_github, tmp_path):
+    # Two repositories with the same files, in one shard: counted for each under "per_repo"
+    tools, copy = owned_corpus("carol/tools", "carol/copy")
+    corpus = [tools, copy._replace(files=tools.files)]
+    serve_github(corpus)
+    queue = ShardQueue(str(tmp_path / "shards.sqlite3"))
+    queue.enqueue([repo_info(repo) for repo in corpus])
+    asyncio.run(run_shards(queue, "worker", ["token"], "trees", 2, 4, 1, shared_code="per_repo", time_budget=None))
+    merged = merge_results(queue.results())
+    totals = {language: counts for language, counts in merged["total_lines"].items() if any(counts.values())}
+    assert totals == expected_totals(corpus, "per_repo")
+    assert merged["truncated_repos"] == {}
+
+    # Past the deadline before anything starts, every repository is reported truncated
+    queue = ShardQueue(str(tmp_path / "deadline.sqlite3"))
+    queue.enqueue([repo_info(repo) for repo in corpus])
+    asyncio.run(run_shards(queue, "worker", ["token"], "trees", 2, 4, 1, time_budget=0))
+    assert merge_results(queue.results())["truncated_repos"] == {"carol/tools": None, "carol/copy": None}
@@ -0,0 +1,66 @@
+import asyncio
+import random
+
+from benchmarks.corpus import CorpusFile, blob_sha, repo_head, source_file
+from benchmarks.parsers import expected_totals
+from conftest import owned_corpus
+from src.async_grimoire import AsyncCodeGrimoire
+from src.constants import MAX_FILE_SIZE
+from src.snapshots import SnapshotStore
+
+
+def analyze(snapshot_store, parse_executor):
+    grimoire = AsyncCodeGrimoire("token", snapshot_store=snapshot_store, parse_executor=parse_executor,
+                                 parse_workers=2, time_budget=None)
+    result = asyncio.run(grimoire.analyze_repos())
+    return {language: counts for language, counts in result["total_lines"].items() if any(counts.values())}
+
+
+def test_same_named_repos_keep_snapshots_of_their_own(serve_github, parse_executor):
+    # Two owners' "tools" are scanned at once; each snapshot holds its own files only, and
+    # replaying them gives the totals of the first run
+    corpus = owned_corpus("alice/tools", "bob/tools")
+    serve_github(corpus)
+    snapshot_store = SnapshotStore(":memory:")
+
+    assert analyze(snapshot_store, parse_executor) == expected_totals(corpus)
+    for repo in corpus:
+        assert snapshot_store.get(repo.full_name) is not None
+        snapshot_paths = {path for path, *_ in snapshot_store.files(repo.full_name)}
+        assert snapshot_paths == {corpus_file.path for corpus_file in repo.files if corpus_file.language}
+    assert analyze(snapshot_store, parse_executor) == expected_totals(corpus)
+
+
+def test_a_push_is_applied_to_the_snapshot_from_the_compare(serve_github, parse_executor, monkeypatch):
+    # After a first full scan, a push modifies, removes, renames and adds files; the second
+    # run downloads only the blobs it changed, and leaves out an added file over the size
+    # limit without downloading it
+    (repo,) = owned_corpus("alice/tools")
+    server = serve_github([repo])
+    snapshot_store = SnapshotStore(":memory:")
+    assert analyze(snapshot_store, parse_executor) == expected_totals([repo])
+
+    rng = random.Random(1)
+    modified, removed, renamed, *kept = [corpus_file for corpus_file in repo.files if corpus_file.language]
+    content = source_file(rng, modified.language, 800, 0.2)
+    modified = modified._replace(content=content, sha=blob_sha(content))
+    renamed = renamed._replace(path=f"moved/{renamed.path}")
+    content = source_file(rng, "Python", 500, 0.2)
+    added = CorpusFile("added.py", "Python", content, blob_sha(content))
+    content = b"x = 1\n" * (MAX_FILE_SIZE // 6 + 1)
+    large = CorpusFile("large.py", "Python", content, blob_sha(content))
+    files = [modified, renamed, added, large, *kept]
+    server.push(repo._replace(head_sha=repo_head(files), files=files))
+    fetched = []
+    fetch_blob = AsyncCodeGrimoire.fetch_blob
+
+    async def spy_fetch_blob(self, repo, sha):
+        fetched.append(sha)
+        return await fetch_blob(self, repo, sha)
+
+    monkeypatch.setattr(AsyncCodeGrimoire, "fetch_blob", spy_fetch_blob)
+    counted = [modified, renamed, added, *kept]
+    assert analyze(snapshot_store, parse_executor) == expected_totals([repo._replace(files=counted)])
+    assert sorted(fetched) == sorted(corpus_file.sha for corpus_file in (modified, renamed, added))
+    assert {path for path, *_ in snapshot_store.files(repo.full_name)} == {corpus_file.path for corpus_file in counted}
+    assert removed.path not in {path for path, *_ in snapshot_store.files(repo.full_name)}
@@ -0,0 +1,53 @@
+import asyncio
+import random
+
+import pytest
+
+from benchmarks.corpus import CorpusFile, SyntheticRepo, blob_sha, repo_head, source_file
+from benchmarks.parsers import expected_totals
+from src.async_grimoire import AsyncCodeGrimoire
+from src.code_grimoire import CodeGrimoire
+from src.constants import MAX_FILE_SIZE, STREAM_FILE_SIZE
+from src.prefilter import FilePrefilter
+
+
+def large_file_corpus():
+    # A repository with a file past STREAM_FILE_SIZE, and a fork sharing it
+    rng = random.Random(7)
+    large = source_file(rng, "SQL", STREAM_FILE_SIZE + 100_000, 0.2)
+    small = source_file(rng, "Python", 2000, 0.2)
+    files = [CorpusFile("dump.sql", "SQL", large, blob_sha(large)), CorpusFile("app.py", "Python", small, blob_sha(small))]
+    return [SyntheticRepo("data", "alice/data", repo_head(files), files),
+            SyntheticRepo("data", "bob/data", repo_head(files), files, "alice/data")]
+
+
+def test_files_past_the_stream_threshold_are_not_prefiltered():
+    assert STREAM_FILE_SIZE < MAX_FILE_SIZE
+    assert FilePrefilter().wanted("dump.sql", STREAM_FILE_SIZE + 1)
+    assert FilePrefilter(max_size=None).wanted("dump.sql", 500 * 1024 * 1024)
+
+
+@pytest.mark.parametrize("fetch_mode", ["trees", "contents", "archive", "graphql"])
+def test_large_files_are_counted_as_a_stream(serve_github, parse_executor, monkeypatch, fetch_mode):
+    corpus = large_file_corpus()
+    serve_github(corpus)
+    streamed = []
+    stream_blob, parse_stream = AsyncCodeGrimoire.stream_blob, CodeGrimoire.parse_stream
+
+    async def spy_stream_blob(self, repo, sha, language):
+        streamed.append(sha)
+        return await stream_blob(self, repo, sha, language)
+
+    def spy_parse_stream(self, fileobj, language, size):
+        streamed.append(size)
+        return parse_stream(self, fileobj, language, size)
+
+    monkeypatch.setattr(AsyncCodeGrimoire, "stream_blob", spy_stream_blob)
+    monkeypatch.setattr(CodeGrimoire, "parse_stream", spy_parse_stream)
+    grimoire = AsyncCodeGrimoire("token", parse_executor=parse_executor, parse_workers=2, time_budget=None)
+    result = asyncio.run(grimoire.analyze_repos(fetch_mode))
+
+    assert streamed
+    assert {language: counts for language, counts in result["total_lines"].items() if any(counts.values())} \
+        == expected_totals(corpus, "once")
+    assert grimoire.repo_counts["bob/data"] == grimoire.repo_counts["alice/data"]